@@ -1,10 +1,11 @@
 import json
 import os
 import sys
+from deckstore import DECK_EXTENSIONS, append_cards, is_state_file, list_deck_files, load_deck
 
 def get_target_file():
     """Allows user to specify which JSON file to target."""
-    files = [f for f in os.listdir('.') if f.endswith('.json')]
+    files = list_deck_files()
     default = 'data.json'
     
     print("Available files:", ", ".join(files) if files else "None")
@@ -13,33 +14,35 @@ def get_target_file():
     if not filename:
         return default
     
-    if not filename.endswith('.json'):
+    if not filename.endswith(DECK_EXTENSIONS):
         filename += '.json'
+    if is_state_file(filename):
+        print(f"Error: {filename} holds app state, not flashcards.")
+        sys.exit(1)
     return filename
 
-def load_existing_data(file_path):
+def check_existing_data(file_path):
+    """Exits if the deck can't be read, before any input is asked for."""
     if not os.path.exists(file_path):
         print(f"'{file_path}' not found. A new file will be created.")
-        return {"flashcards": []}
+        return
     
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            if "flashcards" not in data:
-                data["flashcards"] = []
-            return data
-    except json.JSONDecodeError:
+        # Lazy: scans the file without building its cards
+        cards = load_deck(file_path, lazy=True)["flashcards"]
+        cards.close()
+    except ValueError:  # JSONDecodeError or a malformed binary deck
         print(f"Error: {file_path} is corrupted. Aborting to prevent data loss.")
         sys.exit(1)
 
-def save_data(file_path, data):
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4)
+def save_cards(file_path, cards):
+    # Appends under the deck lock, so cards another process added meanwhile survive
+    append_cards(file_path, cards)
     print(f"Successfully saved to {file_path}")
 
 def main():
     target_file = get_target_file()
-    existing_data = load_existing_data(target_file)
+    check_existing_data(target_file)
     
     print("==========================================")
     print(f"PASTE YOUR JSON BELOW TO APPEND TO: {target_file}")
@@ -90,21 +93,20 @@ def main():
         return
 
     # Append valid cards
-    count = 0
+    valid_cards = []
     for card in cards_to_add:
         if isinstance(card, dict) and "question" in card and "textbook_answer" in card:
             # We don't strictly require textbook_location here to allow legacy cards,
             # but the new system prompt generates it.
-            existing_data["flashcards"].append(card)
-            count += 1
+            valid_cards.append(card)
         else:
             print(f"Skipping invalid item: {card}")
 
-    if count > 0:
-        save_data(target_file, existing_data)
-        print(f"\nSuccess! Added {count} new flashcards to {target_file}.")
+    if valid_cards:
+        save_cards(target_file, valid_cards)
+        print(f"\nSuccess! Added {len(valid_cards)} new flashcards to {target_file}.")
     else:
         print("\nNo valid cards were added.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -4,10 +4,20 @@ import random
 import re
 import threading
 import time
+import hmac
 import html  # [SECURITY] Import html for escaping
-from flask import Flask, render_template, jsonify, request, session
+from flask import Flask, Response, g, jsonify, request, session
 from dotenv import load_dotenv
-import google.generativeai as genai
+import llm_transport
+from reviews import clean_event
+from search import get_index
+from deckstore import DeckConflictError, deck_stamp
+from sync import SYNC_BATCH, SYNC_HEADER, SYNC_TOKEN, apply_changes, deck_manifest, valid_card
+from sync import card_id as stable_card_id
+from prompts import build_prompt, gemini_model
+import http_cache
+import profiler
+from tenants import TENANT_HEADER, TenantPrefixMiddleware, get_tenant, leaderboard_top
 
 # ================= CONFIGURATION =================
 
@@ -16,11 +26,27 @@ load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "super_secret_dev_key_change_me")
 
-# Thread locks
+# Opt-in (PROFILE=1) stack sampling and slow-request capture; before the
+# other hooks so it times them too
+profiler.init_app(app)
+
+# Hashed static assets, a pre-rendered index page, ETags and gzip/brotli
+http_cache.init_app(app)
+
+# /t/<tenant>/... serves the same routes for one tenant (see tenants.py)
+app.wsgi_app = TenantPrefixMiddleware(app.wsgi_app)
+
+# Thread locks (leaderboard and deck files use deckstore.file_lock, which also covers other processes)
 genai_lock = threading.Lock() 
-leaderboard_lock = threading.Lock() 
 
-LEADERBOARD_FILE = "leaderboard.json"
+GEMINI_MODEL = "gemini-2.5-flash" # or gemini-2.0-flash
+
+# Largest number of answer events accepted in one /api/events call
+MAX_EVENT_BATCH = 500
+
+# Cap on cards a search-restricted session draws from (kept in the cookie)
+MAX_SESSION_POOL = 300
+MAX_SEARCH_RESULTS = 100
 
 # ================= HELPER FUNCTIONS =================
 
@@ -31,120 +57,164 @@ def clean_json_string(text):
         return match.group(1)
     return text
 
-def get_leaderboard_data():
-    """Reads leaderboard safely."""
-    if not os.path.exists(LEADERBOARD_FILE):
-        return []
-    try:
-        with open(LEADERBOARD_FILE, 'r') as f:
-            return json.load(f)
-    except:
-        return []
-
-def update_leaderboard_file(user_name, score):
-    """Updates leaderboard safely using a lock."""
-    with leaderboard_lock:
-        data = get_leaderboard_data()
-        
-        # [SECURITY] Logic moved to route handler, but we process data here
-        # Add new entry
-        data.append({"name": user_name, "score": score, "date": time.strftime("%Y-%m-%d")})
-        
-        # Sort by score descending and keep top 10
-        data = sorted(data, key=lambda x: x['score'], reverse=True)[:10]
-        
-        with open(LEADERBOARD_FILE, 'w') as f:
-            json.dump(data, f)
-        return data
+def clean_user_name(raw_name):
+    """Escapes and truncates a user-supplied display name."""
+    # [SECURITY] Block XSS: Sanitize the name input
+    safe_name = html.escape(str(raw_name))
+
+    # [SECURITY] Enforce length limit
+    if len(safe_name) > 20:
+        safe_name = safe_name[:20]
+    return safe_name
+
+def is_valid_deck_name(filename):
+    """Basic path traversal check for deck names sent by the client."""
+    return g.tenant.has_deck(filename)
+
+def get_shared_deck(filename):
+    """The current tenant's in-memory deck for filename."""
+    return g.tenant.deck(filename)
 
 def generate_quiz_content(api_key, mode, question, answer):
-    with genai_lock:
-        try:
+    if mode not in ("MC", "FITB"):
+        return None
+
+    # Timed apart from the call itself: waiting here means other requests hold the SDK
+    with profiler.stage("llm_lock"):
+        genai_lock.acquire()
+    try:
+        # Long answers are summarized to the mode's token budget (see prompts.py)
+        system_prompt, user_prompt = build_prompt(mode, question=question, answer=answer)
+
+        def make_model():
+            # Imported here so the server starts without paying for the SDK
+            import google.generativeai as genai
             genai.configure(api_key=api_key)
-            model = genai.GenerativeModel("gemini-2.5-flash") # or gemini-2.0-flash
-            
-            system_prompt = "You are a quiz generator. Output only valid JSON."
-            
-            if mode == "MC":
-                user_prompt = (
-                    f"Question: {question}\nCorrect Answer: {answer}\n\n"
-                    "Task: Generate 3 plausible but incorrect answers (distractors).\n"
-                    "Constraints: Matches format/length of correct answer.\n"
-                    "Output JSON format: {\"distractors\": [\"wrong1\", \"wrong2\", \"wrong3\"]}"
-                )
-            elif mode == "FITB":
-                user_prompt = (
-                    f"Question: {question}\nFull Answer: {answer}\n\n"
-                    "Task: Rewrite 'Full Answer' replacing ONE key concept with '______'.\n"
-                    "Output JSON format: {\"masked_text\": \"The capital is ______.\", \"missing_word\": \"Paris\"}"
-                )
-            else:
-                return None
-
-            response = model.generate_content(f"{system_prompt}\n\n{user_prompt}")
-            cleaned_text = clean_json_string(response.text)
-            return json.loads(cleaned_text)
-
-        except Exception as e:
-            print(f"GenAI Error: {e}")
-            return None
+            return gemini_model(genai, GEMINI_MODEL, system_prompt, cache_key=api_key)
+
+        with profiler.stage("llm"):
+            response = llm_transport.gemini_generate(make_model, GEMINI_MODEL, user_prompt,
+                                                     system_instruction=system_prompt)
+            response_text = response.text
+        profiler.note(prompt_chars=len(system_prompt) + len(user_prompt), reply_chars=len(response_text))
+        cleaned_text = clean_json_string(response_text)
+        return json.loads(cleaned_text)
+
+    except Exception as e:
+        print(f"GenAI Error: {e}")
+        return None
+    finally:
+        genai_lock.release()
 
 # ================= API ROUTES =================
 
+@app.before_request
+def resolve_tenant():
+    """Picks the tenant from the URL prefix or header; unknown tenants get a 404."""
+    name = request.environ.get(TenantPrefixMiddleware.ENVIRON_KEY) or request.headers.get(TENANT_HEADER, '')
+    g.tenant = get_tenant(name)
+    if g.tenant is None:
+        return jsonify({"error": "Unknown tenant"}), 404
+
+    # The cookie is shared across tenants; a session started in another one doesn't carry over
+    if 'filename' in session and session.get('tenant', '') != g.tenant.name:
+        session.clear()
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return http_cache.cached_page(app, 'index.html')
 
 @app.route('/api/files', methods=['GET'])
 def list_files():
-    files = [f for f in os.listdir('.') if f.endswith('.json') and f != LEADERBOARD_FILE]
+    files = g.tenant.deck_files()
     return jsonify({"files": files})
 
 @app.route('/api/leaderboard', methods=['GET', 'POST'])
 def handle_leaderboard():
     if request.method == 'GET':
-        return jsonify(get_leaderboard_data())
+        deck = request.args.get('file', '')
+        return jsonify(leaderboard_top(g.tenant.leaderboard_entries(), deck))
     
     if request.method == 'POST':
         data = request.json
-        
-        # [SECURITY] Block XSS: Sanitize the name input
-        raw_name = data.get('name', 'Anonymous')
-        safe_name = html.escape(str(raw_name))
-        
-        # [SECURITY] Enforce length limit
-        if len(safe_name) > 20:
-            safe_name = safe_name[:20]
+        safe_name = clean_user_name(data.get('name', 'Anonymous'))
 
         # [SECURITY] Validate score is a number
         score = data.get('score', 0)
         if not isinstance(score, (int, float)):
             score = 0
             
-        new_data = update_leaderboard_file(safe_name, score)
+        new_data = g.tenant.record_score(safe_name, score, session.get('filename'))
         return jsonify(new_data)
 
+@app.route('/api/leaderboard/stream', methods=['GET'])
+def stream_leaderboard():
+    """Server-sent events: the board for ?file= (or overall), then diffs as it changes."""
+    deck = request.args.get('file', '')
+    if deck and not is_valid_deck_name(deck):
+        return jsonify({"error": "File not found"}), 404
+
+    board = g.tenant.live_board
+    subscriber = board.subscribe(deck)
+    if subscriber is None:
+        return jsonify({"error": "Too many live clients, poll /api/leaderboard instead"}), 503
+    return Response(board.stream(subscriber), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.route('/api/start', methods=['POST'])
 def start_session():
     data = request.json
     filename = data.get('filename')
     
     # Basic Path Traversal Check
-    if not filename or not os.path.exists(filename) or os.sep in filename:
+    if not is_valid_deck_name(filename):
         return jsonify({"error": "File not found"}), 404
 
     session['filename'] = filename
+    session['tenant'] = g.tenant.name
     session['used_indices'] = []
     session['score'] = 0
+    session['card_pool'] = None
     
     try:
-        with open(filename, 'r') as f:
-            file_data = json.load(f)
-            count = len(file_data.get("flashcards", []))
+        # Optional search restricts the session to the best matching cards
+        query = str(data.get('query') or '')
+        location = str(data.get('location') or '')
+        if query or location:
+            results = get_index(g.tenant.path(filename)).search(query, limit=MAX_SESSION_POOL, location=location)
+            if not results:
+                return jsonify({"error": "No cards match the search"}), 404
+            session['card_pool'] = [card_id for card_id, _ in results]
+            return jsonify({"status": "success", "count": len(results)})
+
+        count = len(get_shared_deck(filename).cards)
         return jsonify({"status": "success", "count": count})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/search', methods=['GET'])
+def search_cards():
+    filename = request.args.get('file') or session.get('filename')
+    if not is_valid_deck_name(filename):
+        return jsonify({"error": "File not found"}), 404
+
+    query = request.args.get('q', '')
+    location = request.args.get('location', '')
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), MAX_SEARCH_RESULTS)
+    except ValueError:
+        limit = 20
+
+    start = time.perf_counter()
+    index = get_index(g.tenant.path(filename))
+    results = index.search(query, limit=limit, location=location)
+    took_ms = (time.perf_counter() - start) * 1000
+
+    matches = [{"card_id": card_id, "score": round(score, 3),
+                "question": index.questions[card_id], "textbook_location": index.locations[card_id]}
+               for card_id, score in results]
+    return jsonify({"results": matches, "took_ms": round(took_ms, 2)})
+
 @app.route('/api/generate', methods=['POST'])
 def generate_card():
     api_key = request.headers.get('X-Gemini-API-Key')
@@ -156,21 +226,23 @@ def generate_card():
         return jsonify({"error": "Session not started."}), 400
 
     try:
-        with open(filename, 'r') as f:
-            file_data = json.load(f)
-            flashcards = file_data.get("flashcards", [])
+        # Binary decks are memory-mapped, so only the chosen card is decoded
+        with profiler.stage("deck"):
+            flashcards = get_shared_deck(filename).cards
     except Exception:
         return jsonify({"error": "File read error"}), 500
 
     if not flashcards:
         return jsonify({"error": "No cards in file"}), 400
 
+    pool = session.get('card_pool') or range(len(flashcards))
+    pool = [i for i in pool if i < len(flashcards)] or list(range(len(flashcards)))
     used = session.get('used_indices', [])
-    available_indices = [i for i in range(len(flashcards)) if i not in used]
+    available_indices = [i for i in pool if i not in used]
 
     if not available_indices:
         used = []
-        available_indices = list(range(len(flashcards)))
+        available_indices = pool
         session['used_indices'] = []
     
     chosen_index = random.choice(available_indices)
@@ -187,40 +259,49 @@ def generate_card():
     a_text = card.get("textbook_answer", "Unknown")
     loc_text = card.get("textbook_location", "Unknown")
 
-    mode = request.json.get('mode', 'MC')
-    llm_data = generate_quiz_content(api_key, mode, q_text, a_text)
-    
-    if not llm_data:
-        return jsonify({"error": "Failed to generate quiz data."}), 500
+    # The policy picks the mode and whether the item comes from the cache,
+    # is built locally or needs the LLM; a client may still force a mode
+    mode = request.json.get('mode')
+    if mode not in ("MC", "FITB"):
+        mode = None
+    safe_name = clean_user_name(request.json.get('name', 'Anonymous'))
+    tenant = g.tenant
+    card_key = stable_card_id(card)
+    history = tenant.review_store.card_counter(safe_name, filename, card_key)
 
-    quiz_data = {}
-    if mode == "MC" and "distractors" in llm_data:
-        options = llm_data["distractors"]
-        options.append(a_text)
-        random.shuffle(options)
-        quiz_data = {
-            "type": "MC",
-            "question": q_text,
-            "options": options,
-            "correct_answer": a_text,
-            "source": loc_text,
-            "current_score": session.get('score', 0)
-        }
-    elif mode == "FITB" and "masked_text" in llm_data:
-        quiz_data = {
-            "type": "FITB",
-            "question": q_text,
-            "masked_text": llm_data["masked_text"],
-            "missing_word": llm_data["missing_word"],
-            "full_answer": a_text,
-            "source": loc_text,
-            "current_score": session.get('score', 0)
-        }
-    else:
-        return jsonify({"error": "Invalid LLM response format"}), 500
+    def generate(m, q, a):
+        return generate_quiz_content(api_key, m, q, a)
+
+    # Each LLM call first waits for one of the tenant's slots; without one the policy falls back
+    with profiler.stage("policy"):
+        quiz_data, path = tenant.quiz_policy.build(
+            q_text, a_text, generate if tenant.llm_available() else None,
+            cards=flashcards, history=history, mode=mode, llm_slot=tenant.llm_call)
+    with profiler.stage("policy_save"):
+        tenant.quiz_policy.save()
+    profiler.note(path=path, card_id=chosen_index, deck_cards=len(flashcards))
+
+    if not quiz_data:
+        return jsonify({"error": "Failed to generate quiz data."}), 500
 
+    if quiz_data["type"] == "FITB":
+        quiz_data["full_answer"] = a_text
+    quiz_data.update({
+        "source": loc_text,
+        "card_id": chosen_index,
+        "card_key": card_key,
+        "path": path,
+        "current_score": session.get('score', 0)
+    })
     return jsonify(quiz_data)
 
+@app.route('/api/policy', methods=['GET'])
+def policy_report():
+    """LLM calls made and saved by the quiz policy, and the tenant's LLM quota."""
+    report = g.tenant.quiz_policy.report()
+    report["quota"] = g.tenant.quota_report()
+    return jsonify(report)
+
 @app.route('/api/score', methods=['POST'])
 def update_score():
     points = request.json.get('points', 0)
@@ -229,5 +310,130 @@ def update_score():
         session['score'] = session.get('score', 0) + int(points)
     return jsonify({"score": session['score']})
 
+@app.route('/api/events', methods=['POST'])
+def ingest_events():
+    """Applies a batch of answer events. Replayed event IDs are ignored."""
+    data = request.json or {}
+    raw_events = data.get('events')
+    if not isinstance(raw_events, list):
+        return jsonify({"error": "Expected an 'events' list"}), 400
+    if len(raw_events) > MAX_EVENT_BATCH:
+        return jsonify({"error": f"At most {MAX_EVENT_BATCH} events per batch"}), 413
+
+    safe_name = clean_user_name(data.get('name', 'Anonymous'))
+    deck = session.get('filename')
+
+    events = [clean_event(raw, safe_name, deck) for raw in raw_events]
+    rejected = sum(1 for e in events if e is None)
+    if deck and is_valid_deck_name(deck):
+        cards = get_shared_deck(deck).cards
+        for event in events:
+            if event is None or event["card_id"] is None or not 0 <= event["card_id"] < len(cards):
+                continue
+            card = cards[event["card_id"]]
+            # The client's key wins: the deck may have shifted since the card was shown
+            if event["card_key"] is None:
+                event["card_key"] = stable_card_id(card)
+            if event["card_key"] == stable_card_id(card) and isinstance(card, dict):
+                event["location"] = card.get("textbook_location")
+    accepted = g.tenant.review_store.add_events([e for e in events if e is not None])
+
+    points = sum(e["points"] for e in accepted)
+    score = session.get('score', 0) + points
+    if accepted:
+        session['score'] = score
+        if points:
+            g.tenant.record_score(safe_name, score, deck)
+
+    return jsonify({
+        "accepted": len(accepted),
+        "duplicates": len(raw_events) - rejected - len(accepted),
+        "rejected": rejected,
+        "score": score
+    })
+
+@app.route('/api/stats', methods=['GET'])
+def user_stats():
+    """A user's accuracy and latency, read from counters kept up to date on ingest."""
+    safe_name = clean_user_name(request.args.get('name', 'Anonymous'))
+    deck = request.args.get('file') or session.get('filename')
+    if deck and not is_valid_deck_name(deck):
+        deck = None
+
+    stats = g.tenant.review_store.user_stats(safe_name, deck)
+    if stats is None:
+        return jsonify({"name": safe_name, "deck": deck, "total": None})
+
+    if stats.get("weak_cards"):
+        manifest = deck_manifest(get_shared_deck(deck).path)
+        weak = []
+        for entry in stats["weak_cards"]:
+            # Cards since removed from the deck are left out
+            position = manifest.index.get(entry["card_key"])
+            if position is not None:
+                card = manifest.cards[position]
+                entry["question"] = card if isinstance(card, str) else card.get("question", "")
+                weak.append(entry)
+        stats["weak_cards"] = weak
+
+    stats.update({"name": safe_name, "deck": deck})
+    return jsonify(stats)
+
+@app.route('/api/sync/manifest', methods=['GET'])
+def sync_manifest():
+    """A deck's version and card IDs with their revisions, so sync.py can tell what changed.
+
+    With ?since=<stamp> from the last sync, an unchanged deck sends no cards.
+    """
+    filename = request.args.get('file', '')
+    if not is_valid_deck_name(filename):
+        return jsonify({"error": "File not found"}), 404
+    version, stamp = deck_stamp(g.tenant.path(filename))
+    if request.args.get('since') == stamp:
+        return jsonify({"file": filename, "version": version, "stamp": stamp, "unchanged": True})
+    manifest = deck_manifest(g.tenant.path(filename))
+    return jsonify({"file": filename, "version": manifest.version, "stamp": manifest.stamp,
+                    "cards": list(manifest.revs.items())})
+
+@app.route('/api/sync/cards', methods=['POST'])
+def sync_cards():
+    """Bodies of the cards with the given IDs."""
+    data = request.json or {}
+    filename = data.get('file', '')
+    ids = data.get('ids')
+    if not is_valid_deck_name(filename):
+        return jsonify({"error": "File not found"}), 404
+    if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+        return jsonify({"error": "Expected an 'ids' list"}), 400
+    if len(ids) > SYNC_BATCH:
+        return jsonify({"error": f"At most {SYNC_BATCH} cards per request"}), 413
+    return jsonify({"cards": deck_manifest(g.tenant.path(filename)).bodies(ids)})
+
+@app.route('/api/sync/apply', methods=['POST'])
+def sync_apply():
+    """Removes and writes cards sent by sync.py, if the deck is still at the version it merged against."""
+    # [SECURITY] Writing decks needs the shared sync token; no token configured means read-only
+    if not SYNC_TOKEN or not hmac.compare_digest(request.headers.get(SYNC_HEADER, ''), SYNC_TOKEN):
+        return jsonify({"error": "Sync token required"}), 403
+
+    data = request.json or {}
+    filename = data.get('file', '')
+    version = data.get('version')
+    remove = data.get('remove', [])
+    cards = data.get('cards', [])
+    if not is_valid_deck_name(filename):
+        return jsonify({"error": "File not found"}), 404
+    if (not isinstance(version, int) or not isinstance(remove, list) or not isinstance(cards, list)
+            or not all(isinstance(i, str) for i in remove) or not all(valid_card(c) for c in cards)):
+        return jsonify({"error": "Expected a version, a 'remove' list of IDs and a 'cards' list"}), 400
+    if len(cards) > SYNC_BATCH:
+        return jsonify({"error": f"At most {SYNC_BATCH} cards per request"}), 413
+
+    try:
+        version, stamp = apply_changes(g.tenant.path(filename), version, remove, cards)
+    except DeckConflictError as e:
+        return jsonify({"error": "Deck changed since its manifest", "expected": e.expected, "version": e.actual}), 409
+    return jsonify({"version": version, "stamp": stamp})
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -1,12 +1,20 @@
 import os
 import json
-import requests
 import time
-import random
 import sys
 import re
-import curses # Standard on Linux/Mac. Run 'pip install windows-curses' on Windows.
+import queue
+import threading
+import argparse
+import importlib.util
 from dotenv import load_dotenv
+import llm_transport
+from deckstore import SharedDeck, list_deck_files, save_deck
+from card_pool import CardPool
+from search import search_deck
+from quiz_policy import QuizPolicy
+from prompts import build_prompt, gemini_model
+import profiler
 
 # ================= CONFIGURATION =================
 
@@ -27,37 +35,55 @@ GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 # Global variable for the selected file
 json_file_path = 'data.json' # Default fallback
 
+# How many quiz items are generated ahead of the one being answered
+QUIZ_LOOKAHEAD = int(os.getenv("QUIZ_LOOKAHEAD", "2"))
+
+# Best matches kept when a session is restricted with --search
+SEARCH_POOL_SIZE = 200
+
 # ================= SETUP =================
 
 data = []
+deck = None  # SharedDeck behind data once a deck file exists
 
-if API_PROVIDER == "GEMINI":
-    if not GEMINI_API_KEY or "Placeholder" in GEMINI_API_KEY:
-        print("Error: GEMINI_API_KEY not set in .env file.")
-        sys.exit(1)
-    try:
+# Provider SDKs are imported on first use; importing google.generativeai
+# alone costs more than the rest of startup combined.
+_genai = None
+
+def validate_config():
+    """Checks provider settings without importing any SDK. Exits on error."""
+    if API_PROVIDER == "GEMINI":
+        if not GEMINI_API_KEY or "Placeholder" in GEMINI_API_KEY:
+            print("Error: GEMINI_API_KEY not set in .env file.")
+            sys.exit(1)
+        if importlib.util.find_spec("google") is None or importlib.util.find_spec("google.generativeai") is None:
+            print("Error: 'google-generativeai' not installed. Run: pip install google-generativeai")
+            sys.exit(1)
+
+    elif API_PROVIDER == "OPENAI":
+        if not OPENAI_API_KEY:
+            print("Error: OPENAI_API_KEY not set in .env file.")
+            sys.exit(1)
+
+def get_genai():
+    """Imports and configures the Gemini SDK the first time it is needed."""
+    global _genai
+    if _genai is None:
         import google.generativeai as genai
         genai.configure(api_key=GEMINI_API_KEY)
-    except ImportError:
-        print("Error: 'google-generativeai' not installed. Run: pip install google-generativeai")
-        sys.exit(1)
-    except Exception as e:
-        print(f"Error configuring Gemini: {e}")
-        sys.exit(1)
-
-elif API_PROVIDER == "OPENAI":
-    if not OPENAI_API_KEY:
-        print("Error: OPENAI_API_KEY not set in .env file.")
-        sys.exit(1)
+        _genai = genai
+    return _genai
 
 # ================= FILE SELECTION (CURSES) =================
 
 def pick_json_file(stdscr):
+    import curses # Standard on Linux/Mac. Run 'pip install windows-curses' on Windows.
+
     # Turn off cursor blinking
     curses.curs_set(0)
     
-    # Get all json files in current directory
-    files = [f for f in os.listdir('.') if f.endswith('.json')]
+    # Get all deck files (JSON or binary) in current directory
+    files = list_deck_files()
     
     if not files:
         return None
@@ -97,6 +123,8 @@ def pick_json_file(stdscr):
 def init_file_selection():
     global json_file_path
     try:
+        import curses
+
         # Initialize color pairs inside wrapper
         selected_file = curses.wrapper(lambda stdscr: setup_curses_colors(stdscr))
         
@@ -104,26 +132,28 @@ def init_file_selection():
             json_file_path = selected_file
             print(f"Selected file: {json_file_path}")
         else:
-            print("No .json files found. Creating data.json...")
+            print("No deck files found. Creating data.json...")
             json_file_path = "data.json"
     except Exception as e:
         print(f"Curses error (if on Windows, run 'pip install windows-curses'): {e}")
         print("Defaulting to data.json")
 
 def setup_curses_colors(stdscr):
+    import curses
+
     # Check if we can use colors
     if curses.has_colors():
         curses.start_color()
         curses.init_pair(1, curses.COLOR_BLACK, curses.COLOR_WHITE) # Highlight style
     return pick_json_file(stdscr)
 
-def load_data():
-    global data
+def load_data(lazy=None):
+    global data, deck
     if os.path.exists(json_file_path):
         try:
-            with open(json_file_path, 'r') as file:
-                data = json.load(file)
-        except json.JSONDecodeError:
+            deck = SharedDeck(json_file_path, lazy)
+            data = deck.data
+        except ValueError:  # JSONDecodeError or a malformed binary deck
             print(f'Error reading JSON data from {json_file_path}.')
             data = {"flashcards": []}
     else:
@@ -141,9 +171,9 @@ def get_llm_json_response(system_instruction, user_content):
     response_text = ""
     if API_PROVIDER == "GEMINI":
         try:
-            model = genai.GenerativeModel(GEMINI_MODEL)
-            full_prompt = f"{system_instruction}\n\n{user_content}"
-            response = model.generate_content(full_prompt)
+            response = llm_transport.gemini_generate(
+                lambda: gemini_model(get_genai(), GEMINI_MODEL, system_instruction), GEMINI_MODEL,
+                user_content, system_instruction=system_instruction)
             response_text = response.text
         except Exception as e:
             print(f"Gemini Error: {e}")
@@ -162,7 +192,7 @@ def get_llm_json_response(system_instruction, user_content):
             "temperature": 0.7
         }
         try:
-            response = requests.post(API_ENDPOINT, headers=headers, json=payload)
+            response = llm_transport.post(API_ENDPOINT, headers=headers, json=payload)
             if response.status_code == 200:
                 response_text = response.json()['choices'][0]['message']['content']
             else:
@@ -181,81 +211,129 @@ def get_llm_json_response(system_instruction, user_content):
 
 # ================= QUIZ MODES =================
 
-def prepare_multiple_choice(question, correct_answer):
-    print("Generating Multiple Choice Options...", end="", flush=True)
-    system_prompt = "You are a quiz generator. Output only valid JSON."
-    user_prompt = (
-        f"Question: {question}\nCorrect Answer: {correct_answer}\n\n"
-        "Task: Generate 3 plausible but incorrect answers (distractors).\n"
-        "Constraints: 1. FORMATTING: Match Correct Answer format exactly. 2. SIMILARITY: Strictly related context.\n"
-        "Output JSON format: {\"distractors\": [\"wrong1\", \"wrong2\", \"wrong3\"]}"
-    )
-    data = get_llm_json_response(system_prompt, user_prompt)
-    print(" Done.")
-    
-    if not data or "distractors" not in data: return None
-
-    options = data["distractors"]
-    options.append(correct_answer)
-    random.shuffle(options)
-    
-    return {
-        "type": "MC",
-        "question": question,
-        "options": options,
-        "correct_answer": correct_answer
-    }
-
-def prepare_fill_in_blank(question, correct_answer):
-    print("Generating Fill-in-the-Blank...", end="", flush=True)
-    system_prompt = "You are a quiz generator. Output only valid JSON."
-    user_prompt = (
-        f"Question: {question}\nFull Answer: {correct_answer}\n\n"
-        "Task: Rewrite 'Full Answer' replacing ONE key piece of info with '______'.\n"
-        "Output JSON format: {\"masked_text\": \"The capital of France is ______.\", \"missing_word\": \"Paris\"}"
-    )
-    data = get_llm_json_response(system_prompt, user_prompt)
-    print(" Done.")
-
-    if not data or "masked_text" not in data or "missing_word" not in data: return None
+# Chooses MC vs FITB and cache/local/LLM per card; see quiz_policy.py
+policy = QuizPolicy()
 
-    return {
-        "type": "FITB",
-        "question": question,
-        "masked_text": data["masked_text"],
-        "missing_word": data["missing_word"]
-    }
+def generate_quiz_content(mode, question, correct_answer):
+    """Raw LLM output for one mode: distractors for MC, masked text for FITB."""
+    system_prompt, user_prompt = build_prompt(mode, question=question, answer=correct_answer)
+    with profiler.stage("llm"):
+        return get_llm_json_response(system_prompt, user_prompt)
 
 # ================= MAIN APP LOGIC =================
 
-left_flashcards = -1
-used_flashcards = []
+pool = None  # CardPool of positions in data["flashcards"] this session draws from
 
 def select_random_flashcard():
-    global data, left_flashcards, used_flashcards
-    if left_flashcards > 0:
-        flashcard = random.choice(used_flashcards)
-        used_flashcards.remove(flashcard)
-        left_flashcards -= 1
-        return flashcard
+    position = pool.draw()
+    return None if position is None else data["flashcards"][position]
+
+def pick_up_new_cards():
+    """Adds cards other processes appended to the deck since the last draw."""
+    global data
+    if deck is None:
+        return
+    new_cards, reloaded = deck.refresh()
+    if reloaded:
+        data = deck.data
+        pool.reset(len(data["flashcards"]), data["flashcards"])
+    elif new_cards:
+        pool.grow(len(data["flashcards"]))
+
+def build_quiz_item(card_obj, quiet=False):
+    """Normalizes a card and gets its quiz content in the mode the policy picks."""
+    if isinstance(card_obj, str):
+        q_text = card_obj
+        a_text = "No textbook answer provided."
+        loc_text = "Unknown"
     else:
-        if not used_flashcards:
-            used_flashcards = data.get("flashcards", []).copy()
-            left_flashcards = len(used_flashcards) - 1
-            if left_flashcards < 0: return None
-        
-        flashcard = random.choice(used_flashcards)
-        used_flashcards.remove(flashcard)
-        return flashcard
+        q_text = card_obj.get("question", "Unknown Question")
+        a_text = card_obj.get("textbook_answer", "No textbook answer provided.")
+        loc_text = card_obj.get("textbook_location", "Unknown Location")
+
+    if not quiet: print("Generating quiz...", end="", flush=True)
+    with profiler.traced("aiMult quiz item"):
+        quiz_data, path = policy.build(q_text, a_text, generate_quiz_content, cards=data.get("flashcards", []))
+        profiler.note(path=path, answer_chars=len(a_text))
+    if not quiet: print(" Done.")
+
+    return {
+        "answer": a_text,
+        "location": loc_text,
+        "quiz": quiz_data,
+        "cards_left": pool.left
+    }
+
+# ================= LOOKAHEAD GENERATION =================
+
+class QuizPrefetcher:
+    """Draws cards and generates their quiz items on a background thread.
+
+    Items wait in a bounded queue, so the LLM works on the next card while
+    the user is still reading the current one. The thread is the only
+    caller of select_random_flashcard once started. stop() abandons any
+    call in flight; the thread is a daemon so it never delays exit.
+    """
+
+    def __init__(self, lookahead=QUIZ_LOOKAHEAD):
+        self.items = queue.Queue(maxsize=max(1, lookahead))
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="quiz-prefetch", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            pick_up_new_cards()
+            card_obj = select_random_flashcard()
+            item = None if card_obj is None else build_quiz_item(card_obj, quiet=True)
+            if not self._put(item) or item is None:
+                return
+
+    def _put(self, item):
+        # Wake up now and then so a stop request isn't stuck behind a full queue
+        while not self.stop_event.is_set():
+            try:
+                self.items.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def ready(self):
+        return not self.items.empty()
+
+    def next_item(self):
+        """Blocks until the next item is ready. None means no cards are left."""
+        while True:
+            try:
+                return self.items.get(timeout=0.2)
+            except queue.Empty:
+                if not self.thread.is_alive():
+                    return None
+
+    def stop(self):
+        self.stop_event.set()
+        # Drop unanswered items and unblock a producer waiting on put()
+        while True:
+            try:
+                self.items.get_nowait()
+            except queue.Empty:
+                break
+        self.thread.join(timeout=0.5)
+
+def run_app(search=None, lazy=None):
+    global data, deck, pool
+
+    validate_config()
 
-def run_app():
-    global data, left_flashcards, used_flashcards
-    
     # 1. Select File via Curses
     init_file_selection()
     
     # 2. Load Data
-    load_data()
+    load_data(lazy)
     
     if "flashcards" not in data:
         data["flashcards"] = []
@@ -265,43 +343,52 @@ def run_app():
         q_text = input("Enter Question: ")
         a_text = input("Enter Textbook Answer: ")
         data["flashcards"] = [{"question": q_text, "textbook_answer": a_text, "textbook_location": "User Entry"}]
-        with open(json_file_path, "w") as file:
-            json.dump(data, file, indent=4)
-
-    used_flashcards = data.get("flashcards", []).copy()
-    left_flashcards = len(used_flashcards)
-
+        save_deck(json_file_path, data)
+        deck = SharedDeck(json_file_path, lazy)
+        data = deck.data
+
+    positions = None  # Whole deck
+    if search:
+        results = search_deck(json_file_path, search, limit=SEARCH_POOL_SIZE)
+        if not results:
+            print(f"No cards in {json_file_path} match '{search}'.")
+            return
+        positions = [card_id for card_id, _ in results]
+        print(f"Studying {len(positions)} cards matching '{search}'.")
+
+    pool = CardPool(len(data["flashcards"]), positions, data["flashcards"])
+
+    # 3. Generate ahead while the user answers
+    prefetcher = QuizPrefetcher().start()
+    try:
+        quiz_loop(prefetcher)
+    finally:
+        prefetcher.stop()
+        policy.save(force=True)
+        report = policy.report()
+        print(f"LLM calls: {report['llm_calls']}, saved: {report['llm_calls_saved']} "
+              f"({report['cache_hits']} cached, {report['local_items']} built locally)")
+
+def quiz_loop(prefetcher):
     while True:
         # Clear screen
         print("\033[H\033[J", end="")
-        
-        card_obj = select_random_flashcard()
-        if card_obj is None:
+
+        if not prefetcher.ready():
+            print("Generating...", end="", flush=True)
+        item = prefetcher.next_item()
+        if item is None:
             print("No flashcards available.")
             break
 
-        # Normalize data structure
-        if isinstance(card_obj, str):
-            q_text = card_obj
-            a_text = "No textbook answer provided."
-            loc_text = "Unknown"
-        else:
-            q_text = card_obj.get("question", "Unknown Question")
-            a_text = card_obj.get("textbook_answer", "No textbook answer provided.")
-            loc_text = card_obj.get("textbook_location", "Unknown Location")
+        quiz_data = item["quiz"]
+        a_text = item["answer"]
+        loc_text = item["location"]
 
-        print(f"File: {json_file_path} | Cards Left: {left_flashcards}")
+        print("\033[H\033[J", end="")
+        print(f"File: {json_file_path} | Cards Left: {item['cards_left']}")
         print("Type 'e' to exit, 'a' to add new card, 's' to skip.\n")
 
-        # --- RANDOM MODE SELECTION ---
-        mode = random.choice(["MC", "FITB"])
-        quiz_data = None
-
-        if mode == "MC":
-            quiz_data = prepare_multiple_choice(q_text, a_text)
-        elif mode == "FITB":
-            quiz_data = prepare_fill_in_blank(q_text, a_text)
-
         if not quiz_data:
             print("Error generating quiz content. Skipping card.")
             time.sleep(1)
@@ -329,7 +416,7 @@ def run_app():
 
             user_input = input("\nSelect Option (A/B/C/D): ").strip().lower()
 
-            if user_input == 'e': exit()
+            if user_input == 'e': break
             if user_input == 's': continue
 
             selected_text = option_map.get(user_input, "")
@@ -345,7 +432,7 @@ def run_app():
             
             user_input = input("Your Answer: ").strip()
 
-            if user_input.lower() == 'e': exit()
+            if user_input.lower() == 'e': break
             if user_input.lower() == 's': continue
 
             if user_input.lower() == quiz_data["missing_word"].lower():
@@ -363,8 +450,15 @@ def run_app():
             else:
                 print(f"The missing word was: {quiz_data['missing_word']}")
                 print(f"Full answer: {a_text}")
+        policy.record(quiz_data["card_key"], is_correct)
 
         input("\nPress Enter to continue...")
 
 if __name__ == '__main__':
-    run_app()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Multiple choice and fill-in-the-blank flashcard quiz.")
+    parser.add_argument("--search", help="Only study cards matching this query")
+    parser.add_argument("--low-memory", action="store_true",
+                        help="Leave cards on disk and read each one when drawn (also DECK_LOW_MEMORY=1)")
+    args = parser.parse_args()
+    profiler.start()
+    run_app(search=args.search, lazy=True if args.low_memory else None)
\ No newline at end of file
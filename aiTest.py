@@ -1,10 +1,18 @@
 import os
+import re
 import json
-import requests
 import time
-import random
 import sys
+import argparse
+import queue
+import importlib.util
 from dotenv import load_dotenv
+import llm_transport
+from deckstore import SharedDeck, append_cards, save_deck
+from card_pool import CardPool
+from search import search_deck
+from prompts import build_prompt, gemini_model
+import profiler
 
 # ================= CONFIGURATION =================
 
@@ -27,36 +35,48 @@ GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
 # Path to data file
 json_file_path = 'data.json'
 
+# Best matches kept when a session is restricted with --search
+SEARCH_POOL_SIZE = 200
+
 # =================================================
 
 data = []
+deck = None  # SharedDeck behind data once a deck file exists
 
-# Validate Configuration
-if API_PROVIDER == "GEMINI":
-    if not GEMINI_API_KEY or "Placeholder" in GEMINI_API_KEY:
-        print("Error: GEMINI_API_KEY not set in .env file.")
-        sys.exit(1)
-    try:
+# Provider SDKs are imported on first use; importing google.generativeai
+# alone costs more than the rest of startup combined.
+_genai = None
+
+def validate_config():
+    """Checks provider settings without importing any SDK. Exits on error."""
+    if API_PROVIDER == "GEMINI":
+        if not GEMINI_API_KEY or "Placeholder" in GEMINI_API_KEY:
+            print("Error: GEMINI_API_KEY not set in .env file.")
+            sys.exit(1)
+        if importlib.util.find_spec("google") is None or importlib.util.find_spec("google.generativeai") is None:
+            print("Error: 'google-generativeai' not installed. Run: pip install google-generativeai")
+            sys.exit(1)
+
+    elif API_PROVIDER == "OPENAI":
+        if not OPENAI_API_KEY:
+            print("Error: OPENAI_API_KEY not set in .env file.")
+            sys.exit(1)
+
+def get_genai():
+    """Imports and configures the Gemini SDK the first time it is needed."""
+    global _genai
+    if _genai is None:
         import google.generativeai as genai
         genai.configure(api_key=GEMINI_API_KEY)
-    except ImportError:
-        print("Error: 'google-generativeai' not installed. Run: pip install google-generativeai")
-        sys.exit(1)
-    except Exception as e:
-        print(f"Error configuring Gemini: {e}")
-        sys.exit(1)
+        _genai = genai
+    return _genai
 
-elif API_PROVIDER == "OPENAI":
-    if not OPENAI_API_KEY:
-        print("Error: OPENAI_API_KEY not set in .env file.")
-        sys.exit(1)
-
-def check_and_run():
-    global data
+def check_and_run(lazy=None):
+    global data, deck
     if os.path.exists(json_file_path):
         try:
-            with open(json_file_path, 'r') as file:
-                data = json.load(file)
+            deck = SharedDeck(json_file_path, lazy)
+            data = deck.data
             if "reset" in data and "chat" in data:
                 print(f"Reset is [{data['reset'][0]} , {data['reset'][1]}]\nChat is [{data['chat'][0]} , {data['chat'][1]}]\n")
                 user_input = input('Do you want to re-position? (yes/No): ').strip().lower()
@@ -64,25 +84,16 @@ def check_and_run():
                     print('You chose to re-position')
                 else:
                     return
-        except json.JSONDecodeError:
+        except ValueError:  # JSONDecodeError or a malformed binary deck
             print('Error reading JSON data from data.json.')
 
 def construct_prompt(question, user_answer, textbook_answer):
-    system_instruction = (
-        "You are a concise tutor. Compare the User Answer against the provided Textbook Answer. "
-        "1. State if the user is Correct or Incorrect. "
-        "2. If incorrect, briefly explain why using the Textbook Answer as the source of truth. "
-        "3. Keep your response short and to the point."
-    )
-    
-    user_content = (
-        f"Question: {question}\n"
-        f"Textbook Answer: {textbook_answer}\n"
-        f"User Answer: {user_answer}"
-    )
-    return system_instruction, user_content
+    # Long textbook answers are summarized to the GRADE token budget (see prompts.py)
+    return build_prompt("GRADE", question=question, answer=textbook_answer, user_answer=user_answer)
 
 def send_question_openai(question, user_answer, textbook_answer):
+    import requests
+
     system_msg, user_msg = construct_prompt(question, user_answer, textbook_answer)
     
     payload = {
@@ -98,7 +109,7 @@ def send_question_openai(question, user_answer, textbook_answer):
     
     print("\nAI Response: ", end="", flush=True)
     try:
-        response = requests.post(API_ENDPOINT, headers=headers, json=payload, stream=True)
+        response = llm_transport.post(API_ENDPOINT, headers=headers, json=payload, stream=True)
         
         if response.status_code == 200:
             for line in response.iter_lines():
@@ -124,13 +135,12 @@ def send_question_openai(question, user_answer, textbook_answer):
 def send_question_gemini(question, user_answer, textbook_answer):
     system_msg, user_msg = construct_prompt(question, user_answer, textbook_answer)
     
-    # Gemini usually takes system instruction in model init, but appending works for simple cases
-    full_prompt = f"{system_msg}\n\n{user_msg}"
-    
     print("\nAI Response: ", end="", flush=True)
     try:
-        model = genai.GenerativeModel(GEMINI_MODEL)
-        response = model.generate_content(full_prompt, stream=True)
+        # The model keeps the system instruction, so each call only sends the card
+        response = llm_transport.gemini_generate(
+            lambda: gemini_model(get_genai(), GEMINI_MODEL, system_msg), GEMINI_MODEL, user_msg,
+            stream=True, system_instruction=system_msg)
         
         for chunk in response:
             print(chunk.text, end='', flush=True)
@@ -139,33 +149,135 @@ def send_question_gemini(question, user_answer, textbook_answer):
         print(f"\nGemini Error: {e}")
 
 def send_question(question, user_answer, textbook_answer):
+    with profiler.traced("aiTest grade"), profiler.stage("llm"):
+        profiler.note(provider=API_PROVIDER, answer_chars=len(user_answer))
+        if API_PROVIDER == "GEMINI":
+            send_question_gemini(question, user_answer, textbook_answer)
+        else:
+            send_question_openai(question, user_answer, textbook_answer)
+
+def clean_json_string(text):
+    match = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", text, re.DOTALL)
+    if match:
+        return match.group(1)
+    return text
+
+def get_llm_json_response(system_instruction, user_content):
+    """One non-streamed call to the configured provider, parsed as JSON (None on failure). Used for exam grading."""
+    response_text = ""
     if API_PROVIDER == "GEMINI":
-        send_question_gemini(question, user_answer, textbook_answer)
+        try:
+            response = llm_transport.gemini_generate(
+                lambda: gemini_model(get_genai(), GEMINI_MODEL, system_instruction), GEMINI_MODEL,
+                user_content, system_instruction=system_instruction)
+            response_text = response.text
+        except Exception as e:
+            print(f"Gemini Error: {e}")
+            return None
     else:
-        send_question_openai(question, user_answer, textbook_answer)
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {OPENAI_API_KEY}"}
+        payload = {
+            "model": OPENAI_MODEL,
+            "messages": [
+                {"role": "system", "content": system_instruction},
+                {"role": "user", "content": user_content}
+            ]
+        }
+        try:
+            response = llm_transport.post(API_ENDPOINT, headers=headers, json=payload)
+            if response.status_code != 200:
+                print(f"OpenAI Error: {response.status_code} - {response.text}")
+                return None
+            response_text = response.json()['choices'][0]['message']['content']
+        except Exception as e:
+            print(f"Request failed: {e}")
+            return None
+
+    try:
+        return json.loads(clean_json_string(response_text))
+    except json.JSONDecodeError:
+        print("Failed to parse JSON from LLM response.")
+        return None
 
-left_flashcards = -1
-used_flashcards = []
+pool = None  # CardPool of positions in data["flashcards"] this session draws from
 
 def select_random_flashcard():
-    global data, left_flashcards, used_flashcards
-    if left_flashcards > 0:
-        flashcard = random.choice(used_flashcards)
-        used_flashcards.remove(flashcard)
-        left_flashcards -= 1
-        return flashcard
-    else:
-        if not used_flashcards:
-            used_flashcards = data.get("flashcards", []).copy()
-            left_flashcards = len(used_flashcards) - 1
-            if left_flashcards < 0: return None
-        
-        flashcard = random.choice(used_flashcards)
-        used_flashcards.remove(flashcard)
-        return flashcard
+    position = pool.draw()
+    return None if position is None else data["flashcards"][position]
+
+def pick_up_new_cards():
+    """Adds cards other processes appended to the deck since the last draw."""
+    global data
+    if deck is None:
+        return
+    new_cards, reloaded = deck.refresh()
+    if reloaded:
+        data = deck.data
+        pool.reset(len(data["flashcards"]), data["flashcards"])
+    elif new_cards:
+        pool.grow(len(data["flashcards"]))
+
+exam_answers = set()  # Grading IDs of answers submitted in this run; any other result is from an earlier exam
+
+def print_grade(result):
+    verdict = {True: "Correct", False: "Incorrect", None: "Not graded"}[result["correct"]]
+    if result["id"] not in exam_answers:
+        verdict += ", earlier exam"
+    print(f"[{verdict}] {result['question']}\n  Your answer: {result['user_answer']}\n  {result['feedback']}\n")
+
+def print_finished_grades(grading_queue):
+    """Prints grades that came in since the last question."""
+    while True:
+        try:
+            print_grade(grading_queue.results.get_nowait())
+        except queue.Empty:
+            return
+
+def finish_exam(grading_queue, graded):
+    """Waits for the remaining grades, then prints a summary."""
+    print_finished_grades(grading_queue)
+    if grading_queue.outstanding():
+        print(f"Waiting for {grading_queue.outstanding()} answers to be graded...\n")
+    while grading_queue.outstanding() or not grading_queue.results.empty():
+        try:
+            print_grade(grading_queue.results.get(timeout=1))
+        except queue.Empty:
+            continue
+    grading_queue.stop()
+    report = grading_queue.report()
+    # Only answers given in this run count towards this exam's score
+    this_exam = [r for r in graded if r["id"] in exam_answers]
+    earlier = [r for r in graded if r["id"] not in exam_answers]
+    correct = sum(1 for r in this_exam if r["correct"])
+    print(f"Exam finished: {correct}/{len(this_exam)} correct "
+          f"({report['calls']} grading calls, {report['failed']} answers could not be graded).")
+    if earlier:
+        print(f"Also graded {len(earlier)} answers left from the last exam: "
+              f"{sum(1 for r in earlier if r['correct'])} correct.")
 
 if __name__ == '__main__':
-    check_and_run()
+    parser = argparse.ArgumentParser(description="Free-text flashcard quiz graded by an LLM.")
+    parser.add_argument("--search", help="Only study cards matching this query")
+    parser.add_argument("--low-memory", action="store_true",
+                        help="Leave cards on disk and read each one when drawn (also DECK_LOW_MEMORY=1)")
+    parser.add_argument("--exam", action="store_true",
+                        help="Submit answers without waiting; they are graded in batches in the background")
+    args = parser.parse_args()
+    profiler.start()
+
+    validate_config()
+    lazy = True if args.low_memory else None
+    check_and_run(lazy)
+
+    grading_queue = None
+    graded = []  # Exam results, in the order they came back
+    if args.exam:
+        from grading import GradingQueue, GRADING_QUEUE_FILE, grade_batch_llm
+        grading_queue = GradingQueue(lambda items: grade_batch_llm(items, get_llm_json_response),
+                                     on_result=graded.append)
+        left_over = grading_queue.start()
+        if left_over:
+            print(f"Grading {left_over} answers left in {GRADING_QUEUE_FILE} from the last exam.")
     
     if "flashcards" not in data:
         data["flashcards"] = []
@@ -177,21 +289,35 @@ if __name__ == '__main__':
         q_text = input("Enter Question: ")
         a_text = input("Enter Textbook Answer: ")
         data["flashcards"] = [{"question": q_text, "textbook_answer": a_text}]
-        with open(json_file_path, "w") as file:
-            json.dump(data, file, indent=4)
+        save_deck(json_file_path, data)
+        deck = SharedDeck(json_file_path, lazy)
+        data = deck.data
     
+    positions = None  # Whole deck
+    if args.search:
+        results = search_deck(json_file_path, args.search, limit=SEARCH_POOL_SIZE)
+        if not results:
+            print(f"No cards in {json_file_path} match '{args.search}'.")
+            sys.exit(1)
+        positions = [card_id for card_id, _ in results]
+        print(f"Studying {len(positions)} cards matching '{args.search}'.")
+
     # Initialize pool
-    used_flashcards = data.get("flashcards", []).copy()
-    left_flashcards = len(used_flashcards)
+    pool = CardPool(len(data["flashcards"]), positions, data["flashcards"])
 
     while True:
         # Clear screen command (Cross-platform friendly)
         print("\033[H\033[J", end="")
+        if grading_queue is not None:
+            print_finished_grades(grading_queue)
         
+        pick_up_new_cards()
         card_obj = select_random_flashcard()
         
         if card_obj is None:
             print("No flashcards available.")
+            if grading_queue is not None:
+                finish_exam(grading_queue, graded)
             break
 
         # Handle Legacy Data (if file has strings instead of dicts)
@@ -202,12 +328,14 @@ if __name__ == '__main__':
             question_text = card_obj.get("question", "Unknown Question")
             textbook_answer = card_obj.get("textbook_answer", "No textbook answer provided.")
         
-        print(f"{left_flashcards} left.\nYour question is : {question_text}\n\nType 'e' to exit.\nType 'a' to add new flashcard\nType 's' to skip the question.\n")
+        print(f"{pool.left} left.\nYour question is : {question_text}\n\nType 'e' to exit.\nType 'a' to add new flashcard\nType 's' to skip the question.\n")
         user_input = input("A : ")
         
         if user_input.lower() == 's':
             continue
         if user_input.lower() == 'e':
+            if grading_queue is not None:
+                finish_exam(grading_queue, graded)
             exit()
         if user_input.lower() == 'a':
             new_q = input("Enter your new question: ")
@@ -215,15 +343,26 @@ if __name__ == '__main__':
             
             new_card = {"question": new_q, "textbook_answer": new_a}
             
-            data["flashcards"].append(new_card)
-            used_flashcards.append(new_card)
-            left_flashcards += 1
+            if deck is not None:
+                # Appended under the deck lock; the deck picks it up on the next draw
+                position = deck.append([new_card])
+            else:
+                # No deck file when the quiz started: the file is created, this session's copy kept by hand
+                append_cards(json_file_path, [new_card])
+                data["flashcards"].append(new_card)
+                position = len(data["flashcards"]) - 1
+                pool.grow(len(data["flashcards"]))
+            if positions is not None:
+                pool.add(position, new_card)
             
             print(f"New flashcard added.")
-            with open(json_file_path, "w") as file:
-                json.dump(data, file, indent=4)
             time.sleep(1)
             continue
+
+        if grading_queue is not None:
+            # Saved to the grading journal before this returns; graded while the next question is answered
+            exam_answers.add(grading_queue.submit(question_text, textbook_answer, user_input))
+            continue
             
         send_question(question_text, user_input, textbook_answer)
         print("\n")
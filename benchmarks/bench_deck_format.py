@@ -0,0 +1,92 @@
+"""Startup time and peak RSS of JSON vs binary decks.
+
+Usage: python benchmarks/bench_deck_format.py [--cards 1000000]
+
+Each measurement runs in a fresh interpreter that opens the deck and reads
+1000 random cards, so the numbers include parsing (JSON) or mapping (binary).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from deckstore import convert_deck
+
+PROBE = """
+import sys, time, random
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+from deckstore import load_deck
+cards = load_deck({path!r})["flashcards"]
+opened = time.perf_counter()
+for i in random.sample(range(len(cards)), min(1000, len(cards))):
+    cards[i]
+done = time.perf_counter()
+rss_kb = anon_kb = -1
+try:
+    # VmHWM resets on exec; ru_maxrss would include the parent's peak on Linux.
+    # RssAnon excludes page-cache pages the kernel maps around mmap faults.
+    with open("/proc/self/status") as f:
+        status = dict(l.split(":", 1) for l in f)
+    rss_kb = int(status["VmHWM"].split()[0])
+    anon_kb = int(status["RssAnon"].split()[0])
+except OSError:
+    try:
+        import resource
+        rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            rss_kb //= 1024
+    except ImportError:
+        pass
+print(opened - start, done - opened, rss_kb, anon_kb)
+"""
+
+def make_json_deck(path, count):
+    """Writes a synthetic deck with ~100 distinct locations."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{\n    "flashcards": [\n')
+        for i in range(count):
+            card = {
+                "question": f"Question {i}: what does term {i} mean in context {i % 97}?",
+                "textbook_answer": f"Term {i} is the answer to question {i}, explained in a full sentence.",
+                "textbook_location": f"Module {i % 10}, Page {i % 100}"
+            }
+            f.write(("        " if i == 0 else ",\n        ") + json.dumps(card))
+        f.write('\n    ]\n}\n')
+
+def probe(path):
+    out = subprocess.run([sys.executable, "-c", PROBE.format(root=ROOT, path=path)],
+                         capture_output=True, text=True, check=True).stdout.split()
+    return float(out[0]), float(out[1]), int(out[2]), int(out[3])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cards", type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "deck.json")
+        binary_path = os.path.join(tmp, "deck.fcd")
+
+        print(f"Generating {args.cards} cards...")
+        make_json_deck(json_path, args.cards)
+        start = time.perf_counter()
+        convert_deck(json_path, binary_path)
+        print(f"Converted to binary in {time.perf_counter() - start:.2f}s\n")
+
+        print(f"{'format':<8}{'size MB':>10}{'open s':>10}{'1k reads s':>12}{'peak RSS MB':>14}{'private MB':>12}")
+        for label, path in (("json", json_path), ("binary", binary_path)):
+            open_s, read_s, rss_kb, anon_kb = probe(path)
+            size_mb = os.path.getsize(path) / 1e6
+            rss = f"{rss_kb / 1024:.1f}" if rss_kb >= 0 else "n/a"
+            anon = f"{anon_kb / 1024:.1f}" if anon_kb >= 0 else "n/a"
+            print(f"{label:<8}{size_mb:>10.1f}{open_s:>10.3f}{read_s:>12.4f}{rss:>14}{anon:>12}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Throughput and peak memory of streaming deck export/import.
+
+Usage: python benchmarks/bench_exchange.py [--cards 200000] [--format csv|tsv|txt]
+
+Generates a synthetic JSON deck, then in fresh interpreters exports it
+and imports the export into a new deck, reporting rows/s and peak RSS.
+Flat peak RSS across --cards values is what "constant memory" means here.
+"""
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_deck_format import make_json_deck
+
+PROBE = """
+import sys, time, contextlib, io
+sys.path.insert(0, {root!r})
+import exchange
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    count = exchange.{call}
+elapsed = time.perf_counter() - start
+rss_kb = -1
+try:
+    with open("/proc/self/status") as f:
+        rss_kb = int(dict(l.split(":", 1) for l in f)["VmHWM"].split()[0])
+except OSError:
+    pass
+print(count, elapsed, rss_kb)
+"""
+
+def run(call, cwd):
+    out = subprocess.run([sys.executable, "-c", PROBE.format(root=ROOT, call=call)],
+                         capture_output=True, text=True, check=True, cwd=cwd).stdout.split()
+    return int(out[0]), float(out[1]), int(out[2])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cards", type=int, default=200000)
+    parser.add_argument("--format", default="csv", choices=("csv", "tsv", "txt"))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        deck = os.path.join(tmp, "deck.json")
+        exported = os.path.join(tmp, f"deck.{args.format}")
+        imported = os.path.join(tmp, "imported.json")
+        print(f"Generating {args.cards} cards...")
+        make_json_deck(deck, args.cards)
+
+        print(f"{'step':<8}{'rows':>10}{'seconds':>10}{'rows/s':>12}{'peak RSS MB':>14}")
+        for step, call in (("export", f"export_deck({deck!r}, {exported!r})"),
+                           ("import", f"import_cards({exported!r}, {imported!r})")):
+            count, elapsed, rss_kb = run(call, tmp)
+            print(f"{step:<8}{count:>10}{elapsed:>10.2f}{count / elapsed:>12,.0f}{rss_kb / 1024:>14.1f}")
+
+if __name__ == "__main__":
+    main()
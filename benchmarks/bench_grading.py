@@ -0,0 +1,79 @@
+"""Exam time with blocking grading vs. the background grading queue.
+
+Usage: python benchmarks/bench_grading.py [--answers 40] [--typing-ms 300] [--call-ms 400] [--per-item-ms 40]
+
+A simulated student takes --typing-ms per answer. The simulated provider
+takes --call-ms per call plus --per-item-ms per graded answer. Blocking
+mode is what aiTest.py does without --exam: each answer waits for its own
+call. Queued mode submits every answer to a GradingQueue and waits for the
+last grade once the student is done. Times are scaled down (1 ms = 1 ms
+of sleep), so the numbers are the real ratio at any scale.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import grading
+from grading import GradingQueue
+
+class Provider:
+    def __init__(self, call_ms, per_item_ms):
+        self.call_ms = call_ms
+        self.per_item_ms = per_item_ms
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def grade_batch(self, items):
+        with self.lock:
+            self.calls += 1
+        time.sleep((self.call_ms + self.per_item_ms * len(items)) / 1000)
+        return [{"correct": True, "feedback": "ok"} for _ in items]
+
+def blocking(args):
+    provider = Provider(args.call_ms, args.per_item_ms)
+    start = time.perf_counter()
+    for i in range(args.answers):
+        time.sleep(args.typing_ms / 1000)
+        provider.grade_batch([{"question": f"Q{i}"}])
+    return time.perf_counter() - start, 0.0, provider.calls
+
+def queued(args):
+    provider = Provider(args.call_ms, args.per_item_ms)
+    grader = GradingQueue(provider.grade_batch, os.path.join(tempfile.mkdtemp(), "queue.jsonl"))
+    grader.start()
+    start = time.perf_counter()
+    for i in range(args.answers):
+        time.sleep(args.typing_ms / 1000)
+        grader.submit(f"Q{i}", "textbook", "answer")
+    typed = time.perf_counter() - start
+    grader.wait()
+    total = time.perf_counter() - start
+    grader.stop()
+    return total, total - typed, provider.calls
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--answers", type=int, default=40)
+    parser.add_argument("--typing-ms", type=float, default=300)
+    parser.add_argument("--call-ms", type=float, default=400)
+    parser.add_argument("--per-item-ms", type=float, default=40)
+    args = parser.parse_args()
+    # The batching window is in real seconds; scale it with the simulated typing time
+    grading.BATCH_WAIT_SECONDS = min(grading.BATCH_WAIT_SECONDS, 4 * args.typing_ms / 1000)
+
+    print(f"{args.answers} answers, {args.typing_ms:g} ms typing each, provider {args.call_ms:g} ms "
+          f"per call + {args.per_item_ms:g} ms per answer\n")
+    print(f"{'mode':<26}{'exam s':>8}{'wait after last s':>19}{'calls':>7}")
+    for label, run in (("blocking (before)", blocking),
+                       (f"queued, {grading.GRADING_WORKERS} workers x {grading.GRADE_BATCH_SIZE}", queued)):
+        total, tail, calls = run(args)
+        print(f"{label:<26}{total:>8.1f}{tail:>19.2f}{calls:>7}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Bytes transferred and modelled page-load time for the web app.
+
+Usage: python benchmarks/bench_http.py [--rtt-ms 80] [--mbps 5]
+
+Drives the Flask app in-process with its test client. "Before" is the
+old single page: the same HTML, CSS and JS inline, sent uncompressed and
+without validators on every visit. "After" is the page plus hashed
+assets, compressed, with a 304 for the page and no asset requests on a
+repeat visit. Load time is modelled as round trips plus transfer at the
+given bandwidth, with the two assets fetched in parallel after the page.
+"""
+import os
+import re
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+ACCEPT = {"Accept-Encoding": "gzip, br"}
+
+def transfer_ms(size, rtt_ms, mbps):
+    return rtt_ms + size * 8 / (mbps * 1000)
+
+def server_ms(client, path, headers, runs=200):
+    start = time.perf_counter()
+    for _ in range(runs):
+        client.get(path, headers=headers)
+    return (time.perf_counter() - start) * 1000 / runs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rtt-ms", type=float, default=80)
+    parser.add_argument("--mbps", type=float, default=5)
+    args = parser.parse_args()
+
+    import aiAPI
+    from tenants import get_tenant
+    client = aiAPI.app.test_client()
+
+    page = client.get("/", headers=ACCEPT)
+    html = client.get("/").data.decode("utf-8")
+    assets = re.findall(r'(?:href|src)="(/assets/[^"]+)"', html)
+    assets_identity = [len(client.get(a).data) for a in assets]
+    assets_encoded = [len(client.get(a, headers=ACCEPT).data) for a in assets]
+
+    # The old page inlined both assets
+    before_bytes = len(html.encode("utf-8")) + sum(assets_identity)
+    before_ms = transfer_ms(before_bytes, args.rtt_ms, args.mbps)
+
+    first_bytes = len(page.data) + sum(assets_encoded)
+    first_ms = (transfer_ms(len(page.data), args.rtt_ms, args.mbps)
+                + max(transfer_ms(n, args.rtt_ms, args.mbps) for n in assets_encoded))
+    revalidated = client.get("/", headers=dict(ACCEPT, **{"If-None-Match": page.headers["ETag"]}))
+    repeat_bytes = len(revalidated.data)
+    repeat_ms = transfer_ms(repeat_bytes, args.rtt_ms, args.mbps)
+
+    print(f"Network model: {args.rtt_ms:g} ms RTT, {args.mbps:g} Mbit/s; encoding {page.headers.get('Content-Encoding')}\n")
+    print(f"{'page load':<28}{'bytes':>10}{'modelled ms':>14}")
+    print(f"{'before (every visit)':<28}{before_bytes:>10}{before_ms:>14.0f}")
+    print(f"{'after, first visit':<28}{first_bytes:>10}{first_ms:>14.0f}")
+    print(f"{'after, repeat visit (304)':<28}{repeat_bytes:>10}{repeat_ms:>14.0f}")
+
+    print(f"\n{'JSON response':<28}{'identity':>10}{'encoded':>10}")
+    deck = get_tenant().deck_files()[0]
+    for path in (f"/api/search?file={deck}&q=data&limit=100", "/api/files", "/api/leaderboard"):
+        identity = len(client.get(path).data)
+        encoded = len(client.get(path, headers=ACCEPT).data)
+        print(f"{path.split('?')[0]:<28}{identity:>10}{encoded:>10}")
+
+    print(f"\nServer time for '/': {server_ms(client, '/', ACCEPT):.2f} ms, "
+          f"304 revalidation: {server_ms(client, '/', {'If-None-Match': page.headers['ETag']}):.2f} ms")
+
+if __name__ == "__main__":
+    main()
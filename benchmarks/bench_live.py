@@ -0,0 +1,131 @@
+"""Leaderboard push latency and load versus polling.
+
+Usage: python benchmarks/bench_live.py [--clients 50] [--updates 40] [--poll-seconds 15]
+
+Runs the Flask app on a local port in a scratch directory, opens the
+given number of /api/leaderboard/stream connections (split across two
+deck rooms and the overall board) and writes scores. It reports how long
+each change takes to reach every watching client and how many writes
+were not sent because no watched top 10 changed. The polling comparison
+is the requests per minute the same clients would make against
+/api/leaderboard, and the time the server spends answering them.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import random
+import argparse
+import tempfile
+import threading
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DECKS = ("deck_a.json", "deck_b.json")
+
+class Client(threading.Thread):
+    """One SSE connection, recording when each diff version arrives."""
+
+    def __init__(self, port, room):
+        super().__init__(daemon=True)
+        self.room = room
+        self.received = {}   # version -> arrival time
+        self.ready = threading.Event()
+        query = f"?file={room}" if room else ""
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.sock.sendall(f"GET /api/leaderboard/stream{query} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+
+    def run(self):
+        buffer = b""
+        while True:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                return
+            buffer += chunk
+            while b"\n\n" in buffer:
+                block, buffer = buffer.split(b"\n\n", 1)
+                lines = block.decode().splitlines()
+                event = next((l[7:] for l in lines if l.startswith("event: ")), None)
+                data = next((l[6:] for l in lines if l.startswith("data: ")), None)
+                if event == "snapshot":
+                    self.ready.set()
+                elif event == "diff":
+                    self.received[json.loads(data)["version"]] = time.perf_counter()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--updates", type=int, default=40)
+    parser.add_argument("--poll-seconds", type=float, default=15,
+                        help="how often a polling page would refresh (the old score flush interval)")
+    args = parser.parse_args()
+
+    import aiAPI
+    import live
+    from tenants import get_tenant
+    from werkzeug.serving import make_server
+
+    os.chdir(tempfile.mkdtemp())
+    for deck in DECKS:
+        with open(deck, "w") as f:
+            json.dump([{"question": "q", "textbook_answer": "a"}], f)
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, aiAPI.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    tenant = get_tenant()
+    rooms = ["", *DECKS]
+    clients = [Client(port, rooms[i % len(rooms)]) for i in range(args.clients)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.ready.wait(10)
+
+    random.seed(0)
+    latencies = []
+    for i in range(args.updates):
+        deck = random.choice(DECKS)
+        room_versions = {room: tenant.live_board.boards[room][0] for room in rooms}
+        start = time.perf_counter()
+        tenant.record_score(f"user{i % 7}", random.randint(0, 1000), deck)
+        changed = [r for r in rooms if tenant.live_board.boards[r][0] != room_versions[r]]
+        watchers = [c for c in clients if c.room in changed]
+        deadline = time.perf_counter() + 5
+        for client in watchers:
+            version = tenant.live_board.boards[client.room][0]
+            while version not in client.received and time.perf_counter() < deadline:
+                time.sleep(0.0002)
+            if version in client.received:
+                latencies.append((client.received[version] - start) * 1000)
+        time.sleep(0.01)
+
+    report = tenant.live_board.report()
+    print(f"{args.clients} clients over {len(rooms)} rooms, {args.updates} score writes\n")
+    print(f"Diffs published:           {report['published']}")
+    print(f"Room updates skipped:      {report['unchanged']}  (top 10 unchanged)")
+    print(f"Slow-client resyncs:       {report['resyncs']}")
+    if latencies:
+        latencies.sort()
+        print(f"Write -> client latency:   median {statistics.median(latencies):.2f} ms, "
+              f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f} ms over {len(latencies)} deliveries")
+
+    client = aiAPI.app.test_client()
+    start = time.perf_counter()
+    for _ in range(200):
+        client.get("/api/leaderboard")
+    per_poll_ms = (time.perf_counter() - start) * 1000 / 200
+    polls_per_minute = args.clients * 60 / args.poll_seconds
+    print(f"\nPolling instead: {polls_per_minute:.0f} requests/min, each rereading leaderboard.json "
+          f"({per_poll_ms:.2f} ms) = {polls_per_minute * per_poll_ms / 1000:.2f} s of server time per minute, "
+          f"with changes seen up to {args.poll_seconds:g} s late")
+    print(f"Streaming: one read per write, plus a {live.LIVE_HEARTBEAT_SECONDS:g} s heartbeat per idle client")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Offline benchmark of the LLM call sites against a recorded cassette.
+
+Usage:
+  Record once (needs a live key):
+    python benchmarks/bench_llm_replay.py --record --cassette run.jsonl
+  Replay any number of times, offline:
+    python benchmarks/bench_llm_replay.py --cassette run.jsonl [--scale 0]
+
+Exercises aiMult's MC/FITB generation, aiTest's streamed grading and
+aiAPI's generate_quiz_content on the first --cards cards of the deck and
+reports wall time per call site. --scale multiplies the recorded latency
+(1 = as recorded, 0 = no waiting, which isolates local overhead).
+"""
+import io
+import os
+import sys
+import time
+import argparse
+import statistics
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FIXED_USER_ANSWER = "I am not sure, but I think it is related to storage."
+
+def timed(results, name, fn, *args):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ok = fn(*args) is not None
+    results.setdefault(name, []).append(((time.perf_counter() - start) * 1000, ok))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cassette", default="llm_cassette.jsonl")
+    parser.add_argument("--deck", default=os.path.join(ROOT, "data.json"))
+    parser.add_argument("--cards", type=int, default=10)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--record", action="store_true", help="Call the provider and record")
+    args = parser.parse_args()
+
+    # The transport reads these at import time
+    os.environ["LLM_TRANSPORT"] = "record" if args.record else "replay"
+    os.environ["LLM_CASSETTE"] = os.path.abspath(args.cassette)
+    os.environ["LLM_LATENCY_SCALE"] = str(args.scale)
+
+    import aiMult
+    import aiTest
+    from deckstore import load_deck
+    try:
+        import aiAPI
+    except ImportError:
+        aiAPI = None
+        print("Flask not installed, skipping aiAPI.")
+
+    api_key = os.getenv("GEMINI_API_KEY", "replay")
+    cards = [c for c in load_deck(args.deck)["flashcards"][:args.cards] if isinstance(c, dict)]
+
+    results = {}
+    for card in cards:
+        q_text, a_text = card["question"], card["textbook_answer"]
+        timed(results, "aiMult MC", aiMult.generate_quiz_content, "MC", q_text, a_text)
+        timed(results, "aiMult FITB", aiMult.generate_quiz_content, "FITB", q_text, a_text)
+        # send_question prints the streamed reply and returns None
+        timed(results, "aiTest grade (stream)", lambda *a: aiTest.send_question(*a) or True,
+              q_text, FIXED_USER_ANSWER, a_text)
+        if aiAPI is not None:
+            timed(results, "aiAPI MC", aiAPI.generate_quiz_content, api_key, "MC", q_text, a_text)
+            timed(results, "aiAPI FITB", aiAPI.generate_quiz_content, api_key, "FITB", q_text, a_text)
+
+    mode = "recorded" if args.record else f"replayed at latency x{args.scale:g}"
+    print(f"{len(cards)} cards, {mode}, cassette {args.cassette}\n")
+    print(f"{'call site':<24}{'ok':>6}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, rows in results.items():
+        times = sorted(ms for ms, _ in rows)
+        ok = sum(1 for _, good in rows if good)
+        p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+        print(f"{name:<24}{ok:>3}/{len(rows):<2}{statistics.mean(times):>10.1f}"
+              f"{statistics.median(times):>10.1f}{p95:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Peak RSS and per-draw time of the CLI quiz loops, from 1k to 1M cards.
+
+Usage: python benchmarks/bench_low_memory.py [--sizes 1000,10000,100000,1000000] [--draws 2000]
+
+Each measurement runs in a fresh interpreter that opens the deck the way
+the CLIs do and draws --draws cards. "before" is the old loop: the deck
+loaded with json.load, a copy of its card list to draw from, and
+random.choice + list.remove per draw. "pool" keeps the loaded deck but
+draws positions from a CardPool. "low-memory" also leaves cards on disk
+(--low-memory / DECK_LOW_MEMORY=1): a JsonDeckView for JSON decks,
+the memory-mapped DeckView for binary ones.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from deckstore import convert_deck
+
+PROBE = """
+import sys, time, random
+sys.path.insert(0, {root!r})
+from deckstore import SharedDeck
+from card_pool import CardPool
+mode, draws = {mode!r}, {draws}
+
+start = time.perf_counter()
+deck = SharedDeck({path!r}, lazy=mode == "low-memory")
+cards = deck.cards
+if mode == "before":
+    used = cards.copy()
+else:
+    pool = CardPool(len(cards))
+opened = time.perf_counter()
+
+for _ in range(draws):
+    if mode == "before":
+        if not used:
+            used = cards.copy()
+        card = random.choice(used)
+        used.remove(card)
+    else:
+        card = cards[pool.draw()]
+done = time.perf_counter()
+
+with open("/proc/self/status") as f:
+    status = dict(l.split(":", 1) for l in f)
+# RssAnon leaves out page-cache pages mapped for binary decks; they are shared and reclaimable
+print(opened - start, (done - opened) / draws, int(status["VmHWM"].split()[0]), int(status["RssAnon"].split()[0]))
+"""
+
+def make_json_deck(path, count):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{\n    "flashcards": [\n')
+        for i in range(count):
+            card = {
+                "question": f"Question {i}: what does term {i} mean in context {i % 97}?",
+                "textbook_answer": f"Term {i} is the answer to question {i}, explained in a full sentence.",
+                "textbook_location": f"Module {i % 10}, Page {i % 100}"
+            }
+            f.write(("        " if i == 0 else ",\n        ") + json.dumps(card))
+        f.write('\n    ]\n}\n')
+
+def probe(path, mode, draws):
+    out = subprocess.run([sys.executable, "-c", PROBE.format(root=ROOT, path=path, mode=mode, draws=draws)],
+                         capture_output=True, text=True, check=True).stdout.split()
+    return float(out[0]), float(out[1]), int(out[2]), int(out[3])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--draws", type=int, default=2000)
+    args = parser.parse_args()
+    if not os.path.exists("/proc/self/status"):
+        print("Needs Linux (/proc/self/status) for peak RSS.")
+        sys.exit(1)
+
+    print(f"{'cards':>9} {'deck':<7}{'mode':<12}{'open s':>9}{'per draw us':>13}{'peak RSS MB':>13}{'private MB':>12}")
+    for count in (int(n) for n in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            json_path = os.path.join(tmp, "deck.json")
+            binary_path = os.path.join(tmp, "deck.fcd")
+            make_json_deck(json_path, count)
+            convert_deck(json_path, binary_path)
+            runs = [("json", json_path, mode) for mode in ("before", "pool", "low-memory")]
+            runs += [("binary", binary_path, mode) for mode in ("before", "low-memory")]
+            for label, path, mode in runs:
+                open_s, draw_s, rss_kb, anon_kb = probe(path, mode, args.draws)
+                print(f"{count:>9,} {label:<7}{mode:<12}{open_s:>9.2f}{draw_s * 1e6:>13.1f}"
+                      f"{rss_kb / 1024:>13.1f}{anon_kb / 1024:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Overhead of the profiler on the web app.
+
+Usage: python benchmarks/bench_profiler.py [--requests 2000] [--threads 4] [--runs 3]
+
+Serves /api/generate and /api/search through the Flask test client from
+--threads threads, once with PROFILE off and once with it on. The
+provider is an instant stand-in, so the numbers are the app's own CPU
+cost and the profiler's share of it is as large as it can get. Each run
+is a separate process because PROFILE is read at import.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import threading
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def child(requests_per_thread, threads):
+    os.chdir(tempfile.mkdtemp())
+    cards = [{"question": f"Question {i} about cells?", "textbook_answer": f"Answer {i} names organelle {i}."}
+             for i in range(2000)]
+    with open("deck.json", "w") as f:
+        json.dump({"flashcards": cards}, f)
+
+    import aiAPI
+    import profiler
+    aiAPI.generate_quiz_content = lambda api_key, mode, q, a: {"distractors": ["a", "b", "c"]}
+
+    def worker():
+        client = aiAPI.app.test_client()
+        client.post("/api/start", json={"filename": "deck.json"})
+        for i in range(requests_per_thread):
+            if i % 2:
+                client.post("/api/generate", json={"name": "bench"}, headers={"X-Gemini-API-Key": "k"})
+            else:
+                client.get("/api/search?file=deck.json&q=organelle+cells")
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    ticks = profiler._sampler.taken if profiler._sampler else 0
+    print(json.dumps({"rps": requests_per_thread * threads / elapsed, "ticks": ticks}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    per_thread = args.requests // args.threads
+
+    if args.child:
+        return child(per_thread, args.threads)
+
+    # Alternating runs, best of each, to keep machine noise out of the comparison
+    results = {"off": [], "on": []}
+    for _ in range(args.runs):
+        for label, flag in (("off", "0"), ("on", "1")):
+            env = dict(os.environ, PROFILE=flag, PROFILE_SLOW_MS="100000")
+            out = subprocess.run([sys.executable, __file__, "--child", "--requests", str(args.requests),
+                                  "--threads", str(args.threads)], env=env, capture_output=True, text=True, check=True)
+            results[label].append(json.loads(out.stdout.strip().splitlines()[-1]))
+    results = {label: max(runs, key=lambda r: r["rps"]) for label, runs in results.items()}
+
+    off, on = results["off"]["rps"], results["on"]["rps"]
+    print(f"{args.requests} requests from {args.threads} threads, instant provider, best of {args.runs}")
+    print(f"PROFILE off: {off:,.0f} req/s")
+    print(f"PROFILE on:  {on:,.0f} req/s ({results['on']['ticks']} sampler ticks), "
+          f"{100 * (off - on) / off:+.1f}% overhead")
+
+if __name__ == "__main__":
+    main()
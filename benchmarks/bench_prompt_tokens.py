@@ -0,0 +1,81 @@
+"""Tokens per generated item before and after the shared prompt templates.
+
+Usage:
+  python benchmarks/bench_prompt_tokens.py [--deck data.json] [--budget-scale 1.0]
+
+"Before" rebuilds the prompts the call sites used to send, with the
+instructions pasted into every prompt and the full textbook answer.
+"After" is prompts.build_prompt. Tokens come from tiktoken when it is
+installed and are estimated at 4 characters each otherwise. The system
+instruction is counted in both; with Gemini it is set on a reused model
+instead of repeated in the prompt text.
+"""
+import os
+import sys
+import argparse
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FIXED_USER_ANSWER = "I am not sure, but I think it is related to storage."
+
+def legacy_prompts(question, answer):
+    """The ad hoc prompts from before prompts.py, one per call site."""
+    quiz_system = "You are a quiz generator. Output only valid JSON."
+    return {
+        "MC": quiz_system + "\n\n" + (
+            f"Question: {question}\nCorrect Answer: {answer}\n\n"
+            "Task: Generate 3 plausible but incorrect answers (distractors).\n"
+            "Constraints: 1. FORMATTING: Match Correct Answer format exactly. 2. SIMILARITY: Strictly related context.\n"
+            "Output JSON format: {\"distractors\": [\"wrong1\", \"wrong2\", \"wrong3\"]}"),
+        "FITB": quiz_system + "\n\n" + (
+            f"Question: {question}\nFull Answer: {answer}\n\n"
+            "Task: Rewrite 'Full Answer' replacing ONE key piece of info with '______'.\n"
+            "Output JSON format: {\"masked_text\": \"The capital of France is ______.\", \"missing_word\": \"Paris\"}"),
+        "GRADE": (
+            "You are a concise tutor. Compare the User Answer against the provided Textbook Answer. "
+            "1. State if the user is Correct or Incorrect. "
+            "2. If incorrect, briefly explain why using the Textbook Answer as the source of truth. "
+            "3. Keep your response short and to the point.") + "\n\n" + (
+            f"Question: {question}\nTextbook Answer: {answer}\nUser Answer: {FIXED_USER_ANSWER}"),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--deck", default=os.path.join(ROOT, "data.json"))
+    parser.add_argument("--budget-scale", type=float, default=1.0,
+                        help="Multiply every token budget, e.g. 0.5 to see tighter budgets")
+    args = parser.parse_args()
+
+    import prompts
+    from deckstore import load_deck
+
+    for task in prompts.TOKEN_BUDGETS:
+        prompts.TOKEN_BUDGETS[task] = int(prompts.TOKEN_BUDGETS[task] * args.budget_scale)
+
+    cards = [c for c in load_deck(args.deck)["flashcards"] if isinstance(c, dict) and "textbook_answer" in c]
+    before = {"MC": [], "FITB": [], "GRADE": []}
+    after = {"MC": [], "FITB": [], "GRADE": []}
+    compacted = dict.fromkeys(before, 0)
+
+    for card in cards:
+        question, answer = card["question"], card["textbook_answer"]
+        for task, text in legacy_prompts(question, answer).items():
+            before[task].append(prompts.count_tokens(text))
+            fields = {"question": question, "answer": answer, "user_answer": FIXED_USER_ANSWER}
+            system, user = prompts.build_prompt(task, **fields)
+            after[task].append(prompts.count_tokens(system) + prompts.count_tokens(user))
+            compacted[task] += prompts.fit_to_budget(answer, prompts.TOKEN_BUDGETS[task], question) != answer
+
+    counter = "tiktoken" if prompts._encoder else "4 chars/token estimate"
+    print(f"{len(cards)} cards from {args.deck}, tokens by {counter}\n")
+    print(f"{'task':<8}{'budget':>8}{'before avg':>12}{'after avg':>11}{'before max':>12}{'after max':>11}{'saved':>8}{'compacted':>11}")
+    for task in before:
+        b, a = before[task], after[task]
+        saved = 1 - sum(a) / sum(b)
+        print(f"{task:<8}{prompts.TOKEN_BUDGETS[task]:>8}{statistics.mean(b):>12.1f}{statistics.mean(a):>11.1f}"
+              f"{max(b):>12}{max(a):>11}{saved:>8.0%}{compacted[task]:>11}")
+
+if __name__ == "__main__":
+    main()
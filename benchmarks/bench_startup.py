@@ -0,0 +1,91 @@
+"""Import-time report and time-to-first-card for the CLIs and server.
+
+Usage: python benchmarks/bench_startup.py [--deck data.json] [--provider OPENAI]
+
+Runs each entry module under `python -X importtime` in a fresh interpreter
+and lists the slowest imports, then times how long aiMult takes from
+interpreter start to having a card picked and ready for generation. LLM
+latency is excluded; it is the same no matter how the program starts.
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ("aiMult", "aiTest", "aiAPI")
+
+# Time-to-first-card budget, excluding the LLM call itself
+TARGET_FIRST_CARD_MS = 150
+
+FIRST_CARD_PROBE = """
+import time
+start = time.perf_counter()
+import aiMult
+aiMult.validate_config()
+aiMult.json_file_path = {deck!r}
+aiMult.load_data()
+aiMult.used_flashcards = list(aiMult.data.get("flashcards", []))
+aiMult.left_flashcards = len(aiMult.used_flashcards)
+card = aiMult.select_random_flashcard()
+print((time.perf_counter() - start) * 1000)
+"""
+
+def bench_env(provider):
+    env = dict(os.environ)
+    env["API_PROVIDER"] = provider
+    env.setdefault("OPENAI_API_KEY", "sk-bench")
+    env.setdefault("GEMINI_API_KEY", "bench-key")
+    return env
+
+def import_report(module, env, top):
+    """Returns (total ms, [(cumulative ms, name), ...]) for one module."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1:]
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us) / 1000, name[1:].rstrip()))
+
+    # Top-level imports are the unindented names; their sum is the total
+    total = sum(ms for ms, name in rows if not name.startswith(" "))
+    slowest = sorted(((ms, name.strip()) for ms, name in rows), reverse=True)[:top]
+    return total, slowest
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--deck", default="data.json")
+    parser.add_argument("--provider", default="OPENAI", choices=("OPENAI", "GEMINI"))
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args()
+    env = bench_env(args.provider)
+
+    for module in MODULES:
+        total, slowest = import_report(module, env, args.top)
+        if total is None:
+            print(f"{module}: import failed: {' '.join(slowest)}\n")
+            continue
+        print(f"{module}: {total:.1f} ms total import time")
+        for ms, name in slowest:
+            print(f"  {ms:8.1f} ms  {name}")
+        print()
+
+    deck = os.path.abspath(args.deck)
+    runs = []
+    for _ in range(5):
+        out = subprocess.run([sys.executable, "-c", FIRST_CARD_PROBE.format(deck=deck)],
+                             cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+        runs.append(float(out.strip().splitlines()[-1]))
+    best = min(runs)
+    verdict = "OK" if best <= TARGET_FIRST_CARD_MS else "OVER TARGET"
+    print(f"time-to-first-card (aiMult, {args.provider}, {os.path.basename(deck)}): "
+          f"best {best:.1f} ms of {len(runs)}, target {TARGET_FIRST_CARD_MS} ms -> {verdict}")
+
+if __name__ == "__main__":
+    main()
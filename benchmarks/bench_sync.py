@@ -0,0 +1,105 @@
+"""Bytes and time to bring a deck copy up to date: full copy vs. sync.py.
+
+Usage: python benchmarks/bench_sync.py [--cards 20000] [--changed 100]
+
+A deck of --cards cards is synced once between two files, then --changed
+cards are edited, added or removed on one side and the sync runs again.
+"Full copy" is what copying the deck file costs; "sync" counts the bytes
+of the manifest and card bodies that sync.py moves, as the JSON the
+server would send. A third sync with nothing changed shows the cost of
+checking. Also times how long a running reader (SharedDeck) takes to
+catch up with the edit, replayed from the journal vs. reloading.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from deckstore import SharedDeck, load_deck, save_deck
+import sync
+
+class CountingPeer(sync.LocalPeer):
+    """A LocalPeer that adds up what an HTTP peer would have sent and received."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.bytes = 0
+
+    def manifest(self, since=None):
+        version, stamp, revs = super().manifest(since)
+        body = {"version": version, "stamp": stamp}
+        body.update({"unchanged": True} if revs is None else {"cards": list(revs.items())})
+        self.bytes += len(json.dumps(body))
+        return version, stamp, revs
+
+    def fetch(self, ids):
+        bodies = super().fetch(ids)
+        self.bytes += len(json.dumps(list(ids))) + len(json.dumps({"cards": bodies}))
+        return bodies
+
+    def apply(self, version, remove_ids, cards):
+        self.bytes += len(json.dumps({"version": version, "remove": list(remove_ids), "cards": cards}))
+        return super().apply(version, remove_ids, cards)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cards", type=int, default=20000)
+    parser.add_argument("--changed", type=int, default=100)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    cards = [{"question": f"Question {i} about the cell cycle?",
+              "textbook_answer": f"Answer {i}: " + "the cell grows, copies its DNA and divides. " * 4,
+              "textbook_location": f"Chapter {i // 500}, page {i // 20}"} for i in range(args.cards)]
+    save_deck("server.json", {"flashcards": cards})
+    peer = CountingPeer("server.json")
+    sync.sync_deck("client.json", peer)
+
+    # Edits on the server: a third edited, a third added, a third removed
+    third = max(1, args.changed // 3)
+    data = load_deck("server.json")
+    for i in range(third):
+        data["flashcards"][i * 7]["textbook_answer"] += " Edited."
+    data["flashcards"] = data["flashcards"][third:] + [
+        {"question": f"New question {i}?", "textbook_answer": "New answer."} for i in range(third)]
+    save_deck("server.json", data)
+
+    reader = SharedDeck("client.json")
+    peer.bytes = 0
+    start = time.perf_counter()
+    report = sync.sync_deck("client.json", peer)
+    sync_s = time.perf_counter() - start
+    sync_bytes = peer.bytes
+
+    start = time.perf_counter()
+    _, reloaded = reader.refresh()
+    replay_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    SharedDeck("client.json")
+    reload_ms = (time.perf_counter() - start) * 1000
+
+    peer.bytes = 0
+    start = time.perf_counter()
+    sync.sync_deck("client.json", peer)
+    noop_ms = (time.perf_counter() - start) * 1000
+    noop_bytes = peer.bytes
+
+    full = os.path.getsize("server.json")
+    print(f"{args.cards} cards, {3 * third} changed on the server "
+          f"(pulled {report['pulled']}, removed {report['removed_here']})\n")
+    print(f"full copy:  {full / 1024:>8,.0f} KB")
+    print(f"sync:       {sync_bytes / 1024:>8,.0f} KB in {sync_s * 1000:.0f} ms "
+          f"({100 * sync_bytes / full:.1f}% of the deck)")
+    print(f"no changes: {noop_bytes:>8,} B  in {noop_ms:.0f} ms")
+    print(f"\nrunning reader catching up: {replay_ms:.1f} ms replaying the journal, "
+          f"{reload_ms:.1f} ms reloading the deck")
+    assert sorted(map(sync.card_id, load_deck("client.json")["flashcards"])) == \
+        sorted(map(sync.card_id, load_deck("server.json")["flashcards"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Interactive latency of one tenant while another bulk-generates.
+
+Usage: python benchmarks/bench_tenants.py [--bulk-clients 16] [--requests 30] [--provider-ms 50]
+
+Two tenants are created in a scratch directory. "bulk" has --bulk-clients
+threads calling /api/generate back to back (a class pre-generating a
+deck); "class" has one student drawing --requests cards one at a time.
+The provider is a stand-in that holds the server's genai lock for
+--provider-ms, as a real Gemini call does. The run is repeated with the
+bulk tenant's concurrency cap lifted, which is how the server behaved
+before tenants had caps.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CARDS = 2000  # Enough distinct cards that the quiz cache rarely answers
+
+def make_deck(path):
+    cards = [{"question": f"Question {i}?", "textbook_answer": f"Answer {i} names enzyme number {i}."}
+             for i in range(CARDS)]
+    with open(path, "w") as f:
+        json.dump({"flashcards": cards}, f)
+
+def draw(client, tenant):
+    start = time.perf_counter()
+    response = client.post(f"/t/{tenant}/api/generate", json={"name": "bench", "mode": "MC"},
+                           headers={"X-Gemini-API-Key": "bench"})
+    return (time.perf_counter() - start) * 1000, response.get_json().get("path")
+
+def run(aiAPI, tenants, args, cap):
+    bulk = tenants.get_tenant("bulk")
+    bulk.llm_slots = threading.BoundedSemaphore(cap)
+    stop = threading.Event()
+
+    def bulk_worker():
+        client = aiAPI.app.test_client()
+        client.post("/t/bulk/api/start", json={"filename": "deck.json"})
+        while not stop.is_set():
+            draw(client, "bulk")
+
+    workers = [threading.Thread(target=bulk_worker, daemon=True) for _ in range(args.bulk_clients)]
+    for worker in workers:
+        worker.start()
+    time.sleep(0.2)
+
+    client = aiAPI.app.test_client()
+    client.post("/t/class/api/start", json={"filename": "deck.json"})
+    latencies, paths = [], []
+    for _ in range(args.requests):
+        ms, path = draw(client, "class")
+        latencies.append(ms)
+        paths.append(path)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    latencies.sort()
+    return latencies, paths.count("llm")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bulk-clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--provider-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    import aiAPI
+    import tenants
+    for name in ("bulk", "class"):
+        tenants.create_tenant(name)
+        make_deck(os.path.join(tenants.TENANTS_DIR, name, "deck.json"))
+
+    def provider(api_key, mode, question, answer):
+        with aiAPI.genai_lock:
+            time.sleep(args.provider_ms / 1000)
+        return {"distractors": ["a", "b", "c"]}
+    aiAPI.generate_quiz_content = provider
+
+    print(f"{args.bulk_clients} bulk clients, {args.requests} interactive draws, "
+          f"{args.provider_ms:g} ms per provider call\n")
+    print(f"{'bulk tenant cap':<22}{'median ms':>10}{'p95 ms':>10}{'max ms':>10}{'via LLM':>9}")
+    for label, cap in (("none (before)", 1000), (f"{tenants.DEFAULT_MAX_CONCURRENT_LLM} (default)", tenants.DEFAULT_MAX_CONCURRENT_LLM)):
+        latencies, llm = run(aiAPI, tenants, args, cap)
+        p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+        print(f"{label:<22}{statistics.median(latencies):>10.0f}{p95:>10.0f}{latencies[-1]:>10.0f}{llm:>9}")
+
+if __name__ == "__main__":
+    main()
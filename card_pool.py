@@ -0,0 +1,70 @@
+import random
+from array import array
+
+from sync import card_id
+
+class CardPool:
+    """Random draw order over card positions, without copying the cards.
+
+    Holds the positions not yet drawn in this pass as a flat array (4 bytes
+    a card). A draw swaps a random remaining position to the end and pops
+    it, so it is O(1) where list.remove on a copy of the deck was O(n).
+    When a pass runs out the next one starts over the whole pool, as the
+    quiz loops always did.
+
+    A restricted pool given the deck's cards also remembers them by card
+    ID, so reset() can find them again after edits move them around.
+    """
+
+    def __init__(self, count=0, positions=None, cards=None):
+        # positions restricts the pool (a search); otherwise it is 0..count-1
+        self.positions = None if positions is None else array('I', positions)
+        self.keys = None if positions is None or cards is None else {card_id(cards[p]) for p in positions}
+        self.count = count
+        self.remaining = array('I')
+        self.refill()
+
+    def refill(self):
+        self.remaining = array('I', self.positions) if self.positions is not None else array('I', range(self.count))
+
+    @property
+    def left(self):
+        return len(self.remaining)
+
+    def draw(self):
+        """The next card position, or None if the pool is empty."""
+        if not self.remaining:
+            self.refill()
+            if not self.remaining:
+                return None
+        i = random.randrange(len(self.remaining))
+        last = len(self.remaining) - 1
+        self.remaining[i], self.remaining[last] = self.remaining[last], self.remaining[i]
+        return self.remaining.pop()
+
+    def grow(self, count):
+        """Adds cards appended to the deck since the pool was made (unrestricted pools only)."""
+        if self.positions is None and count > self.count:
+            self.remaining.extend(range(self.count, count))
+            self.count = count
+
+    def add(self, position, card=None):
+        """Adds one card to a restricted pool, such as one the user just wrote."""
+        if self.positions is not None:
+            self.positions.append(position)
+        if self.keys is not None and card is not None:
+            self.keys.add(card_id(card))
+        self.remaining.append(position)
+
+    def reset(self, count, cards=None):
+        """Starts a new pass after the deck was reloaded.
+
+        A restricted pool that knows its cards by ID looks them up in cards,
+        wherever they are now; otherwise positions past the end are dropped.
+        """
+        self.count = count
+        if self.keys is not None and cards is not None:
+            self.positions = array('I', (i for i, card in enumerate(cards) if card_id(card) in self.keys))
+        elif self.positions is not None:
+            self.positions = array('I', (p for p in self.positions if p < count))
+        self.refill()
@@ -0,0 +1,940 @@
+import os
+import re
+import sys
+import json
+import mmap
+import time
+import struct
+import threading
+from array import array
+from contextlib import contextmanager
+from collections.abc import Sequence
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# ================= CONFIGURATION =================
+
+# Binary deck layout (all integers little-endian):
+#   header   magic, format version, flags, card count, and the offsets of
+#            the index, string table and meta blob
+#   index    one fixed-size entry per card: string IDs for question,
+#            answer, location and extra fields, plus card flags
+#   strings  count, (count + 1) end offsets, then one UTF-8 blob
+#   meta     JSON object holding every top-level key except "flashcards"
+# Fixed-size index entries make card i a constant-time lookup, and the
+# string table lets repeated values (locations, mostly) be stored once.
+
+DECK_MAGIC = b"FCDK"
+DECK_FORMAT_VERSION = 1
+BINARY_EXTENSION = ".fcd"
+DECK_EXTENSIONS = (".json", BINARY_EXTENSION)
+
+_HEADER = struct.Struct("<4sHHQQQQQ")
+_ENTRY = struct.Struct("<IIIII")
+_COUNT = struct.Struct("<I")
+_OFFSET = struct.Struct("<Q")
+_SPAN = struct.Struct("<QQ")
+
+_NO_STRING = 0xFFFFFFFF
+_CARD_LEGACY = 1  # Card is a bare question string, as main.py writes them
+
+_CARD_FIELDS = ("question", "textbook_answer", "textbook_location")
+
+# Callables run as listener(path) after every locked write in this process
+_save_listeners = []
+
+# Shared-deck sidecars: <deck>.lock is the inter-process lock and
+# <deck>.changes.jsonl the change journal other processes follow
+LOCK_SUFFIX = ".lock"
+JOURNAL_SUFFIX = ".changes.jsonl"
+LOCK_TIMEOUT = float(os.getenv("DECK_LOCK_TIMEOUT", "10"))
+JOURNAL_MAX_BYTES = 1024 * 1024  # Compacted to one entry past this size
+
+# How json.dump(indent=4) closes a deck whose cards are its last key. Journal
+# entries note where that starts ("tail"), so append_cards can copy the file
+# up to there and add the new cards without parsing and re-encoding the deck
+_JSON_CLOSE = re.compile(rb"\r?\n    \]\r?\n\}\s*\Z")
+
+# SharedDeck leaves JSON decks' cards on disk and reads them on access
+# (binary decks always are). Costs a scan of the file on load and a small
+# read per card, for about 8 bytes of memory a card instead of the whole deck.
+LOW_MEMORY = os.getenv("DECK_LOW_MEMORY", "").lower() in ("1", "true", "yes")
+
+# JSON files kept next to decks that are state, not decks: review counters
+# (reviews.py), quiz policy state (quiz_policy.py), a tenant's config, LLM
+# usage and leaderboard (tenants.py), and ingest.py's per-source checkpoints
+STATE_FILES = frozenset(("review_stats.json", "quiz_policy.json", "tenant.json",
+                         "llm_usage.json", "leaderboard.json"))
+STATE_SUFFIXES = (".ingest.json",)
+
+class DeckLockTimeout(Exception):
+    """Another process held a deck lock for longer than the timeout."""
+
+class DeckConflictError(Exception):
+    """A write expected a deck version that is no longer current."""
+
+    def __init__(self, path, expected, actual):
+        super().__init__(f"{path} is at version {actual}, expected {expected}")
+        self.expected = expected
+        self.actual = actual
+
+# ================= FORMAT DETECTION =================
+
+def is_binary_deck(path):
+    """True if the file at path starts with the binary deck magic."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(DECK_MAGIC)) == DECK_MAGIC
+    except OSError:
+        return False
+
+def is_state_file(filename):
+    """True for the JSON state files the apps keep next to decks."""
+    return filename in STATE_FILES or filename.endswith(STATE_SUFFIXES)
+
+def is_deck_file(filename):
+    """True if filename names a deck: a JSON or binary deck extension and not a state file."""
+    return filename.endswith(DECK_EXTENSIONS) and not is_state_file(filename)
+
+def list_deck_files(directory='.'):
+    """Deck files (JSON or binary) in a directory, leaving out state files."""
+    return sorted(f for f in os.listdir(directory) if is_deck_file(f))
+
+# ================= BINARY DECK READER =================
+
+class DeckView(Sequence):
+    """Read-only, memory-mapped view of a binary deck's cards.
+
+    Cards are decoded on access, so opening a deck costs the same for ten
+    cards as for a million. Cards appended in memory are kept separately
+    until the deck is saved. Note that on Windows a mapped deck cannot be
+    replaced on disk until every process holding it has closed it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._appended = []
+        self._file = None
+        self._mm = None
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mmap, "MADV_RANDOM"):
+            # Card lookups jump around; don't let readahead pull in whole regions
+            self._mm.madvise(mmap.MADV_RANDOM)
+
+        (magic, version, _flags, count, index_offset,
+         strings_offset, meta_offset, meta_len) = _HEADER.unpack_from(self._mm, 0)
+        if magic != DECK_MAGIC:
+            self.close()
+            raise ValueError(f"{self.path} is not a binary deck")
+        if version > DECK_FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{self.path} uses deck format {version}, newer than supported")
+
+        self._count = count
+        self._index_offset = index_offset
+        string_count = _COUNT.unpack_from(self._mm, strings_offset)[0]
+        self._string_offsets = strings_offset + _COUNT.size
+        self._string_blob = self._string_offsets + (string_count + 1) * _OFFSET.size
+        self.meta = json.loads(self._mm[meta_offset:meta_offset + meta_len].decode('utf-8'))
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def reload(self):
+        """Remaps the file after it was rewritten and drops pending appends."""
+        self.close()
+        self._appended = []
+        self._open()
+
+    def _string(self, string_id):
+        if string_id == _NO_STRING:
+            return None
+        start, end = _SPAN.unpack_from(self._mm, self._string_offsets + string_id * _OFFSET.size)
+        return self._mm[self._string_blob + start:self._string_blob + end].decode('utf-8')
+
+    def _card(self, i):
+        q_id, a_id, loc_id, extra_id, flags = _ENTRY.unpack_from(self._mm, self._index_offset + i * _ENTRY.size)
+        if flags & _CARD_LEGACY:
+            return self._string(q_id)
+
+        card = {}
+        for field, string_id in zip(_CARD_FIELDS, (q_id, a_id, loc_id)):
+            value = self._string(string_id)
+            if value is not None:
+                card[field] = value
+        if extra_id != _NO_STRING:
+            card.update(json.loads(self._string(extra_id)))
+        return card
+
+    def __len__(self):
+        return self._count + len(self._appended)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("card index out of range")
+        if i >= self._count:
+            return self._appended[i - self._count]
+        return self._card(i)
+
+    def append(self, card):
+        self._appended.append(card)
+
+    def extend(self, cards):
+        self._appended.extend(cards)
+
+    def copy(self):
+        return list(self)
+
+# ================= BINARY DECK WRITER =================
+
+def _encode_card(card, intern):
+    if isinstance(card, str):
+        return (intern(card), _NO_STRING, _NO_STRING, _NO_STRING, _CARD_LEGACY)
+
+    ids = []
+    for field in _CARD_FIELDS:
+        value = card.get(field)
+        ids.append(intern(value) if isinstance(value, str) else _NO_STRING)
+
+    # Anything the three fixed columns can't hold round-trips as JSON
+    extra = {k: v for k, v in card.items()
+             if k not in _CARD_FIELDS or not isinstance(v, str)}
+    ids.append(intern(json.dumps(extra, ensure_ascii=False)) if extra else _NO_STRING)
+    ids.append(0)
+    return tuple(ids)
+
+def write_binary_deck(path, data, cards=None):
+    """Writes a deck dict to path in the binary format.
+
+    cards, if given, replaces data["flashcards"] and may be any iterable;
+    it is consumed once, and the meta keys in data are read afterwards.
+    """
+    if cards is None:
+        cards = data.get("flashcards", [])
+
+    strings = {}
+    blob_parts = []
+    ends = [0]
+
+    def intern(value):
+        string_id = strings.get(value)
+        if string_id is None:
+            string_id = len(strings)
+            strings[value] = string_id
+            encoded = value.encode('utf-8')
+            blob_parts.append(encoded)
+            ends.append(ends[-1] + len(encoded))
+        return string_id
+
+    index = bytearray()
+    count = 0
+    for card in cards:
+        index += _ENTRY.pack(*_encode_card(card, intern))
+        count += 1
+
+    meta = {k: v for k, v in data.items() if k != "flashcards"}
+    meta_bytes = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+    index_offset = _HEADER.size
+    strings_offset = index_offset + len(index)
+    strings_len = _COUNT.size + len(ends) * _OFFSET.size + ends[-1]
+    meta_offset = strings_offset + strings_len
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(DECK_MAGIC, DECK_FORMAT_VERSION, 0, count, index_offset,
+                             strings_offset, meta_offset, len(meta_bytes)))
+        f.write(index)
+        f.write(_COUNT.pack(len(strings)))
+        f.write(struct.pack(f"<{len(ends)}Q", *ends))
+        for part in blob_parts:
+            f.write(part)
+        f.write(meta_bytes)
+
+# ================= LOCKING =================
+
+# flock/msvcrt locks are per open file; this keeps threads of one process
+# from stepping on each other too
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+def _try_lock(f):
+    try:
+        if os.name == "nt":
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+def _unlock(f):
+    if os.name == "nt":
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def file_lock(path, timeout=LOCK_TIMEOUT):
+    """Exclusive advisory lock on path, shared across processes.
+
+    Only code that takes the same lock is kept out; plain readers are
+    not, which is fine because every writer replaces files atomically.
+    """
+    key = os.path.abspath(path)
+    with _thread_locks_guard:
+        thread_lock = _thread_locks.setdefault(key, threading.Lock())
+    if not thread_lock.acquire(timeout=timeout):
+        raise DeckLockTimeout(f"Timed out waiting for {path}{LOCK_SUFFIX}")
+    try:
+        with open(path + LOCK_SUFFIX, 'a+b') as f:
+            deadline = time.monotonic() + timeout
+            while not _try_lock(f):
+                if time.monotonic() > deadline:
+                    raise DeckLockTimeout(f"Timed out waiting for {path}{LOCK_SUFFIX}")
+                time.sleep(0.01)
+            try:
+                yield
+            finally:
+                _unlock(f)
+    finally:
+        thread_lock.release()
+
+# ================= CHANGE JOURNAL =================
+
+# Every locked write appends one line to <deck>.changes.jsonl:
+#   {"version": n, "op": "append", "start": i, "cards": [...], "signature": [mtime_ns, size]}
+#   {"version": n, "op": "replace", "count": c, "signature": [mtime_ns, size]}
+#   {"version": n, "op": "edit", "before": c, "replace": {i: card}, "remove": [i, ...],
+#    "start": i, "cards": [...], "signature": [mtime_ns, size]}
+# Entries for JSON decks written by deckstore also carry "tail", the byte
+# offset where the closing of the card list starts.
+# Readers replay appends and edits onto the cards they already hold and
+# reload on anything else. The signature is the deck file's right after the write,
+# so an edit that bypassed the journal is still noticed.
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+def last_change(path):
+    """Last complete entry of a deck's change journal, or None."""
+    try:
+        with open(path + JOURNAL_SUFFIX, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            block = b""
+            position = end
+            while position > 0:
+                step = min(64 * 1024, position)
+                position -= step
+                f.seek(position)
+                block = f.read(step) + block
+                lines = block.rstrip(b"\n").split(b"\n")
+                if len(lines) > 1 or position == 0:
+                    return json.loads(lines[-1]) if lines[-1] else None
+    except (OSError, ValueError):
+        return None
+    return None
+
+def deck_version(path):
+    """Version of the deck at path; 0 if it was never written with a lock."""
+    entry = last_change(path)
+    return entry["version"] if entry else 0
+
+def deck_stamp(path):
+    """(version, stamp): the stamp changes with every write, including ones that skipped the lock."""
+    version = deck_version(path)
+    mtime_ns, size = _file_signature(path) if os.path.exists(path) else (0, 0)
+    return version, f"{version}:{mtime_ns}:{size}"
+
+def _journal(path, entry):
+    journal_path = path + JOURNAL_SUFFIX
+    if entry.get("tail") is None:
+        entry.pop("tail", None)
+    entry["signature"] = _file_signature(path)
+    line = json.dumps(entry, ensure_ascii=False) + "\n"
+
+    size = os.path.getsize(journal_path) if os.path.exists(journal_path) else 0
+    if size + len(line) <= JOURNAL_MAX_BYTES:
+        with open(journal_path, 'a', encoding='utf-8') as f:
+            f.write(line)
+        return
+
+    # Start over with one entry; followers see a new file and reload once
+    compacted = {"version": entry["version"], "op": "replace", "count": _entry_count(entry),
+                 "signature": entry["signature"]}
+    if "tail" in entry:
+        compacted["tail"] = entry["tail"]
+    tmp_path = journal_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(compacted) + "\n")
+    os.replace(tmp_path, journal_path)
+
+def _entry_count(entry):
+    """Number of cards in the deck right after the write a journal entry records."""
+    return entry["count"] if entry["op"] == "replace" else entry["start"] + len(entry["cards"])
+
+# ================= LOAD / SAVE =================
+
+def load_deck(path, lazy=False):
+    """Loads a deck in either format.
+
+    JSON decks come back exactly as json.load returns them, or with a
+    JsonDeckView of their cards if lazy. Binary decks come back as their
+    meta keys plus a lazy DeckView under "flashcards".
+    """
+    if is_binary_deck(path) or lazy:
+        view = DeckView(path) if is_binary_deck(path) else JsonDeckView(path)
+        data = dict(view.meta)
+        data["flashcards"] = view
+        return data
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _json_tail(path, data):
+    """Byte offset where the closing of a freshly dumped JSON deck's card list starts, or None."""
+    if not data.get("flashcards") or list(data)[-1] != "flashcards":
+        return None
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - 16))
+        end = f.read()
+    match = _JSON_CLOSE.search(end)
+    return size - len(end) + match.start() if match else None
+
+def _write_deck(path, data):
+    """Writes data to path through a temporary file. Returns the JSON tail offset, or None."""
+    binary = is_binary_deck(path) if os.path.exists(path) else path.endswith(BINARY_EXTENSION)
+    tmp_path = f"{path}.tmp"
+    tail = None
+
+    if binary:
+        write_binary_deck(tmp_path, data)
+    else:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(_as_json(data), f, indent=4)
+        tail = _json_tail(tmp_path, data)
+
+    cards = data.get("flashcards")
+    if isinstance(cards, (DeckView, JsonDeckView)) and os.path.abspath(cards.path) == os.path.abspath(path):
+        cards.close()
+        os.replace(tmp_path, path)
+        cards.reload()
+    else:
+        os.replace(tmp_path, path)
+    return tail
+
+def _append_json(path, tail, cards):
+    """Copies a JSON deck up to its tail, then the new cards and the old closing. Returns the new tail."""
+    tmp_path = f"{path}.tmp"
+    with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+        left = tail
+        while left:
+            block = src.read(min(_STREAM_BLOCK, left))
+            if not block:
+                raise ValueError(f"{path} is shorter than its journal says")
+            dst.write(block)
+            left -= len(block)
+        closing = src.read()
+        if not _JSON_CLOSE.match(closing):
+            raise ValueError(f"{path} does not end where its journal says")
+        newline = b"\r\n" if closing.startswith(b"\r") else b"\n"
+        indent = newline + b"        "
+        for card in cards:
+            # The same bytes json.dump(indent=4) writes for a card in the list
+            dst.write(b"," + indent + json.dumps(card, indent=4).encode('ascii').replace(b"\n", indent))
+        new_tail = dst.tell()
+        dst.write(closing)
+    os.replace(tmp_path, path)
+    return new_tail
+
+@contextmanager
+def _loaded(path):
+    """The deck at path (or an empty one) for a locked write; closes the view a binary deck opens."""
+    data = load_deck(path) if os.path.exists(path) else {"flashcards": []}
+    view = data.get("flashcards")
+    try:
+        yield data
+    finally:
+        if isinstance(view, (DeckView, JsonDeckView)):
+            view.close()
+
+def _check_version(path, expected_version):
+    current = deck_version(path)
+    if expected_version is not None and expected_version != current:
+        raise DeckConflictError(path, expected_version, current)
+    return current
+
+def save_deck(path, data, expected_version=None):
+    """Saves a deck, keeping whatever format the file already has.
+
+    New files are binary if they use the binary extension, JSON otherwise.
+    With expected_version, raises DeckConflictError instead of overwriting
+    a deck someone else changed since that version. Returns the new version.
+    """
+    with file_lock(path):
+        version = _check_version(path, expected_version) + 1
+        tail = _write_deck(path, data)
+        _journal(path, {"version": version, "op": "replace",
+                        "count": len(data.get("flashcards", [])), "tail": tail})
+
+    for listener in _save_listeners:
+        listener(path)
+    return version
+
+def update_deck(path, change, expected_version=None):
+    """Read-modify-write under the deck lock, so no other writer's change is lost.
+
+    change(data) edits the freshly loaded deck in place. Returns the new version.
+    """
+    with file_lock(path), _loaded(path) as data:
+        version = _check_version(path, expected_version) + 1
+        change(data)
+        tail = _write_deck(path, data)
+        _journal(path, {"version": version, "op": "replace",
+                        "count": len(data.get("flashcards", [])), "tail": tail})
+
+    for listener in _save_listeners:
+        listener(path)
+    return version
+
+def append_cards(path, cards, expected_version=None):
+    """Appends cards to the deck on disk. Returns the new version.
+
+    Readers following the journal pick the cards up without reloading.
+    A JSON deck last written by deckstore is copied up to the end of its
+    cards rather than parsed and re-encoded.
+    """
+    return _append_cards(path, cards, expected_version)[0]
+
+def _append_cards(path, cards, expected_version=None):
+    """append_cards, returning (new version, position of the first appended card)."""
+    cards = list(cards)
+    with file_lock(path):
+        version = _check_version(path, expected_version) + 1
+        entry = last_change(path) if cards and os.path.exists(path) else None
+        if entry and entry.get("tail") and entry["signature"] == _file_signature(path):
+            start = _entry_count(entry)
+            tail = _append_json(path, entry["tail"], cards)
+        else:
+            with _loaded(path) as data:
+                data.setdefault("flashcards", [])
+                start = len(data["flashcards"])
+                data["flashcards"].extend(cards)
+                tail = _write_deck(path, data)
+        _journal(path, {"version": version, "op": "append", "start": start, "cards": cards, "tail": tail})
+
+    for listener in _save_listeners:
+        listener(path)
+    return version, start
+
+def edit_cards(path, plan, expected_version=None):
+    """Replaces, removes and appends cards in one locked write. Returns the new version.
+
+    plan(cards) gets the cards on disk and returns (replace, remove, append):
+    a {index: card} dict, an iterable of indices and a list of new cards.
+    Replacements apply first, then removals, then the appends. Readers
+    following the journal replay the edit instead of reloading the deck.
+    """
+    with file_lock(path), _loaded(path) as data:
+        version = _check_version(path, expected_version) + 1
+        cards = list(data.get("flashcards", []))
+        replace, remove, append = plan(cards)
+        before = len(cards)
+        for i, card in replace.items():
+            cards[i] = card
+        remove = sorted(set(remove))
+        for i in reversed(remove):
+            del cards[i]
+        start = len(cards)
+        cards.extend(append)
+        data["flashcards"] = cards
+        tail = _write_deck(path, data)
+        _journal(path, {"version": version, "op": "edit", "before": before,
+                        "replace": {str(i): card for i, card in replace.items()},
+                        "remove": remove, "start": start, "cards": list(append), "tail": tail})
+
+    for listener in _save_listeners:
+        listener(path)
+    return version
+
+def add_save_listener(listener):
+    """Registers listener(path) to run after each locked write in this process."""
+    _save_listeners.append(listener)
+
+def _as_json(data):
+    cards = data.get("flashcards")
+    if isinstance(cards, (DeckView, JsonDeckView)):
+        data = dict(data)
+        data["flashcards"] = list(cards)
+    return data
+
+# ================= STREAMING =================
+
+_STREAM_BLOCK = 1024 * 1024
+_json_decoder = json.JSONDecoder()
+
+class _JsonStream:
+    """Buffered reader that decodes one JSON value at a time from a file."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.dropped = 0  # Characters before buf
+
+    def _fill(self):
+        block = self.f.read(_STREAM_BLOCK)
+        if not block:
+            self.eof = True
+        self.dropped += self.pos
+        self.buf = self.buf[self.pos:] + block
+        self.pos = 0
+
+    def tell(self):
+        return self.dropped + self.pos
+
+    def peek(self):
+        """Next non-whitespace character, without consuming it ('' at end of file)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self._fill()
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} in deck at character {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _json_decoder.raw_decode(self.buf, self.pos)
+                # A number could still continue in the next block
+                if end < len(self.buf) or self.eof or not isinstance(value, (int, float)):
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self._fill()
+
+def iter_cards(path, meta=None):
+    """Yields a deck's cards one at a time, in constant memory for either format.
+
+    Other top-level keys are stored into meta (if given) as they are met;
+    for JSON decks the ones after "flashcards" arrive once iteration ends.
+    """
+    if is_binary_deck(path):
+        view = DeckView(path)
+        try:
+            if meta is not None:
+                meta.update(view.meta)
+            yield from view
+        finally:
+            view.close()
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        stream = _JsonStream(f)
+        stream.expect("{")
+        while stream.peek() not in ("}", ""):
+            key = stream.value()
+            stream.expect(":")
+            if key != "flashcards":
+                value = stream.value()
+                if meta is not None:
+                    meta[key] = value
+            else:
+                stream.expect("[")
+                while stream.peek() != "]":
+                    yield stream.value()
+                    if stream.peek() == ",":
+                        stream.pos += 1
+                stream.expect("]")
+            if stream.peek() == ",":
+                stream.pos += 1
+
+# ================= LAZY JSON DECKS =================
+
+class JsonDeckView(Sequence):
+    """Read-only view of a JSON deck's cards, each read from disk when accessed.
+
+    Opening scans the file once and keeps only where each card starts, so
+    a million-card deck costs 8 MB instead of the gigabyte or so json.load
+    takes. Like DeckView, cards appended in memory are kept separately.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._appended = []
+        self._file = None
+        self._read_lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        # Latin-1 maps each byte to one character, so stream positions are byte
+        # offsets; UTF-8 never puts a quote or backslash inside a multibyte character
+        offsets = array('Q')
+        meta_spans = {}
+        with open(self.path, 'r', encoding='latin-1', newline='') as f:
+            stream = _JsonStream(f)
+            stream.expect("{")
+            while stream.peek() not in ("}", ""):
+                key = stream.value()
+                stream.expect(":")
+                stream.peek()
+                start = stream.tell()
+                if key != "flashcards":
+                    stream.value()
+                    meta_spans[key] = (start, stream.tell())
+                else:
+                    stream.expect("[")
+                    while stream.peek() != "]":
+                        offsets.append(stream.tell())
+                        stream.value()
+                        if stream.peek() == ",":
+                            stream.pos += 1
+                    offsets.append(stream.tell())
+                    stream.expect("]")
+                if stream.peek() == ",":
+                    stream.pos += 1
+        if not offsets:
+            offsets.append(0)
+
+        self._offsets = offsets
+        self._file = open(self.path, 'rb')
+        self.meta = {key: self._read(start, end) for key, (start, end) in meta_spans.items()}
+
+    def _read(self, start, end):
+        with self._read_lock:
+            self._file.seek(start)
+            raw = self._file.read(end - start)
+        return json.loads(raw.decode('utf-8').rstrip().rstrip(","))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def reload(self):
+        """Rescans the file after it was rewritten and drops pending appends."""
+        self.close()
+        self._appended = []
+        self._open()
+
+    def __len__(self):
+        return len(self._offsets) - 1 + len(self._appended)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("card index out of range")
+        count = len(self._offsets) - 1
+        if i >= count:
+            return self._appended[i - count]
+        return self._read(self._offsets[i], self._offsets[i + 1])
+
+    def append(self, card):
+        self._appended.append(card)
+
+    def extend(self, cards):
+        self._appended.extend(cards)
+
+    def copy(self):
+        return list(self)
+
+def _write_json_stream(path, cards, meta):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{\n    "flashcards": [')
+        for i, card in enumerate(cards):
+            f.write(("\n        " if i == 0 else ",\n        ") + json.dumps(card))
+        f.write("\n    ]")
+        for key, value in meta.items():
+            if key != "flashcards":
+                f.write(f",\n    {json.dumps(key)}: {json.dumps(value)}")
+        f.write("\n}\n")
+
+def save_deck_stream(path, cards, meta=None):
+    """Writes a deck from an iterable of cards without holding them all.
+
+    meta holds the other top-level keys and is only read after cards is
+    exhausted, so it can be the dict iter_cards fills. cards may itself
+    be reading the deck at path: the new file replaces it only at the end.
+    Binary output still keeps its string table in memory. Returns the
+    number of cards written.
+    """
+    meta = {} if meta is None else meta
+    count = 0
+
+    def counted():
+        nonlocal count
+        for card in cards:
+            count += 1
+            yield card
+
+    with file_lock(path):
+        version = deck_version(path) + 1
+        binary = is_binary_deck(path) if os.path.exists(path) else path.endswith(BINARY_EXTENSION)
+        tmp_path = f"{path}.tmp"
+        if binary:
+            write_binary_deck(tmp_path, meta, cards=counted())
+        else:
+            _write_json_stream(tmp_path, counted(), meta)
+        os.replace(tmp_path, path)
+        _journal(path, {"version": version, "op": "replace", "count": count})
+    return count
+
+# ================= SHARED DECK =================
+
+class SharedDeck:
+    """A deck held in memory and kept in step with other processes' writes.
+
+    refresh() is cheap when nothing changed (two stats). Cards appended
+    elsewhere through append_cards, and edits made through edit_cards, are
+    read from the change journal and applied to .data without reloading
+    the deck; anything else reloads it. With lazy (default: DECK_LOW_MEMORY)
+    JSON decks' cards stay on disk in a JsonDeckView.
+    """
+
+    def __init__(self, path, lazy=None):
+        self.path = path
+        self.lazy = LOW_MEMORY if lazy is None else lazy
+        self.lock = threading.Lock()
+        self.data = None
+        self.version = 0
+        self._journal_id = None
+        self._journal_offset = 0
+        self._signature = None
+        self._load()
+
+    def _journal_stat(self):
+        try:
+            stat = os.stat(self.path + JOURNAL_SUFFIX)
+            return stat.st_ino, stat.st_size
+        except OSError:
+            return None, 0
+
+    def _load(self):
+        # Note the journal position first: changes made while loading are
+        # replayed (or trigger a reload) on the next refresh, never lost
+        self._journal_id, self._journal_offset = self._journal_stat()
+        self.version = deck_version(self.path)
+        self.data = load_deck(self.path, self.lazy)
+        self.data.setdefault("flashcards", [])
+        self._signature = _file_signature(self.path)
+
+    @property
+    def cards(self):
+        return self.data["flashcards"]
+
+    def refresh(self):
+        """Catches up with the file. Returns (new_cards, reloaded)."""
+        with self.lock:
+            journal_id, journal_size = self._journal_stat()
+            try:
+                signature = _file_signature(self.path)
+            except OSError:
+                return [], False
+            if (journal_id, journal_size) == (self._journal_id, self._journal_offset):
+                if signature == self._signature:
+                    return [], False
+                self._load()
+                return self.cards, True
+            if journal_id != self._journal_id or journal_size < self._journal_offset:
+                self._load()
+                return self.cards, True
+
+            with open(self.path + JOURNAL_SUFFIX, 'rb') as f:
+                f.seek(self._journal_offset)
+                chunk = f.read(journal_size - self._journal_offset)
+            complete = chunk[:chunk.rfind(b"\n") + 1]
+
+            new_cards = []
+            edited = False
+            for line in complete.splitlines():
+                entry = json.loads(line)
+                if entry["op"] == "edit":
+                    # Binary decks are memory-mapped and reopen cheaply; JSON ones are edited in hand
+                    if not isinstance(self.cards, list) or entry["before"] != len(self.cards):
+                        self._load()
+                        return self.cards, True
+                    # Edited in a copy that is swapped in whole; other threads read .cards unlocked
+                    cards = list(self.cards)
+                    for i, card in entry["replace"].items():
+                        cards[int(i)] = card
+                    for i in reversed(entry["remove"]):
+                        del cards[i]
+                    cards.extend(entry["cards"])
+                    self.data["flashcards"] = cards
+                    edited = True
+                elif entry["op"] != "append" or entry["start"] != len(self.cards):
+                    self._load()
+                    return self.cards, True
+                else:
+                    self.cards.extend(entry["cards"])
+                new_cards.extend(entry["cards"])
+                self.version = entry["version"]
+                self._signature = entry["signature"]
+
+            self._journal_offset += len(complete)
+            if complete and signature != self._signature:
+                # Edited since the last journaled write by something that skipped the lock
+                self._load()
+                return self.cards, True
+            if edited:
+                return self.cards, True
+            return new_cards, False
+
+    def append(self, cards):
+        """Appends cards on disk; they reach .data on the next refresh().
+
+        Returns the position of the first one, read under the deck lock, so
+        it is right even when other processes append at the same time.
+        """
+        return _append_cards(self.path, cards)[1]
+
+def convert_deck(src, dst):
+    """Converts src to dst; the output format follows dst's extension."""
+    data = load_deck(src)
+    if dst.endswith(BINARY_EXTENSION):
+        write_binary_deck(dst, data)
+    else:
+        with open(dst, 'w', encoding='utf-8') as f:
+            json.dump(_as_json(data), f, indent=4)
+    return len(data.get("flashcards", []))
+
+# ================= CLI =================
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != "convert":
+        print(f"Usage: python deckstore.py convert <source> <destination{BINARY_EXTENSION}|.json>")
+        sys.exit(1)
+
+    count = convert_deck(sys.argv[2], sys.argv[3])
+    print(f"Converted {count} cards from {sys.argv[2]} to {sys.argv[3]}.")
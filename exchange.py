@@ -0,0 +1,261 @@
+import os
+import re
+import sys
+import csv
+import html
+import time
+import sqlite3
+import zipfile
+import tempfile
+import importlib.util
+from itertools import chain
+
+from deckstore import iter_cards, save_deck_stream
+from quiz_policy import QuizPolicy, card_key
+
+# ================= CONFIGURATION =================
+
+# Deck fields first, then up to three cached MC distractors
+COLUMNS = ("question", "textbook_answer", "textbook_location", "distractor_1", "distractor_2", "distractor_3")
+ANKI_COLUMNS = ("Front", "Back", "Location", "Distractor 1", "Distractor 2", "Distractor 3")
+
+PROGRESS_EVERY = 50000  # Rows between progress lines
+
+# Anki card answers can be long; the csv module's default field limit is 128 KB
+csv.field_size_limit(2 ** 30)
+
+# Stable IDs for the note type and deck written to .apkg files
+ANKI_MODEL_ID = 1607392319
+ANKI_DECK_ID = 2059400110
+
+TAG_RE = re.compile(r"<[^>]+>")
+
+def format_for(path):
+    """csv, tsv, anki (Anki's plain-text notes) or apkg, from the extension."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return "csv"
+    if ext == ".tsv":
+        return "tsv"
+    if ext == ".txt":
+        return "anki"
+    if ext == ".apkg":
+        return "apkg"
+    raise ValueError(f"Unsupported file type '{ext}' (use .csv, .tsv, .txt for Anki text or .apkg)")
+
+# ================= PROGRESS =================
+
+def with_progress(rows, label):
+    """Passes rows through, printing the count and rows/s as they go."""
+    start = time.perf_counter()
+    count = 0
+    for row in rows:
+        count += 1
+        if count % PROGRESS_EVERY == 0:
+            print(f"{label}: {count} rows, {count / (time.perf_counter() - start):,.0f} rows/s", flush=True)
+        yield row
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {count} rows in {elapsed:.2f}s ({count / elapsed if elapsed else 0:,.0f} rows/s)")
+
+# ================= CARDS <-> ROWS =================
+
+def card_to_row(card, distractor_cache=None):
+    if isinstance(card, str):
+        question, answer, location = card, "", ""
+    else:
+        question = card.get("question", "")
+        answer = card.get("textbook_answer", "")
+        location = card.get("textbook_location", "")
+
+    distractors = []
+    if distractor_cache is not None:
+        items = distractor_cache.get(card_key(question, answer), {}).get("MC")
+        if items:
+            distractors = [str(d) for d in items[-1]["distractors"][:3]]
+    return [question, answer, location] + distractors + [""] * (3 - len(distractors))
+
+def row_to_card(row):
+    """(card, distractors) from a row in COLUMNS order; None for rows without a question."""
+    row = [str(value).strip() for value in row] + [""] * (len(COLUMNS) - len(row))
+    question, answer, location = row[:3]
+    if not question:
+        return None
+    card = {"question": question, "textbook_answer": answer}
+    if location:
+        card["textbook_location"] = location
+    return card, [d for d in row[3:6] if d]
+
+def plain_text(field):
+    """Anki fields are HTML; decks here hold plain text."""
+    return html.unescape(TAG_RE.sub("", field.replace("<br>", "\n").replace("<br/>", "\n")))
+
+# ================= READERS =================
+
+def read_delimited(path, delimiter):
+    """Rows of a CSV/TSV file. A header row naming the deck fields is skipped."""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        for i, row in enumerate(reader):
+            if i == 0 and row and row[0].strip().lower() in ("question", "front"):
+                continue
+            yield row
+
+def read_anki_text(path):
+    """Rows of an Anki plain-text export; '#key:value' header lines are honoured."""
+    separator = "\t"
+    is_html = True  # Anki's default when the file doesn't say
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        # Headers only appear at the top; read them before handing the rest to csv
+        position = f.tell()
+        line = f.readline()
+        while line.startswith("#"):
+            key, _, value = line[1:].rstrip("\r\n").partition(":")
+            if key == "separator":
+                separator = {"tab": "\t", "comma": ",", "semicolon": ";", "pipe": "|",
+                             "space": " "}.get(value.lower(), value)
+            elif key == "html":
+                is_html = value.lower() == "true"
+            position = f.tell()
+            line = f.readline()
+        f.seek(position)
+        for row in csv.reader(f, delimiter=separator):
+            yield [plain_text(value) for value in row] if is_html else row
+
+def read_apkg(path):
+    """Rows of an Anki package: the first fields of each note, as plain text."""
+    with zipfile.ZipFile(path) as package, tempfile.TemporaryDirectory() as tmp:
+        names = package.namelist()
+        # Newer Anki versions write collection.anki21 next to a stub collection.anki2
+        name = "collection.anki21" if "collection.anki21" in names else "collection.anki2"
+        if name not in names:
+            raise ValueError(f"{path} has no Anki collection (collection.anki21b packages are not supported)")
+        database = package.extract(name, tmp)
+        connection = sqlite3.connect(database)
+        try:
+            for (fields,) in connection.execute("SELECT flds FROM notes ORDER BY id"):
+                yield [plain_text(value) for value in fields.split("\x1f")]
+        finally:
+            connection.close()
+
+def read_rows(path):
+    fmt = format_for(path)
+    if fmt == "csv":
+        return read_delimited(path, ",")
+    if fmt == "tsv":
+        return read_delimited(path, "\t")
+    if fmt == "anki":
+        return read_anki_text(path)
+    return read_apkg(path)
+
+# ================= WRITERS =================
+
+def write_delimited(path, rows, delimiter):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, delimiter=delimiter)
+        writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow(row)
+
+def write_anki_text(path, rows, deck_name):
+    """Anki's plain-text notes format; File > Import reads the headers and maps the columns."""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write("#separator:tab\n#html:false\n#notetype:Basic\n")
+        f.write(f"#deck:{deck_name}\n#columns:" + "\t".join(ANKI_COLUMNS) + "\n")
+        writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+        for row in rows:
+            writer.writerow(row)
+
+def write_apkg(path, rows, deck_name):
+    """Anki package via genanki (optional dependency).
+
+    genanki builds the whole package in memory, so unlike the other
+    formats this one is not constant-memory.
+    """
+    if importlib.util.find_spec("genanki") is None:
+        raise RuntimeError("Exporting .apkg needs genanki (pip install genanki); "
+                           "or export .txt, which Anki imports directly.")
+    import genanki
+
+    model = genanki.Model(
+        ANKI_MODEL_ID, "Flashcard (textbook)",
+        fields=[{"name": name} for name in ANKI_COLUMNS],
+        templates=[{
+            "name": "Card 1",
+            "qfmt": "{{Front}}",
+            "afmt": "{{FrontSide}}<hr id=answer>{{Back}}<br><br><i>{{Location}}</i>",
+        }])
+    deck = genanki.Deck(ANKI_DECK_ID, deck_name)
+    for row in rows:
+        deck.add_note(genanki.Note(model=model, fields=[html.escape(value) for value in row]))
+    genanki.Package(deck).write_to_file(path)
+
+# ================= EXPORT / IMPORT =================
+
+def export_deck(deck_path, out_path, distractors=True):
+    """Streams a deck to out_path in the format of its extension. Returns the row count."""
+    fmt = format_for(out_path)
+    cache = QuizPolicy().cache if distractors else None
+    deck_name = os.path.splitext(os.path.basename(deck_path))[0]
+
+    count = 0
+    def rows():
+        nonlocal count
+        for card in with_progress(iter_cards(deck_path), f"Exporting {deck_path}"):
+            count += 1
+            yield card_to_row(card, cache)
+
+    if fmt == "csv":
+        write_delimited(out_path, rows(), ",")
+    elif fmt == "tsv":
+        write_delimited(out_path, rows(), "\t")
+    elif fmt == "anki":
+        write_anki_text(out_path, rows(), deck_name)
+    else:
+        write_apkg(out_path, rows(), deck_name)
+    return count
+
+def import_cards(src_path, deck_path):
+    """Streams cards from src_path onto the end of deck_path. Returns how many were added.
+
+    The deck is rewritten through the deck lock with its existing cards
+    streamed ahead of the new ones, so memory stays flat for JSON decks.
+    Distractor columns go into the quiz cache for MC items.
+    """
+    policy = QuizPolicy()
+    added = 0
+
+    def new_cards():
+        nonlocal added
+        for row in with_progress(read_rows(src_path), f"Importing {src_path}"):
+            parsed = row_to_card(row)
+            if parsed is None:
+                continue
+            card, distractors = parsed
+            if distractors:
+                policy.add_item(card["question"], card["textbook_answer"], "MC", {"distractors": distractors})
+            added += 1
+            yield card
+
+    meta = {}
+    existing = iter_cards(deck_path, meta) if os.path.exists(deck_path) else iter(())
+    save_deck_stream(deck_path, chain(existing, new_cards()), meta)
+    return added
+
+# ================= CLI =================
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ("export", "import"):
+        print("Usage: python exchange.py export <deck> <out.csv|.tsv|.txt|.apkg>")
+        print("       python exchange.py import <in.csv|.tsv|.txt|.apkg> <deck>")
+        sys.exit(1)
+
+    try:
+        if sys.argv[1] == "export":
+            count = export_deck(sys.argv[2], sys.argv[3])
+            print(f"Exported {count} cards from {sys.argv[2]} to {sys.argv[3]}.")
+        else:
+            count = import_cards(sys.argv[2], sys.argv[3])
+            print(f"Imported {count} cards from {sys.argv[2]} into {sys.argv[3]}.")
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
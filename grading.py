@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import uuid
+import queue
+import threading
+
+from prompts import build_batch_prompt
+import profiler
+
+# ================= CONFIGURATION =================
+
+# Journal of submitted answers and their grades, one JSON object per line.
+# Answers are on disk before submit() returns, so a crash or Ctrl+C loses
+# nothing: ungraded answers are picked up again on the next start.
+GRADING_QUEUE_FILE = os.getenv("GRADING_QUEUE_FILE", "grading_queue.jsonl")
+GRADING_JOURNAL_MAX_BYTES = 1024 * 1024  # Rewritten with only pending answers past this
+
+GRADING_WORKERS = int(os.getenv("GRADING_WORKERS", "3"))
+GRADE_BATCH_SIZE = int(os.getenv("GRADE_BATCH_SIZE", "5"))
+
+# A worker holding fewer than GRADE_BATCH_SIZE answers waits this long for more
+BATCH_WAIT_SECONDS = 2.0
+
+# Failed batches are retried; an answer gets this many tries before it is
+# reported as ungradable
+GRADE_MAX_ATTEMPTS = 3
+RETRY_DELAY_SECONDS = 2.0
+
+# ================= PROVIDER =================
+
+def grade_batch_llm(items, ask):
+    """Grades several answers in one LLM call with the GRADE rubric.
+
+    ask(system_prompt, user_prompt) is the calling app's own provider call
+    and returns the parsed JSON reply or None. Returns one {"correct",
+    "feedback"} per item, or None where the reply left an item out; None
+    for the whole batch if the call failed.
+    """
+    system_prompt, user_prompt = build_batch_prompt("GRADE", [
+        {"question": i["question"], "answer": i["textbook_answer"], "user_answer": i["user_answer"]}
+        for i in items])
+    reply = ask(system_prompt, user_prompt)
+    if not reply or not isinstance(reply.get("grades"), list):
+        return None
+
+    grades = [None] * len(items)
+    for grade in reply["grades"]:
+        if not isinstance(grade, dict):
+            continue
+        try:
+            number = int(grade.get("item"))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= number <= len(items) and isinstance(grade.get("correct"), bool):
+            grades[number - 1] = {"correct": grade["correct"], "feedback": str(grade.get("feedback", ""))}
+    return grades
+
+# ================= QUEUE =================
+
+class GradingQueue:
+    """Durable queue of free-text answers graded in batches by a worker pool.
+
+    submit() returns at once. Workers take up to batch_size answers at a
+    time, grade them with one call to grade_batch(items) and hand each
+    result to on_result(result) and to the results queue as soon as its
+    batch finishes. A result is the submitted item plus "correct" (True,
+    False or None if it could not be graded) and "feedback".
+    """
+
+    def __init__(self, grade_batch, path=GRADING_QUEUE_FILE, workers=GRADING_WORKERS,
+                 batch_size=GRADE_BATCH_SIZE, on_result=None):
+        self.path = path
+        self.grade_batch = grade_batch
+        self.workers = workers
+        self.batch_size = batch_size
+        self.on_result = on_result
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+        self.todo = queue.Queue()
+        self.pending = {}            # id -> item, submitted and not yet graded
+        self.done = threading.Condition(self.lock)
+        self.stopping = threading.Event()
+        self.threads = []
+        self.counters = {"submitted": 0, "graded": 0, "failed": 0, "calls": 0, "retries": 0}
+
+    # ---------------- Journal ----------------
+
+    def _write(self, entries):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _recover(self):
+        """Answers submitted in earlier runs that never got a grade."""
+        pending = {}
+        if not os.path.exists(self.path):
+            return pending
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short by a crash
+                if entry.get("op") == "submit":
+                    pending[entry["id"]] = entry["item"]
+                elif entry.get("op") == "result":
+                    pending.pop(entry["id"], None)
+
+        if os.path.getsize(self.path) > GRADING_JOURNAL_MAX_BYTES:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for item_id, item in pending.items():
+                    f.write(json.dumps({"op": "submit", "id": item_id, "item": item}, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+        return pending
+
+    # ---------------- Public API ----------------
+
+    def start(self):
+        """Requeues answers left from earlier runs and starts the workers. Returns how many were left."""
+        recovered = self._recover()
+        with self.lock:
+            self.pending.update(recovered)
+        for item_id, item in recovered.items():
+            self.todo.put((item_id, 0))
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"grader-{n}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return len(recovered)
+
+    def submit(self, question, textbook_answer, user_answer, **extra):
+        """Queues one answer for grading and returns its ID. Written to disk first."""
+        item_id = uuid.uuid4().hex
+        item = dict(extra, question=question, textbook_answer=textbook_answer,
+                    user_answer=user_answer, submitted=time.time())
+        with self.lock:
+            self._write([{"op": "submit", "id": item_id, "item": item}])
+            self.pending[item_id] = item
+            self.counters["submitted"] += 1
+        self.todo.put((item_id, 0))
+        return item_id
+
+    def outstanding(self):
+        with self.lock:
+            return len(self.pending)
+
+    def wait(self, timeout=None):
+        """Blocks until every submitted answer has a result. False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            while self.pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.done.wait(remaining)
+        return True
+
+    def stop(self):
+        """Stops the workers after their current batch; ungraded answers stay in the journal."""
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join()
+
+    def report(self):
+        with self.lock:
+            report = dict(self.counters, pending=len(self.pending))
+        report["answers_per_call"] = round(report["graded"] / report["calls"], 2) if report["calls"] else None
+        return report
+
+    # ---------------- Workers ----------------
+
+    def _take_batch(self):
+        """Up to batch_size (id, attempts) pairs, waiting briefly to fill the batch."""
+        try:
+            batch = [self.todo.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + BATCH_WAIT_SECONDS
+        while len(batch) < self.batch_size and not self.stopping.is_set():
+            try:
+                batch.append(self.todo.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self):
+        while not self.stopping.is_set():
+            batch = self._take_batch()
+            if not batch:
+                continue
+            with self.lock:
+                batch = [(item_id, attempts) for item_id, attempts in batch if item_id in self.pending]
+                items = [self.pending[item_id] for item_id, _ in batch]
+            if not batch:
+                continue
+
+            with profiler.traced("grading batch"), profiler.stage("llm"):
+                profiler.note(answers=len(items))
+                try:
+                    grades = self.grade_batch(items)
+                except Exception as e:
+                    print(f"Grading error: {e}")
+                    grades = None
+            with self.lock:
+                self.counters["calls"] += 1
+            if grades is None:
+                grades = [None] * len(batch)
+
+            finished, retry = [], []
+            for (item_id, attempts), item, grade in zip(batch, items, grades):
+                if grade is not None:
+                    finished.append((item_id, item, grade))
+                elif attempts + 1 < GRADE_MAX_ATTEMPTS:
+                    retry.append((item_id, attempts + 1))
+                else:
+                    finished.append((item_id, item, {"correct": None, "feedback": "Could not be graded."}))
+            self._finish(finished)
+
+            if retry:
+                with self.lock:
+                    self.counters["retries"] += len(retry)
+                # Back off so a failing provider isn't hammered, then put them back
+                self.stopping.wait(RETRY_DELAY_SECONDS)
+                for entry in retry:
+                    self.todo.put(entry)
+
+    def _finish(self, finished):
+        if not finished:
+            return
+        with self.lock:
+            self._write([{"op": "result", "id": item_id, "grade": grade} for item_id, _, grade in finished])
+            for item_id, _, grade in finished:
+                self.pending.pop(item_id, None)
+                self.counters["graded" if grade["correct"] is not None else "failed"] += 1
+            self.done.notify_all()
+        for item_id, item, grade in finished:
+            result = dict(item, id=item_id, **grade)
+            self.results.put(result)
+            if self.on_result is not None:
+                self.on_result(result)
@@ -0,0 +1,160 @@
+import os
+import gzip
+import hashlib
+import threading
+import importlib.util
+
+from flask import Response, abort, render_template, request
+
+# ================= CONFIGURATION =================
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+ASSET_ROUTE = "/assets"
+
+# Smaller bodies aren't worth the CPU or the extra header bytes
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = 6
+COMPRESSIBLE_TYPES = ("text/html", "text/css", "application/javascript", "application/json")
+
+# Hashed asset URLs never change content, so browsers may keep them for a year
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+CONTENT_TYPES = {".css": "text/css; charset=utf-8", ".js": "application/javascript; charset=utf-8"}
+
+# brotli is optional; without it only gzip is offered
+_brotli = None
+if importlib.util.find_spec("brotli") is not None:
+    import brotli as _brotli
+
+# ================= ENCODING =================
+
+def pick_encoding(accept_encoding):
+    """Best encoding this server can produce for an Accept-Encoding header, or None."""
+    offered = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        offered[name.strip().lower()] = quality
+    if _brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+def compress(body, encoding):
+    if encoding == "br":
+        return _brotli.compress(body)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+class Encoded:
+    """A response body kept in every encoding we serve, computed once."""
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self.variants = {None: body, "gzip": compress(body, "gzip")}
+        if _brotli is not None:
+            self.variants["br"] = compress(body, "br")
+
+    def respond(self, content_type, cache_control):
+        headers = {"ETag": f'"{self.etag}"', "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        # The body is fixed, so a plain If-None-Match check is all a conditional GET needs
+        if headers["ETag"] in request.headers.get("If-None-Match", ""):
+            response = Response(status=304, headers=headers)
+        else:
+            encoding = pick_encoding(request.headers.get("Accept-Encoding"))
+            if encoding:
+                headers["Content-Encoding"] = encoding
+            response = Response(self.variants[encoding], status=200, headers=headers, content_type=content_type)
+        # Already compressed; tells the after_request hook to leave it alone
+        response.precompressed = True
+        return response
+
+# ================= ASSETS =================
+
+_assets = {}         # logical name -> (hashed name, Encoded)
+_hashed = {}         # hashed name -> logical name
+_pages = {}          # template name -> Encoded
+_lock = threading.Lock()
+
+def _load_asset(name):
+    with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+        encoded = Encoded(f.read())
+    stem, ext = os.path.splitext(name)
+    hashed = f"{stem}.{encoded.etag[:10]}{ext}"
+    _assets[name] = (hashed, encoded)
+    _hashed[hashed] = name
+    return hashed
+
+def asset_url(name, reload=False):
+    """URL of a static file with its content hash in the name."""
+    with _lock:
+        if reload or name not in _assets:
+            return f"{ASSET_ROUTE}/{_load_asset(name)}"
+        return f"{ASSET_ROUTE}/{_assets[name][0]}"
+
+def cached_page(app, template):
+    """A template rendered once and served with an ETag and precompressed bodies.
+
+    Only for templates that render the same for every request. In debug
+    mode it re-renders each time so edits show up.
+    """
+    with _lock:
+        page = _pages.get(template)
+    if page is None or app.debug:
+        page = Encoded(render_template(template).encode('utf-8'))
+        with _lock:
+            _pages[template] = page
+    # Revalidate every time (cheap 304s), since the page names the current asset hashes
+    return page.respond("text/html; charset=utf-8", "no-cache")
+
+# ================= APP HOOKS =================
+
+def init_app(app):
+    """Adds the hashed asset route, asset_url() in templates and response compression."""
+
+    @app.context_processor
+    def _asset_helpers():
+        return {"asset_url": lambda name: asset_url(name, reload=app.debug)}
+
+    @app.route(f"{ASSET_ROUTE}/<path:hashed>")
+    def hashed_asset(hashed):
+        with _lock:
+            name = _hashed.get(hashed)
+            entry = _assets.get(name) if name else None
+        if entry is None or entry[0] != hashed:
+            abort(404)
+        content_type = CONTENT_TYPES.get(os.path.splitext(name)[1], "application/octet-stream")
+        return entry[1].respond(content_type, IMMUTABLE)
+
+    @app.after_request
+    def _compress_and_validate(response):
+        if getattr(response, "precompressed", False) or response.is_streamed or response.direct_passthrough:
+            return response
+        if response.status_code != 200 or "Content-Encoding" in response.headers:
+            return response
+
+        # Conditional GETs for API reads; the ETag is of the uncompressed body
+        if request.method == "GET" and response.mimetype == "application/json":
+            response.add_etag(weak=True)
+            response.headers.setdefault("Cache-Control", "no-cache")
+            response.make_conditional(request)
+            if response.status_code == 304:
+                return response
+
+        if response.mimetype not in COMPRESSIBLE_TYPES:
+            return response
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_BYTES:
+            return response
+        encoding = pick_encoding(request.headers.get("Accept-Encoding"))
+        response.vary.add("Accept-Encoding")
+        if encoding:
+            response.set_data(compress(body, encoding))
+            response.headers["Content-Encoding"] = encoding
+        return response
@@ -0,0 +1,239 @@
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from deckstore import append_cards, load_deck
+from prompts import build_prompt
+import profiler
+
+# ================= CONFIGURATION =================
+
+# Parallel LLM calls; raise it to whatever the provider's rate limit allows
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "8"))
+
+CHUNK_CHARS = 3000      # Target size of one chunk sent to the LLM
+CARDS_PER_CHUNK = 5     # Upper bound on cards requested per chunk
+FLUSH_EVERY = 10        # Finished chunks between deck + checkpoint writes
+
+# ================= CHUNKING =================
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*\S)\s*$")
+
+def split_into_chunks(text, source_name, chunk_chars=CHUNK_CHARS):
+    """Splits a text/markdown source into location-tagged chunks.
+
+    Form feeds (as left by pdftotext) start a new page, markdown headings
+    start a new section, and paragraphs are packed up to chunk_chars.
+    """
+    chunks = []
+    section = None
+
+    for page_number, page in enumerate(text.split("\f"), start=1):
+        paragraphs = []
+        size = 0
+
+        def flush():
+            nonlocal paragraphs, size
+            if paragraphs:
+                location = f"{section or source_name}, Page {page_number}"
+                body = "\n\n".join(paragraphs)
+                chunk_id = hashlib.sha1(f"{location}\n{body}".encode('utf-8')).hexdigest()[:16]
+                chunks.append({"id": chunk_id, "location": location, "text": body})
+            paragraphs = []
+            size = 0
+
+        for paragraph in re.split(r"\n\s*\n", page):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+
+            heading = HEADING_RE.match(paragraph.splitlines()[0])
+            if heading:
+                flush()
+                section = heading.group(2)
+                paragraph = "\n".join(paragraph.splitlines()[1:]).strip()
+                if not paragraph:
+                    continue
+
+            if size and size + len(paragraph) > chunk_chars:
+                flush()
+            paragraphs.append(paragraph)
+            size += len(paragraph)
+        flush()
+
+    return chunks
+
+# ================= CARD GENERATION =================
+
+def normalize_question(question):
+    return re.sub(r"[^a-z0-9]+", " ", question.lower()).strip()
+
+def generate_cards_llm(chunk, max_cards, ask):
+    """ask(system_prompt, user_prompt) is the provider call; returns the parsed JSON reply or None."""
+    system_prompt, user_prompt = build_prompt("INGEST", location=chunk["location"],
+                                              max_cards=max_cards, text=chunk["text"])
+    data = ask(system_prompt, user_prompt)
+    if not data or not isinstance(data.get("flashcards"), list):
+        return None
+    return data["flashcards"]
+
+def generate_cards_mock(chunk, max_cards):
+    """Offline stand-in for the LLM: one card per leading sentence."""
+    sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", chunk["text"]) if len(s.split()) >= 4]
+    cards = []
+    for sentence in sentences[:max_cards]:
+        topic = " ".join(sentence.split()[:4])
+        cards.append({"question": f"What does the text say about \"{topic}\"?", "textbook_answer": sentence})
+    return cards
+
+def make_cards(chunk, generator, max_cards):
+    """Runs on a worker thread. Returns (chunk, cards or None on failure)."""
+    with profiler.traced("ingest chunk"), profiler.stage("llm"):
+        profiler.note(location=chunk["location"], chars=len(chunk["text"]))
+        raw_cards = generator(chunk, max_cards)
+    if raw_cards is None:
+        return chunk, None
+
+    cards = []
+    for card in raw_cards:
+        if isinstance(card, dict) and card.get("question") and card.get("textbook_answer"):
+            cards.append({
+                "question": str(card["question"]),
+                "textbook_answer": str(card["textbook_answer"]),
+                "textbook_location": chunk["location"]
+            })
+    return chunk, cards
+
+# ================= CHECKPOINTING =================
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return set(json.load(f).get("done", []))
+    except (OSError, ValueError):
+        print(f"Warning: could not read checkpoint {path}, starting over.")
+        return set()
+
+def save_checkpoint(path, done):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"done": sorted(done)}, f)
+    os.replace(tmp_path, path)
+
+# ================= PIPELINE =================
+
+def ingest(source, deck_path, workers=INGEST_WORKERS, mock=False,
+           chunk_chars=CHUNK_CHARS, max_cards=CARDS_PER_CHUNK, checkpoint_path=None, ask=None):
+    """Generates cards for every unprocessed chunk of source into deck_path.
+
+    ask(system_prompt, user_prompt) makes the LLM call (see
+    generate_cards_llm); it is needed unless mock is set.
+
+    Cards are appended and the checkpoint advanced every FLUSH_EVERY
+    chunks, deck first, so an interrupted run loses at most that much
+    work and never skips a chunk whose cards weren't saved. Appends go
+    through the deck lock, so other writers and readers of the deck can
+    keep running alongside.
+    """
+    if not mock and ask is None:
+        raise ValueError("ingest needs an LLM call (ask) unless mock is set")
+    with open(source, 'r', encoding='utf-8') as f:
+        chunks = split_into_chunks(f.read(), os.path.basename(source), chunk_chars)
+
+    checkpoint_path = checkpoint_path or f"{source}.ingest.json"
+    done = load_checkpoint(checkpoint_path)
+    todo = [c for c in chunks if c["id"] not in done]
+    print(f"{len(chunks)} chunks in {source}, {len(chunks) - len(todo)} already done.")
+
+    data = load_deck(deck_path) if os.path.exists(deck_path) else {"flashcards": []}
+    data.setdefault("flashcards", [])
+    seen = {normalize_question(c["question"]) for c in data["flashcards"] if isinstance(c, dict) and "question" in c}
+
+    if mock:
+        generator = generate_cards_mock
+    else:
+        generator = lambda chunk, count: generate_cards_llm(chunk, count, ask)
+    added = duplicates = failed = 0
+    pending = 0
+    unsaved = []
+
+    def flush():
+        if unsaved:
+            append_cards(deck_path, unsaved)
+            unsaved.clear()
+        save_checkpoint(checkpoint_path, done)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(make_cards, chunk, generator, max_cards) for chunk in todo]
+        try:
+            for finished, future in enumerate(as_completed(futures), start=1):
+                chunk, cards = future.result()
+                if cards is None:
+                    failed += 1
+                    print(f"[{finished}/{len(todo)}] {chunk['location']}: generation failed, will retry next run")
+                    continue
+
+                new_cards = 0
+                for card in cards:
+                    key = normalize_question(card["question"])
+                    if key in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(key)
+                    unsaved.append(card)
+                    new_cards += 1
+                added += new_cards
+                done.add(chunk["id"])
+                pending += 1
+                print(f"[{finished}/{len(todo)}] {chunk['location']}: +{new_cards} cards")
+
+                if pending >= FLUSH_EVERY:
+                    flush()
+                    pending = 0
+        except KeyboardInterrupt:
+            print("\nInterrupted, saving progress...")
+            for future in futures:
+                future.cancel()
+            flush()
+            raise
+
+    flush()
+    print(f"\nAdded {added} cards to {deck_path} ({duplicates} duplicates skipped, {failed} chunks failed).")
+    return added
+
+# ================= CLI =================
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate flashcards from a text or markdown source.")
+    parser.add_argument("source", help="Text/markdown file; form feeds mark page breaks")
+    parser.add_argument("--deck", default="data.json", help="Deck to append to (default: data.json)")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS)
+    parser.add_argument("--chunk-chars", type=int, default=CHUNK_CHARS)
+    parser.add_argument("--cards-per-chunk", type=int, default=CARDS_PER_CHUNK)
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <source>.ingest.json)")
+    parser.add_argument("--mock", action="store_true", help="Generate cards locally instead of calling the LLM")
+    args = parser.parse_args()
+    profiler.start()
+
+    ask = None
+    if not args.mock:
+        # aiTest's provider call: the same .env settings, and no quiz state built on import
+        from aiTest import get_llm_json_response, validate_config
+        validate_config()
+        ask = get_llm_json_response
+
+    try:
+        ingest(args.source, args.deck, workers=args.workers, mock=args.mock,
+               chunk_chars=args.chunk_chars, max_cards=args.cards_per_chunk,
+               checkpoint_path=args.checkpoint, ask=ask)
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+if __name__ == "__main__":
+    main()
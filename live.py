@@ -0,0 +1,164 @@
+import os
+import json
+import queue
+import threading
+
+# ================= CONFIGURATION =================
+
+# Messages a client may fall behind by before its pending diffs are
+# dropped and it gets a fresh snapshot instead
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "16"))
+
+# Open streams per process; more get a 503 and the page falls back to polling
+LIVE_MAX_CLIENTS = int(os.getenv("LIVE_MAX_CLIENTS", "200"))
+
+# Idle streams send a comment this often, which also notices dropped
+# connections and leaderboard writes made by other processes
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+
+# Browsers reconnect after this long if the stream drops
+RETRY_MS = 3000
+
+def sse(event, data):
+    """One server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def diff_boards(old, new):
+    """[[rank, entry], ...] for the ranks whose entry changed."""
+    return [[rank, entry] for rank, entry in enumerate(new) if rank >= len(old) or old[rank] != entry]
+
+# ================= SUBSCRIBERS =================
+
+class Subscriber:
+    """One open stream, following one room."""
+
+    def __init__(self, room):
+        self.room = room
+        self.queue = queue.Queue(maxsize=LIVE_QUEUE_SIZE)
+
+    def offer(self, message):
+        """Queues a message without ever blocking the publisher.
+
+        A full queue means the client isn't reading; its backlog is
+        dropped and a None tells the stream to send a snapshot instead.
+        """
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except queue.Full:
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait(None)
+            return False
+
+# ================= BOARD =================
+
+class LiveBoard:
+    """Pushes leaderboard changes to open streams, one room per deck.
+
+    read_entries() returns the stored leaderboard and top(entries, room)
+    the ranked list for a room ("" is the overall board). After each
+    write, publish() recomputes the board of every room someone is
+    watching and sends a diff only to rooms whose board changed. path is
+    the leaderboard file, watched on heartbeats for other processes' writes.
+    """
+
+    def __init__(self, read_entries, top, path=None):
+        self.read_entries = read_entries
+        self.top = top
+        self.path = path
+        self.lock = threading.Lock()
+        self.rooms = {}          # room -> set of Subscriber
+        self.boards = {}         # room -> (version, entries), for watched rooms
+        self.signature = self._signature()
+        self.counters = {"published": 0, "unchanged": 0, "resyncs": 0, "rejected": 0}
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path) if self.path else None
+        except OSError:
+            return None
+        return stat and (stat.st_mtime_ns, stat.st_size)
+
+    def subscribe(self, room):
+        """A new Subscriber for room, or None when at LIVE_MAX_CLIENTS."""
+        with self.lock:
+            if sum(len(s) for s in self.rooms.values()) >= LIVE_MAX_CLIENTS:
+                self.counters["rejected"] += 1
+                return None
+            subscriber = Subscriber(room)
+            self.rooms.setdefault(room, set()).add(subscriber)
+            if room not in self.boards:
+                self.boards[room] = (0, self.top(self.read_entries(), room))
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            watchers = self.rooms.get(subscriber.room)
+            if watchers is not None:
+                watchers.discard(subscriber)
+                if not watchers:
+                    del self.rooms[subscriber.room]
+                    del self.boards[subscriber.room]
+
+    def snapshot(self, room):
+        with self.lock:
+            version, entries = self.boards.get(room) or (0, self.top(self.read_entries(), room))
+        return sse("snapshot", {"room": room, "version": version, "entries": entries})
+
+    def publish(self, entries=None):
+        """Sends diffs for every watched room whose top entries changed.
+
+        entries is the leaderboard just written, saving a reread.
+        """
+        with self.lock:
+            if not self.rooms:
+                return
+            if entries is None:
+                entries = self.read_entries()
+            self.signature = self._signature()
+            for room, watchers in self.rooms.items():
+                version, old = self.boards[room]
+                new = self.top(entries, room)
+                changes = diff_boards(old, new)
+                if not changes and len(old) == len(new):
+                    self.counters["unchanged"] += 1
+                    continue
+                self.boards[room] = (version + 1, new)
+                message = sse("diff", {"room": room, "base": version, "version": version + 1,
+                                       "changes": changes, "length": len(new)})
+                self.counters["published"] += 1
+                for subscriber in watchers:
+                    if not subscriber.offer(message):
+                        self.counters["resyncs"] += 1
+
+    def check_file(self):
+        """Publishes if the file changed behind our back (another worker wrote it)."""
+        if self.path and self._signature() != self.signature:
+            self.publish()
+
+    def stream(self, subscriber):
+        """The SSE body for one subscriber: a snapshot, then diffs as they happen."""
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            yield self.snapshot(subscriber.room)
+            while True:
+                try:
+                    message = subscriber.queue.get(timeout=LIVE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    self.check_file()
+                    yield ": ping\n\n"
+                    continue
+                yield self.snapshot(subscriber.room) if message is None else message
+        finally:
+            # Runs when the client disconnects and the next write fails
+            self.unsubscribe(subscriber)
+
+    def report(self):
+        with self.lock:
+            report = dict(self.counters)
+            report["clients"] = {room or "*": len(s) for room, s in self.rooms.items()}
+        return report
@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+# ================= CONFIGURATION =================
+
+# live:   call the provider
+# record: call the provider and append every response to the cassette
+# replay: answer from the cassette only, no network or API key needed
+LLM_TRANSPORT = os.getenv("LLM_TRANSPORT", "live").lower()
+LLM_CASSETTE = os.getenv("LLM_CASSETTE", "llm_cassette.jsonl")
+
+# Replayed chunks arrive at their recorded offsets times this factor:
+# 1.0 = original latency, 0.5 = twice as fast, 0 = instantly
+LLM_LATENCY_SCALE = float(os.getenv("LLM_LATENCY_SCALE", "1.0"))
+
+class CassetteMissError(Exception):
+    """Replay found no recorded response for a request."""
+
+# ================= RESPONSES =================
+
+class TransportResponse:
+    """The slice of requests.Response the call sites use."""
+
+    def __init__(self, status_code, text="", lines=None):
+        self.status_code = status_code
+        self._text = text
+        self._lines = lines
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = "\n".join(line.decode('utf-8') for line in self._lines)
+        return self._text
+
+    def json(self):
+        return json.loads(self.text)
+
+    def iter_lines(self):
+        if self._lines is None:
+            for line in self._text.splitlines():
+                yield line.encode('utf-8')
+        else:
+            yield from self._lines
+
+class GeminiChunk:
+    def __init__(self, text):
+        self.text = text
+
+class GeminiReply:
+    """The slice of a Gemini GenerateContentResponse the call sites use.
+
+    Iterating yields chunks (streamed or not); .text is all of them joined.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._seen = []
+
+    def __iter__(self):
+        for text in self._chunks:
+            self._seen.append(text)
+            yield GeminiChunk(text)
+
+    @property
+    def text(self):
+        for _ in self:
+            pass
+        return "".join(self._seen)
+
+# ================= CASSETTE =================
+
+def request_key(kind, body):
+    """Stable key for a request.
+
+    Only the request body takes part: a cassette recorded against one
+    server or API key replays against any other.
+    """
+    raw = json.dumps([kind, body], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+class Cassette:
+    """JSON-lines file of recorded responses, one per line.
+
+    Each record holds the request key, a readable copy of the request,
+    the status code and the response chunks with their time offsets in
+    seconds from when the request was sent. Identical requests recorded
+    several times replay in order and then wrap around.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._records = None
+        self._positions = {}
+
+    def _load(self):
+        records = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        records.setdefault(record["key"], []).append(record)
+        return records
+
+    def append(self, record):
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if self._records is not None:
+                self._records.setdefault(record["key"], []).append(record)
+
+    def next_record(self, key):
+        with self.lock:
+            if self._records is None:
+                self._records = self._load()
+            records = self._records.get(key)
+            if not records:
+                return None
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            return records[position % len(records)]
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+def get_cassette():
+    global _cassette
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette(LLM_CASSETTE)
+        return _cassette
+
+def _replay_chunks(record):
+    """Yields recorded chunks, sleeping to reproduce their timing."""
+    start = time.monotonic()
+    for offset, text in record["chunks"]:
+        delay = offset * LLM_LATENCY_SCALE - (time.monotonic() - start)
+        if delay > 0:
+            time.sleep(delay)
+        yield text
+
+def _recorded(chunks, record, start):
+    """Passes chunks through while timing them; saves the record at the end.
+
+    start is when the request was sent, so the first offset includes the
+    provider's time to first byte.
+    """
+    try:
+        for text in chunks:
+            record["chunks"].append([round(time.monotonic() - start, 4), text])
+            yield text
+    finally:
+        # Also runs when the caller stops early, e.g. on an SSE [DONE]
+        get_cassette().append(record)
+
+# ================= OPENAI-COMPATIBLE HTTP =================
+
+def post(url, headers=None, json=None, stream=False):
+    """Drop-in for requests.post on chat completion endpoints."""
+    body = dict(json or {})
+    key = request_key("http", body)
+
+    if LLM_TRANSPORT == "replay":
+        record = get_cassette().next_record(key)
+        if record is None:
+            return TransportResponse(404, f"No recorded response for this request in {LLM_CASSETTE}")
+        lines = (text.encode('utf-8') for text in _replay_chunks(record))
+        if stream:
+            return TransportResponse(record["status"], text=None, lines=lines)
+        return TransportResponse(record["status"], text="\n".join(l.decode('utf-8') for l in lines))
+
+    import requests
+
+    start = time.monotonic()
+    response = requests.post(url, headers=headers, json=body, stream=stream)
+    if LLM_TRANSPORT != "record":
+        return response
+
+    record = {"key": key, "kind": "http", "request": {"url": url, "body": body},
+              "status": response.status_code, "stream": stream, "chunks": []}
+    if stream:
+        lines = (text.encode('utf-8') for text in
+                 _recorded((line.decode('utf-8') for line in response.iter_lines()), record, start))
+        return TransportResponse(response.status_code, text=None, lines=lines)
+
+    text = "".join(_recorded(iter([response.text]), record, start))
+    return TransportResponse(response.status_code, text=text)
+
+# ================= GEMINI SDK =================
+
+def gemini_generate(model_factory, model_name, prompt, stream=False, system_instruction=None):
+    """Runs model.generate_content through the transport.
+
+    model_factory builds the SDK model and is only called when the
+    provider is actually contacted, so replay never imports the SDK.
+    system_instruction is whatever the factory's model was built with;
+    it only takes part in the cassette key.
+    """
+    body = {"model": model_name, "prompt": prompt, "stream": stream}
+    if system_instruction is not None:
+        body["system"] = system_instruction
+    key = request_key("gemini", body)
+
+    if LLM_TRANSPORT == "replay":
+        record = get_cassette().next_record(key)
+        if record is None:
+            raise CassetteMissError(f"No recorded Gemini response for this prompt in {LLM_CASSETTE}")
+        return GeminiReply(_replay_chunks(record))
+
+    model = model_factory()
+    start = time.monotonic()
+    response = model.generate_content(prompt, stream=stream)
+    if LLM_TRANSPORT != "record":
+        return response
+
+    record = {"key": key, "kind": "gemini", "request": body,
+              "status": 200, "stream": stream, "chunks": []}
+    chunks = (chunk.text for chunk in response) if stream else iter([response.text])
+    return GeminiReply(_recorded(chunks, record, start))
@@ -1,24 +1,25 @@
 import os
-import json
 import subprocess
-import sys
 import time
-import random
+from deckstore import SharedDeck, append_cards
+from card_pool import CardPool
+import profiler
 
 # Define the path to the 'data.json' and 'recordMouse.ahk' files
 json_file_path = 'data.json'
 recordPos = 'recordMouse.ahk'
 sendToGPT = 'switchGPT.ahk'
 data = []
+deck = None  # SharedDeck behind data once the file has been read
 
 def check_and_run():
-    global data
+    global data, deck
     # Check if the 'data.json' file exists
     if os.path.exists(json_file_path):
         try:
-            # Open and read the 'data.json' file
-            with open(json_file_path, 'r') as file:
-                data = json.load(file)
+            # Open and read the 'data.json' file (JSON or binary deck)
+            deck = SharedDeck(json_file_path)
+            data = deck.data
 
             # Check if both "reset" and "chat" arrays exist
             if "reset" in data and "chat" in data:
@@ -31,7 +32,7 @@ def check_and_run():
                     return
 
 
-        except json.JSONDecodeError:
+        except ValueError:  # JSONDecodeError or a malformed binary deck
             print('Error reading JSON data from data.json.')
 
     # If the file doesn't exist or the arrays don't exist, run the AHK script
@@ -48,40 +49,44 @@ def sendQuestion(question, answer):
     subprocess.run(['start', '/wait', sendToGPT, data['chat'][0], data['chat'][1], data['reset'][0], data['reset'][1], question, answer], shell=True)
     
 
-leftFlashcards = -1
-usedFlashcards = []
+# Positions of the cards not drawn yet this pass (set DECK_LOW_MEMORY=1 to keep card bodies on disk)
+cardPool = None
 
 def selectRandomFlashCard():
-    global data, leftFlashcards, usedFlashcards
-    
-    if leftFlashcards > 0:
-        flashcard = random.choice(usedFlashcards)
-        usedFlashcards.remove(flashcard)
-        leftFlashcards -= 1
-        return flashcard
-    else:
-        if not usedFlashcards:
-            usedFlashcards = data["flashcards"].copy()
-            leftFlashcards = len(usedFlashcards) - 1
-
-        flashcard = random.choice(usedFlashcards)
-        usedFlashcards.remove(flashcard)
-        return flashcard
+    position = cardPool.draw()
+    return None if position is None else data["flashcards"][position]
 
+def pickUpNewFlashcards():
+    # Cards added by other processes join the pool without a restart
+    global data
+    if deck is None:
+        return
+    newCards, reloaded = deck.refresh()
+    if reloaded:
+        data = deck.data
+        cardPool.reset(len(data["flashcards"]))
+    elif newCards:
+        cardPool.grow(len(data["flashcards"]))
 
 
 if __name__ == '__main__':
+    profiler.start()
     check_and_run()
     print("Done")
     if not ("flashcards" in data) or len(data["flashcards"]) == 0:
         question = input("Add the first flashcard: ")
         data["flashcards"] = [question]
+    cardPool = CardPool(len(data["flashcards"]))
     
     
     while True:
         print("\033[H\033[J", end="")
+        pickUpNewFlashcards()
         randomQuestion = selectRandomFlashCard()
-        print(f"{leftFlashcards} left.\nYour question is : {randomQuestion}\n\nType 'e' to exit.\nType 'a' to add new flashcard\nType 's' to skip the question.\n")
+        if randomQuestion is None:
+            print("No flashcards available.")  # The deck was emptied by another process
+            break
+        print(f"{cardPool.left} left.\nYour question is : {randomQuestion}\n\nType 'e' to exit.\nType 'a' to add new flashcard\nType 's' to skip the question.\n")
         answer = input("A : ")
         if answer == 's':
             continue
@@ -89,9 +94,10 @@ if __name__ == '__main__':
             exit()
         if answer == 'a':
             new_flashcard = input("Enter your new flashcard question: ")
-            data["flashcards"].append(new_flashcard)
             print(f"New flashcard added: {new_flashcard}")
-            with open("data.json", "w") as file:
-                json.dump(data, file, indent=4)  # Writing data as a formatted JSON
+            append_cards(json_file_path, [new_flashcard])  # Locked append; keeps the deck's existing format
+            if deck is None:
+                data["flashcards"].append(new_flashcard)
+                cardPool.grow(len(data["flashcards"]))
             continue
         sendQuestion(randomQuestion, answer)
@@ -0,0 +1,308 @@
+import os
+import sys
+import json
+import time
+import atexit
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+# ================= CONFIGURATION =================
+
+# Off unless PROFILE=1; every hook below is a cheap no-op then
+PROFILE = os.getenv("PROFILE", "").lower() in ("1", "true", "yes")
+PROFILE_FILE = os.getenv("PROFILE_FILE", "profile.jsonl")
+PROFILE_MAX_BYTES = 5 * 1024 * 1024
+PROFILE_BACKUPS = 3
+
+# How often thread stacks are sampled. 10 ms costs well under 1% of a
+# core for a handful of threads.
+SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+
+# Requests (or CLI quiz items) at least this slow are written out in full
+SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_MS", "2000"))
+
+# Aggregated samples are written this often, and at exit
+FLUSH_SECONDS = 60
+
+MAX_STACK_DEPTH = 40
+STACKS_PER_RECORD = 20   # Most frequent stacks kept with each slow request
+
+# ================= TRACES =================
+
+class Trace:
+    """Timings for one request: stages, notes and the stacks sampled while it ran."""
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.stages = []          # [name, ms] in the order they finished
+        self.meta = {}
+        self.samples = Counter()  # Collapsed stack -> samples, filled by the sampler
+
+_active = {}      # thread id -> Trace
+_lock = threading.Lock()
+_sampler = None
+_logger = None
+_logger_lock = threading.Lock()  # The sampler's flush and a slow request may log first at once
+
+def _log(record):
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            logger = logging.getLogger("flashcards.profile")
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            handler = RotatingFileHandler(PROFILE_FILE, maxBytes=PROFILE_MAX_BYTES,
+                                          backupCount=PROFILE_BACKUPS, encoding='utf-8')
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            _logger = logger
+    _logger.info(json.dumps(record, ensure_ascii=False))
+
+def current():
+    """The calling thread's Trace, or None."""
+    return _active.get(threading.get_ident()) if PROFILE else None
+
+def begin(name):
+    """Starts a Trace for the calling thread (None when profiling is off)."""
+    if not PROFILE:
+        return None
+    trace = Trace(name)
+    with _lock:
+        _active[threading.get_ident()] = trace
+    return trace
+
+def end(trace):
+    """Finishes a Trace; slow ones are written with their stages and stacks."""
+    if trace is None:
+        return
+    with _lock:
+        if _active.get(threading.get_ident()) is trace:
+            del _active[threading.get_ident()]
+        samples = trace.samples.most_common(STACKS_PER_RECORD)
+    ms = (time.perf_counter() - trace.start) * 1000
+    if ms >= SLOW_REQUEST_MS:
+        _log({"type": "slow", "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "name": trace.name,
+              "ms": round(ms, 1), "slow_ms": SLOW_REQUEST_MS, "stages": trace.stages, "meta": trace.meta,
+              "interval_ms": SAMPLE_INTERVAL_MS, "stacks": dict(samples)})
+
+@contextmanager
+def traced(name):
+    """with traced("name"): ... runs the block as one Trace."""
+    trace = begin(name)
+    try:
+        yield trace
+    finally:
+        end(trace)
+
+@contextmanager
+def stage(name):
+    """Times a block as a named stage of the current Trace, if there is one."""
+    trace = current()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.stages.append([name, round((time.perf_counter() - start) * 1000, 1)])
+
+def note(**meta):
+    """Attaches values (sizes, counts, the chosen path...) to the current Trace."""
+    trace = current()
+    if trace is not None:
+        trace.meta.update(meta)
+
+# ================= SAMPLER =================
+
+def collapse(frame):
+    """'file:function;...' from the outermost frame in, as flame graph tools read it."""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class Sampler(threading.Thread):
+    """Samples thread stacks every SAMPLE_INTERVAL_MS.
+
+    With all_threads=False (the server) only threads inside a Trace are
+    sampled, so idle workers and open streams don't drown out real work.
+    """
+
+    def __init__(self, all_threads=True):
+        super().__init__(name="profiler-sampler", daemon=True)
+        self.all_threads = all_threads
+        self.counts = Counter()
+        self.taken = 0
+        self.stopping = threading.Event()
+
+    def run(self):
+        interval = SAMPLE_INTERVAL_MS / 1000
+        last_flush = time.monotonic()
+        while not self.stopping.wait(interval):
+            self.sample()
+            if time.monotonic() - last_flush >= FLUSH_SECONDS:
+                self.flush()
+                last_flush = time.monotonic()
+
+    def sample(self):
+        frames = sys._current_frames()
+        with _lock:
+            for ident, frame in frames.items():
+                trace = _active.get(ident)
+                if ident == self.ident or (trace is None and not self.all_threads):
+                    continue
+                stack = collapse(frame)
+                self.counts[stack] += 1
+                if trace is not None:
+                    trace.samples[stack] += 1
+            self.taken += 1
+
+    def flush(self):
+        with _lock:
+            counts, self.counts = self.counts, Counter()
+            taken, self.taken = self.taken, 0
+        if counts:
+            _log({"type": "samples", "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "process": os.path.basename(sys.argv[0]),
+                  "interval_ms": SAMPLE_INTERVAL_MS, "ticks": taken, "stacks": dict(counts)})
+
+    def stop(self):
+        self.stopping.set()
+        self.flush()
+
+def start(all_threads=True):
+    """Starts the sampler once per process when PROFILE is on. Samples are flushed at exit."""
+    global _sampler
+    if not PROFILE or _sampler is not None:
+        return
+    _sampler = Sampler(all_threads)
+    _sampler.start()
+    atexit.register(_sampler.stop)
+    print(f"Profiling on: sampling every {SAMPLE_INTERVAL_MS:g} ms, "
+          f"requests over {SLOW_REQUEST_MS:g} ms logged to {PROFILE_FILE}")
+
+# ================= FLASK =================
+
+def init_app(app):
+    """Traces every request and samples the threads serving them. Register before other hooks."""
+    if not PROFILE:
+        return
+    from flask import request
+
+    start(all_threads=False)
+
+    @app.before_request
+    def _begin_trace():
+        rule = request.url_rule.rule if request.url_rule else request.path
+        begin(f"{request.method} {rule}")
+        note(request_bytes=request.content_length or 0)
+        if request.script_root:
+            note(root=request.script_root)
+
+    # Registered ahead of http_cache's hook, so this runs after it and sees the final body
+    @app.after_request
+    def _note_response(response):
+        note(status=response.status_code,
+             response_bytes=None if response.is_streamed else response.calculate_content_length())
+        return response
+
+    @app.teardown_request
+    def _end_trace(exc):
+        if exc is not None:
+            note(error=repr(exc))
+        end(current())
+
+# ================= VIEWER =================
+
+def read_records(path=PROFILE_FILE):
+    """Records from the log and its rotated backups, oldest first."""
+    paths = [f"{path}.{i}" for i in range(PROFILE_BACKUPS, 0, -1)] + [path]
+    for p in paths:
+        if not os.path.exists(p):
+            continue
+        with open(p, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+def summarize(records):
+    """(self Counter, inclusive Counter, sample count, slow records) for a log's records."""
+    self_counts, total_counts = Counter(), Counter()
+    samples = 0
+    slow = []
+    for record in records:
+        if record.get("type") == "slow":
+            slow.append(record)
+        # Slow-request stacks are also in the periodic samples, so only those count here
+        if record.get("type") != "samples":
+            continue
+        for stack, count in record["stacks"].items():
+            frames = stack.split(";")
+            samples += count
+            self_counts[frames[-1]] += count
+            for name in set(frames):
+                total_counts[name] += count
+    return self_counts, total_counts, samples, slow
+
+def print_report(path=PROFILE_FILE, top=15):
+    self_counts, total_counts, samples, slow = summarize(read_records(path))
+    if not samples and not slow:
+        print(f"Nothing recorded in {path}. Run with PROFILE=1 first.")
+        return
+
+    if samples:
+        print(f"{samples} stack samples\n")
+    print(f"{'self %':>7} {'total %':>8}  function")
+    for name, count in self_counts.most_common(top):
+        print(f"{100 * count / samples:>6.1f}% {100 * total_counts[name] / samples:>7.1f}%  {name}")
+    # Frames in every sample (the entry point, the framework) say nothing
+    print("\nMost time inside (inclusive):")
+    inside = [(name, count) for name, count in total_counts.most_common() if count < samples]
+    for name, count in inside[:top]:
+        print(f"{100 * count / samples:>6.1f}%  {name}")
+
+    if slow:
+        by_name = {}
+        for record in slow:
+            by_name.setdefault(record["name"], []).append(record)
+        print(f"\n{len(slow)} slow requests (>= {slow[-1].get('slow_ms', SLOW_REQUEST_MS):g} ms)")
+        for name, records in sorted(by_name.items(), key=lambda item: -len(item[1])):
+            times = sorted(r["ms"] for r in records)
+            stages = Counter()
+            for r in records:
+                for stage_name, ms in r["stages"]:
+                    stages[stage_name] += ms
+            breakdown = ", ".join(f"{s} {ms / len(records):.0f} ms" for s, ms in stages.most_common(5))
+            print(f"  {name}: {len(records)}x, median {times[len(times) // 2]:.0f} ms, max {times[-1]:.0f} ms")
+            if breakdown:
+                print(f"    avg stages: {breakdown}")
+        worst = max(slow, key=lambda r: r["ms"])
+        print(f"\nSlowest: {worst['name']} at {worst['time']}, {worst['ms']:.0f} ms, {worst['meta']}")
+        for stack, count in list(worst["stacks"].items())[:3]:
+            print(f"  {count} samples in {' > '.join(stack.split(';')[-4:])}")
+
+# ================= CLI =================
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "report":
+        print_report(sys.argv[2] if len(sys.argv) > 2 else PROFILE_FILE)
+    elif len(sys.argv) >= 2 and sys.argv[1] == "collapsed":
+        # Input for flamegraph.pl or speedscope
+        merged = Counter()
+        for record in read_records(sys.argv[2] if len(sys.argv) > 2 else PROFILE_FILE):
+            if record.get("type") == "samples":
+                merged.update(record["stacks"])
+        for stack, count in merged.most_common():
+            print(f"{stack} {count}")
+    else:
+        print("Usage: python profiler.py report [profile.jsonl]     (hotspots and slow requests)")
+        print("       python profiler.py collapsed [profile.jsonl]  (stacks for flame graph tools)")
+        sys.exit(1)
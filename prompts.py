@@ -0,0 +1,232 @@
+import os
+import re
+import sys
+import math
+import threading
+import importlib.util
+from collections import OrderedDict
+
+# ================= CONFIGURATION =================
+
+# Token budget for the variable part of each prompt (card text, user answer,
+# source chunk). Override per task with PROMPT_BUDGET_<TASK>, e.g. PROMPT_BUDGET_GRADE=400
+TOKEN_BUDGETS = {
+    "MC": 250,
+    "FITB": 250,
+    "GRADE": 400,
+    "INGEST": 1200,
+}
+for _task in TOKEN_BUDGETS:
+    TOKEN_BUDGETS[_task] = int(os.getenv(f"PROMPT_BUDGET_{_task}", TOKEN_BUDGETS[_task]))
+
+# tiktoken is optional; without it tokens are estimated at 4 characters each
+TOKEN_ENCODING = "cl100k_base"
+
+# Gemini models kept for reuse; least recently used ones are dropped past this.
+# Clients choose the API key, and each key gets its own models
+MAX_CACHED_MODELS = 32
+
+# ================= TEMPLATES =================
+
+# Instructions live in the system instruction, which stays byte-identical
+# across calls so providers can cache it; the user turn carries only data.
+SYSTEM_INSTRUCTIONS = {
+    "MC": (
+        "You write multiple-choice distractors. Given a question and its correct answer, "
+        "return 3 plausible but incorrect answers in the same format and similar length, "
+        "strictly on the same topic. Output only JSON: {\"distractors\": [\"...\", \"...\", \"...\"]}"
+    ),
+    "FITB": (
+        "You write fill-in-the-blank items. Rewrite the answer replacing ONE key concept with '______'. "
+        "Output only JSON: {\"masked_text\": \"The capital of France is ______.\", \"missing_word\": \"Paris\"}"
+    ),
+    "GRADE": (
+        "You are a concise tutor. Compare the User Answer against the Textbook Answer. "
+        "1. State if the user is Correct or Incorrect. "
+        "2. If incorrect, briefly explain why using the Textbook Answer as the source of truth. "
+        "3. Keep your response short and to the point."
+    ),
+    "INGEST": (
+        "You are a flashcard author. Write at most Max cards flashcards covering the key facts "
+        "of the Text; answers must be supported by the Text alone. "
+        "Output only JSON: {\"flashcards\": [{\"question\": \"...\", \"textbook_answer\": \"...\"}]}"
+    ),
+}
+
+USER_TEMPLATES = {
+    "MC": "Question: {question}\nCorrect Answer: {answer}",
+    "FITB": "Question: {question}\nAnswer: {answer}",
+    "GRADE": "Question: {question}\nTextbook Answer: {answer}\nUser Answer: {user_answer}",
+    "INGEST": "Source: {location}\nMax cards: {max_cards}\nText:\n{text}",
+}
+
+# The one field per task that gets compacted when over budget
+COMPACTED_FIELD = {"MC": "answer", "FITB": "answer", "GRADE": "answer", "INGEST": "text"}
+
+# Appended to a task's instruction when several items share one call
+BATCH_INSTRUCTIONS = {
+    "GRADE": (
+        "You will get several numbered items; grade each one on its own. "
+        "Output only JSON: {\"grades\": [{\"item\": 1, \"correct\": true, \"feedback\": \"...\"}]}"
+    ),
+}
+
+# ================= TOKEN COUNTING =================
+
+_encoder = None
+
+def count_tokens(text):
+    """Tokens in text: exact with tiktoken installed, a 4-chars-per-token estimate otherwise."""
+    global _encoder
+    if _encoder is None:
+        if importlib.util.find_spec("tiktoken") is not None:
+            import tiktoken
+            _encoder = tiktoken.get_encoding(TOKEN_ENCODING)
+        else:
+            _encoder = False
+    if _encoder:
+        return len(_encoder.encode(text))
+    return math.ceil(len(text) / 4)
+
+# ================= COMPACTION =================
+
+SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+")
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+def truncate_to_tokens(text, max_tokens):
+    """Cuts text at a word boundary so it fits max_tokens."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(text[:mid] + " ...") <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    cut = text[:low]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut + " ..."
+
+def fit_to_budget(text, max_tokens, focus=""):
+    """Returns text unchanged if it fits, else an extractive summary that does.
+
+    Sentences are ranked by words shared with focus (usually the question)
+    with a bonus for coming first, and kept in their original order.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    sentences = [s for s in SENTENCE_RE.split(text.strip()) if s]
+    if len(sentences) < 2:
+        return truncate_to_tokens(text, max_tokens)
+
+    focus_words = set(WORD_RE.findall(focus.lower()))
+    def score(item):
+        position, sentence = item
+        overlap = len(focus_words & set(WORD_RE.findall(sentence.lower())))
+        return overlap + 1.0 / (1 + position)
+
+    kept = []
+    used = 0
+    for position, sentence in sorted(enumerate(sentences), key=score, reverse=True):
+        cost = count_tokens(sentence) + 1
+        if used + cost <= max_tokens:
+            kept.append((position, sentence))
+            used += cost
+    if not kept:
+        return truncate_to_tokens(sentences[0], max_tokens)
+    return " ".join(sentence for _, sentence in sorted(kept))
+
+# ================= BUILDING PROMPTS =================
+
+_usage = {}
+_usage_lock = threading.Lock()
+
+def _fill(task, fields):
+    """The task's user template filled in; returns (text, whether a field was compacted)."""
+    field = COMPACTED_FIELD[task]
+    original = str(fields.get(field, ""))
+    fields = dict(fields, **{field: fit_to_budget(original, TOKEN_BUDGETS[task],
+                                                  focus=str(fields.get("question", "")))})
+    return USER_TEMPLATES[task].format(**fields), fields[field] != original
+
+def _record_usage(name, system, user, compacted):
+    with _usage_lock:
+        usage = _usage.setdefault(name, {"calls": 0, "tokens": 0, "compacted": 0})
+        usage["calls"] += 1
+        usage["tokens"] += count_tokens(system) + count_tokens(user)
+        usage["compacted"] += compacted
+
+def build_prompt(task, **fields):
+    """Returns (system_instruction, user_content) for one of the templated tasks.
+
+    The task's compacted field is summarized to fit its token budget; the
+    other fields are short by nature and pass through.
+    """
+    system = SYSTEM_INSTRUCTIONS[task]
+    user, compacted = _fill(task, fields)
+    _record_usage(task, system, user, compacted)
+    return system, user
+
+def build_batch_prompt(task, items):
+    """(system_instruction, user_content) covering several items in one call.
+
+    items is a list of field dicts, numbered from 1 in the prompt. Each is
+    fitted to the task's budget on its own, and the instruction is sent
+    once for the whole batch. Usage is recorded as "<task>_BATCH".
+    """
+    system = f"{SYSTEM_INSTRUCTIONS[task]} {BATCH_INSTRUCTIONS[task]}"
+    parts = []
+    compacted = 0
+    for number, fields in enumerate(items, 1):
+        user, was_compacted = _fill(task, fields)
+        parts.append(f"Item {number}:\n{user}")
+        compacted += was_compacted
+    user = "\n\n".join(parts)
+    _record_usage(f"{task}_BATCH", system, user, compacted)
+    return system, user
+
+def usage_report():
+    """{task: {"calls", "tokens", "compacted", "avg_tokens"}} for prompts built in this process."""
+    with _usage_lock:
+        return {task: dict(u, avg_tokens=round(u["tokens"] / u["calls"])) for task, u in _usage.items()}
+
+# ================= PROVIDER CACHING =================
+
+_models = OrderedDict()
+_models_lock = threading.Lock()
+
+def gemini_model(genai, model_name, system_instruction, cache_key=None):
+    """A GenerativeModel carrying system_instruction, reused across calls.
+
+    The instruction is sent as Gemini's system instruction rather than
+    pasted into every prompt. Models are kept per cache_key too (e.g. the
+    API key), since a model holds on to the client it first called with;
+    at most MAX_CACHED_MODELS are kept. Explicit context caching needs a
+    far larger prefix than these prompts have, so it isn't used.
+    """
+    key = (cache_key, model_name, system_instruction)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            model = _models[key] = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+            if len(_models) > MAX_CACHED_MODELS:
+                _models.popitem(last=False)
+        else:
+            _models.move_to_end(key)
+        return model
+
+# ================= CLI =================
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python prompts.py <file>   (counts its tokens, then shows the MC prompt budget fit)")
+        sys.exit(1)
+
+    with open(sys.argv[1], 'r', encoding='utf-8') as f:
+        text = f.read()
+    print(f"{count_tokens(text)} tokens ({'tiktoken' if _encoder else 'estimated'})")
+    fitted = fit_to_budget(text, TOKEN_BUDGETS["MC"])
+    print(f"Fitted to the MC budget of {TOKEN_BUDGETS['MC']}: {count_tokens(fitted)} tokens\n\n{fitted}")
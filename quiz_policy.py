@@ -0,0 +1,255 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from contextlib import nullcontext
+
+# ================= CONFIGURATION =================
+
+QUIZ_CACHE_FILE = os.getenv("QUIZ_CACHE_FILE", "quiz_cache.jsonl")
+POLICY_STATE_FILE = "quiz_policy.json"
+
+# State is written at most this often from the request path; losing the
+# last few seconds of counters in a crash costs nothing but statistics
+POLICY_SAVE_SECONDS = 5.0
+
+# A card counts as known/hard once it has this many answers
+POLICY_MIN_ANSWERS = 3
+KNOWN_ACCURACY = 0.8     # At or above: cheap cached/local items are enough
+HARD_ACCURACY = 0.5      # Below: always worth a fresh LLM item
+
+# Provider considered slow above this smoothed latency; new cards then go local
+SLOW_PROVIDER_MS = float(os.getenv("POLICY_SLOW_MS", "4000"))
+LATENCY_ALPHA = 0.3      # Weight of the newest call in the latency average
+
+CACHED_ITEMS_PER_MODE = 3
+MODES = ("MC", "FITB")
+
+# Where an item came from
+PATH_CACHE = "cache"
+PATH_LOCAL = "local"
+PATH_LLM = "llm"
+
+BLANK = "______"
+WORD_RE = re.compile(r"[A-Za-z][A-Za-z0-9'-]{2,}[A-Za-z0-9]")  # Ends on a word character, so \b can find it
+COMMON_WORDS = frozenset(
+    "that this with from have were which their there about would these other into more some "
+    "than them then also when what where they been only such most over each used uses".split()
+)
+
+def card_key(question, answer):
+    """Content hash of a card, so cached items follow it across decks and edits elsewhere."""
+    return hashlib.sha1(f"{question}\n{answer}".encode('utf-8')).hexdigest()[:16]
+
+# ================= LOCAL GENERATION =================
+
+def local_fill_in_blank(answer):
+    """Blanks the longest uncommon word of the answer. None if there isn't one."""
+    words = [w for w in WORD_RE.findall(answer) if w.lower() not in COMMON_WORDS]
+    # Longest first; a word glued to a digit or underscore has no word boundary to blank at
+    for word in sorted(dict.fromkeys(words), key=len, reverse=True):
+        masked, blanked = re.subn(rf"\b{re.escape(word)}\b", BLANK, answer, count=1)
+        if blanked:
+            return {"masked_text": masked, "missing_word": word}
+    return None
+
+def local_distractors(answer, cards, sample_size=40):
+    """Three answers of other cards, closest in length to this one. None if the deck is too small."""
+    if len(cards) < 4:
+        return None
+    indices = random.sample(range(len(cards)), min(sample_size, len(cards)))
+    candidates = set()
+    for i in indices:
+        card = cards[i]
+        other = card.get("textbook_answer") if isinstance(card, dict) else None
+        if other and other != answer:
+            candidates.add(other)
+    if len(candidates) < 3:
+        return None
+    return {"distractors": sorted(candidates, key=lambda a: abs(len(a) - len(answer)))[:3]}
+
+def _as_quiz(mode, question, answer, content):
+    if mode == "MC":
+        options = list(content["distractors"]) + [answer]
+        random.shuffle(options)
+        return {"type": "MC", "question": question, "options": options, "correct_answer": answer}
+    return {"type": "FITB", "question": question,
+            "masked_text": content["masked_text"], "missing_word": content["missing_word"]}
+
+def _valid(mode, content):
+    if not isinstance(content, dict):
+        return False
+    if mode == "MC":
+        return isinstance(content.get("distractors"), list) and len(content["distractors"]) >= 1
+    return bool(content.get("masked_text")) and bool(content.get("missing_word"))
+
+# ================= POLICY =================
+
+class QuizPolicy:
+    """Picks the quiz mode and how to produce the item for each card.
+
+    Known cards get MC from the cache or built locally; hard cards get a
+    fresh LLM fill-in-the-blank; everything else uses the cache when it
+    can and the LLM while the provider is responsive. Every LLM result is
+    cached by card content, and counters record what the policy saved.
+    """
+
+    def __init__(self, cache_path=QUIZ_CACHE_FILE, state_path=POLICY_STATE_FILE):
+        self.cache_path = cache_path
+        self.state_path = state_path
+        self.lock = threading.Lock()
+        self._save_lock = threading.Lock()  # Writers share the temporary file
+        self._saved_at = 0.0
+        self.cache = {}          # card key -> {mode: [content, ...]}
+        self.history = {}        # card key -> {"answered": n, "correct": n}, for callers without a review log
+        self.latency_ms = None   # Smoothed provider latency
+        self.counters = {"llm_calls": 0, "llm_failures": 0, "cache_hits": 0, "local_items": 0}
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.cache_path):
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self._remember(record["key"], record["mode"], record["content"])
+                    except (ValueError, KeyError):
+                        continue
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                self.history = state.get("history", {})
+                self.counters.update(state.get("counters", {}))
+                self.latency_ms = state.get("latency_ms")
+            except (OSError, ValueError):
+                print(f"Warning: could not read {self.state_path}, starting fresh.")
+
+    def save(self, force=False):
+        """Writes history, counters and latency, at most every POLICY_SAVE_SECONDS unless forced."""
+        if not force and time.monotonic() - self._saved_at < POLICY_SAVE_SECONDS:
+            return
+        with self._save_lock:
+            with self.lock:
+                state = json.dumps({"history": self.history, "counters": self.counters,
+                                    "latency_ms": self.latency_ms})
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(state)
+            os.replace(tmp_path, self.state_path)
+            self._saved_at = time.monotonic()
+
+    def _remember(self, key, mode, content):
+        items = self.cache.setdefault(key, {}).setdefault(mode, [])
+        items.append(content)
+        del items[:-CACHED_ITEMS_PER_MODE]
+
+    def _store(self, key, mode, content):
+        with self.lock:
+            self._remember(key, mode, content)
+            with open(self.cache_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"key": key, "mode": mode, "content": content}, ensure_ascii=False) + "\n")
+
+    def add_item(self, question, answer, mode, content):
+        """Caches an item made elsewhere (e.g. distractors from an import)."""
+        if _valid(mode, content):
+            self._store(card_key(question, answer), mode, content)
+
+    def record(self, key, correct):
+        """Notes an answer, for callers that keep no review log of their own."""
+        with self.lock:
+            counter = self.history.setdefault(key, {"answered": 0, "correct": 0})
+            counter["answered"] += 1
+            counter["correct"] += bool(correct)
+
+    def observe_latency(self, ms):
+        with self.lock:
+            if self.latency_ms is None:
+                self.latency_ms = ms
+            else:
+                self.latency_ms = LATENCY_ALPHA * ms + (1 - LATENCY_ALPHA) * self.latency_ms
+
+    def provider_slow(self):
+        return self.latency_ms is not None and self.latency_ms > SLOW_PROVIDER_MS
+
+    def choose(self, key, history=None, mode=None):
+        """Returns (mode, paths to try in order) for a card."""
+        if history is None:
+            history = self.history.get(key)
+        answered = history["answered"] if history else 0
+        accuracy = history["correct"] / answered if answered else None
+        cached = self.cache.get(key, {})
+
+        if answered >= POLICY_MIN_ANSWERS and accuracy >= KNOWN_ACCURACY:
+            mode = mode or "MC"
+            return mode, [PATH_CACHE, PATH_LOCAL, PATH_LLM]
+        if answered >= POLICY_MIN_ANSWERS and accuracy < HARD_ACCURACY:
+            mode = mode or "FITB"
+            if self.provider_slow():
+                return mode, [PATH_CACHE, PATH_LLM, PATH_LOCAL]
+            return mode, [PATH_LLM, PATH_CACHE, PATH_LOCAL]
+
+        if mode is None:
+            with_cache = [m for m in MODES if cached.get(m)]
+            mode = random.choice(with_cache or list(MODES))
+        if self.provider_slow():
+            return mode, [PATH_CACHE, PATH_LOCAL, PATH_LLM]
+        return mode, [PATH_CACHE, PATH_LLM, PATH_LOCAL]
+
+    def build(self, question, answer, generate, cards=(), history=None, mode=None, llm_slot=None):
+        """Makes a quiz item for one card following choose().
+
+        generate(mode, question, answer) is the LLM call and returns the raw
+        JSON ({"distractors": [...]} or {"masked_text", "missing_word"}) or
+        None; pass generate=None when no LLM call is allowed right now (e.g.
+        a spent quota). llm_slot, if given, returns a context manager that
+        waits for permission to call and yields whether it was granted (see
+        Tenant.llm_call); a refusal moves on to the next path without
+        counting a call, and the wait is not timed as provider latency.
+        cards supplies other answers for local MC. Returns (quiz dict, path)
+        or (None, None) if every path failed.
+        """
+        key = card_key(question, answer)
+        mode, paths = self.choose(key, history, mode)
+
+        for path in paths:
+            if path == PATH_LLM and generate is None:
+                continue
+            content = None
+            if path == PATH_CACHE:
+                items = self.cache.get(key, {}).get(mode)
+                content = random.choice(items) if items else None
+            elif path == PATH_LOCAL:
+                content = local_distractors(answer, cards) if mode == "MC" else local_fill_in_blank(answer)
+            else:
+                with llm_slot() if llm_slot else nullcontext(True) as allowed:
+                    if not allowed:
+                        continue  # Throttled here, not a slow or failing provider
+                    start = time.monotonic()
+                    content = generate(mode, question, answer)
+                    self.observe_latency((time.monotonic() - start) * 1000)
+                with self.lock:
+                    self.counters["llm_calls"] += 1
+                    if not _valid(mode, content):
+                        self.counters["llm_failures"] += 1
+                if _valid(mode, content):
+                    self._store(key, mode, content)
+
+            if _valid(mode, content):
+                if path != PATH_LLM:
+                    with self.lock:
+                        self.counters["cache_hits" if path == PATH_CACHE else "local_items"] += 1
+                quiz = _as_quiz(mode, question, answer, content)
+                quiz["card_key"] = key
+                return quiz, path
+        return None, None
+
+    def report(self):
+        with self.lock:
+            counters = dict(self.counters)
+        counters["llm_calls_saved"] = counters["cache_hits"] + counters["local_items"]
+        counters["provider_latency_ms"] = round(self.latency_ms) if self.latency_ms is not None else None
+        return counters
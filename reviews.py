@@ -0,0 +1,243 @@
+import os
+import json
+import heapq
+import threading
+import time
+
+# ================= CONFIGURATION =================
+
+REVIEW_LOG_FILE = "review_events.jsonl"
+REVIEW_STATS_FILE = "review_stats.json"
+
+# Counters are written at most this often; on startup anything the log
+# holds past the saved offset is replayed, so a crash loses nothing
+STATS_SAVE_SECONDS = 5.0
+
+# Cards/locations need this many answers before they can rank as weak
+WEAKNESS_MIN_ANSWERS = 2
+
+# Fields a client is allowed to send for one answer
+VALID_MODES = ("MC", "FITB")
+
+# ================= AGGREGATES =================
+
+def _new_counter():
+    return {"answered": 0, "correct": 0, "latency_ms": 0, "timed": 0}
+
+def _count(counters, key, event):
+    counter = counters.get(key)
+    if counter is None:
+        counter = counters[key] = _new_counter()
+    counter["answered"] += 1
+    counter["correct"] += event["correct"]
+    if event["latency_ms"] is not None:
+        counter["latency_ms"] += event["latency_ms"]
+        counter["timed"] += 1
+
+def summarize(counter):
+    """Readable view of one counter: answered, correct, accuracy, avg latency."""
+    answered = counter["answered"]
+    return {
+        "answered": answered,
+        "correct": counter["correct"],
+        "accuracy": round(counter["correct"] / answered, 3) if answered else None,
+        "avg_latency_ms": round(counter["latency_ms"] / counter["timed"]) if counter["timed"] else None
+    }
+
+class ReviewStats:
+    """Counters materialized from the review log, updated as events arrive.
+
+    Per user: overall, per mode, and per deck both per card and per
+    location. Cards are counted by quiz_policy.card_key, so a card keeps
+    its history when others are edited, removed or synced in around it.
+    Reading them never touches the log. log_offset is how much of the log
+    the saved counters already include.
+    """
+
+    def __init__(self, path=REVIEW_STATS_FILE):
+        self.path = path
+        self.users = {}
+        self.log_offset = 0
+        self._saved_at = 0.0
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    saved = json.load(f)
+                self.users = saved["users"]
+                self.log_offset = saved["log_offset"]
+            except (OSError, ValueError, KeyError):
+                print(f"Warning: could not read {path}, rebuilding from the review log.")
+
+    def apply(self, event):
+        user = self.users.get(event["name"])
+        if user is None:
+            user = self.users[event["name"]] = {"total": _new_counter(), "modes": {}, "decks": {}}
+        _count(user, "total", event)
+        if event["mode"]:
+            _count(user["modes"], event["mode"], event)
+
+        if event["deck"]:
+            deck = user["decks"].setdefault(event["deck"], {"cards": {}, "locations": {}})
+            if event.get("card_key"):
+                _count(deck["cards"], event["card_key"], event)
+            if event.get("location"):
+                _count(deck["locations"], event["location"], event)
+
+    def catch_up(self, log_path):
+        """Applies log lines written after log_offset (e.g. before a crash)."""
+        if not os.path.exists(log_path):
+            return
+        with open(log_path, 'rb') as f:
+            f.seek(self.log_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self.log_offset += len(line)
+                try:
+                    self.apply(json.loads(line))
+                except (ValueError, KeyError):
+                    continue
+
+    def save(self, force=False):
+        if not force and time.monotonic() - self._saved_at < STATS_SAVE_SECONDS:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"log_offset": self.log_offset, "users": self.users}, f)
+        os.replace(tmp_path, self.path)
+        self._saved_at = time.monotonic()
+
+    def for_user(self, name, deck=None, limit=5):
+        """Stats for one user; with deck, also their weakest cards and locations."""
+        user = self.users.get(name)
+        if user is None:
+            return None
+
+        result = {
+            "total": summarize(user["total"]),
+            "modes": {mode: summarize(c) for mode, c in user["modes"].items()}
+        }
+        deck_stats = user["decks"].get(deck) if deck else None
+        if deck_stats:
+            result["weak_cards"] = _weakest(deck_stats["cards"], "card_key", limit)
+            result["weak_locations"] = _weakest(deck_stats["locations"], "location", limit)
+        return result
+
+def _weakest(counters, key_name, limit):
+    candidates = ((key, c) for key, c in counters.items() if c["answered"] >= WEAKNESS_MIN_ANSWERS)
+    worst = heapq.nsmallest(limit, candidates,
+                            key=lambda item: (item[1]["correct"] / item[1]["answered"], -item[1]["answered"]))
+    return [dict(summarize(c), **{key_name: key}) for key, c in worst]
+
+# ================= REVIEW STORE =================
+
+class ReviewStore:
+    """Append-only log of answer events, deduplicated by client event ID.
+
+    Accepted events also update the ReviewStats counters.
+    """
+
+    def __init__(self, path=REVIEW_LOG_FILE, stats_path=REVIEW_STATS_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self._seen_ids = None
+        self._stats = None
+        self.stats_path = stats_path
+
+    def _load_stats(self):
+        if self._stats is None:
+            self._stats = ReviewStats(self.stats_path)
+            self._stats.catch_up(self.path)
+            self._stats.save(force=True)
+        return self._stats
+
+    def _load_seen_ids(self):
+        seen = set()
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        seen.add(json.loads(line)["id"])
+                    except (ValueError, KeyError):
+                        continue
+        return seen
+
+    def add_events(self, events):
+        """Appends events not seen before. Returns the list that was accepted."""
+        with self.lock:
+            if self._seen_ids is None:
+                self._seen_ids = self._load_seen_ids()
+
+            accepted = []
+            for event in events:
+                if event["id"] in self._seen_ids:
+                    continue
+                self._seen_ids.add(event["id"])
+                accepted.append(event)
+
+            if accepted:
+                stats = self._load_stats()
+                # Binary so the byte count matches the file on every platform
+                lines = "".join(json.dumps(e) + "\n" for e in accepted).encode('utf-8')
+                with open(self.path, 'ab') as f:
+                    f.write(lines)
+                for event in accepted:
+                    stats.apply(event)
+                stats.log_offset += len(lines)
+                stats.save()
+            return accepted
+
+    def card_counter(self, name, deck, card_key):
+        """One user's answered/correct counter for one card (by quiz_policy.card_key), or None."""
+        with self.lock:
+            user = self._load_stats().users.get(name)
+        if user is None or deck not in user["decks"]:
+            return None
+        return user["decks"][deck]["cards"].get(card_key)
+
+    def user_stats(self, name, deck=None):
+        with self.lock:
+            return self._load_stats().for_user(name, deck)
+
+def clean_event(raw, name, deck):
+    """Validates one client event. Returns a normalized dict or None."""
+    if not isinstance(raw, dict):
+        return None
+
+    event_id = raw.get("id")
+    if not isinstance(event_id, str) or not event_id or len(event_id) > 64:
+        return None
+
+    card_id = raw.get("card_id")
+    if not isinstance(card_id, int) or isinstance(card_id, bool):
+        card_id = None
+
+    card_key = raw.get("card_key")
+    if not isinstance(card_key, str) or not card_key or len(card_key) > 64:
+        card_key = None
+
+    mode = raw.get("mode")
+    if mode not in VALID_MODES:
+        mode = None
+
+    latency = raw.get("latency_ms")
+    if not isinstance(latency, (int, float)) or latency < 0:
+        latency = None
+
+    points = raw.get("points", 0)
+    if not isinstance(points, (int, float)):
+        points = 0
+
+    return {
+        "id": event_id,
+        "name": name,
+        "deck": deck,
+        "card_id": card_id,
+        "card_key": card_key,  # Checked against the deck by the server; counts are kept by it
+        "mode": mode,
+        "correct": bool(raw.get("correct", False)),
+        "latency_ms": int(latency) if latency is not None else None,
+        "points": int(points),
+        "location": None,  # Filled in by the server from the deck, for per-location stats
+        "time": time.time()
+    }
@@ -1,6 +1,5 @@
 import sys
-import json
-import os
+from deckstore import update_deck
 
 def save_to_json():
     # Ensure there are enough arguments
@@ -18,24 +17,17 @@ def save_to_json():
 
     # Prepare data to be saved
     try:
-        # Load existing data from state.json if it exists
-        if os.path.exists('data.json'):
-            with open('data.json', 'r') as file:
-                data = json.load(file)
-        else:
-            data = {}
-
-        # Check if the variable name already exists in the data
-        if overwrite == 0:
-            # If it exists, append to the existing array
-            data[variable_name].extend(array_contents)
-        else:
-            # If it doesn't exist, create a new array for the variable
-            data[variable_name] = array_contents
-
-        # Save the updated data back into state.json
-        with open('data.json', 'w') as file:
-            json.dump(data, file, indent=4)
+        def change(data):
+            # Check if the variable name already exists in the data
+            if overwrite == 0:
+                # If it exists, append to the existing array
+                data[variable_name].extend(array_contents)
+            else:
+                # If it doesn't exist, create a new array for the variable
+                data[variable_name] = array_contents
+
+        # Re-read, change and save data.json under its lock so concurrent edits aren't lost
+        update_deck('data.json', change)
         
         print(f"Data saved/updated in data.json under the key '{variable_name}'.")
 
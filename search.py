@@ -0,0 +1,201 @@
+import os
+import re
+import sys
+import math
+import time
+import heapq
+import itertools
+import threading
+from collections import defaultdict
+
+from deckstore import add_save_listener, deck_stamp, last_change, load_deck
+
+# ================= CONFIGURATION =================
+
+# A match in the question counts for more than one buried in the answer
+FIELD_WEIGHTS = (("question", 2.0), ("textbook_answer", 1.0), ("textbook_location", 1.5))
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the this to was were what "
+    "which who why how with does do".split()
+)
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+def card_fields(card):
+    """(question, answer, location) of a card; legacy string cards are all question."""
+    if isinstance(card, str):
+        return card, "", ""
+    return (str(card.get("question", "")), str(card.get("textbook_answer", "")),
+            str(card.get("textbook_location", "")))
+
+# ================= INDEX =================
+
+class SearchIndex:
+    """Inverted index over one deck, ranked with BM25 over weighted fields.
+
+    Cards are identified by their position in the deck. A single
+    append_cards since the index was built only indexes the new cards,
+    taken from the deck's change journal; any other change rebuilds it.
+    The cached index is shared by every request, so adding cards and
+    scoring a query hold its lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postings = defaultdict(dict)   # token -> {card_id: weighted term frequency}
+        self.lengths = []                   # weighted token count per card
+        self.questions = []                 # question text per card, for result listings
+        self.locations = []                 # location text per card
+        self.total_length = 0.0
+        self.version = 0                    # deckstore version of the deck when last synced
+        self.stamp = None                   # deckstore stamp, which also catches unlocked writes
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add_cards(self, cards):
+        for card in cards:
+            fields = card_fields(card)
+            weighted = defaultdict(float)
+            for (_, weight), text in zip(FIELD_WEIGHTS, fields):
+                for token in tokenize(text):
+                    weighted[token] += weight
+            length = sum(weighted.values())
+
+            with self.lock:
+                card_id = len(self.lengths)
+                for token, tf in weighted.items():
+                    self.postings[token][card_id] = tf
+                self.lengths.append(length)
+                self.total_length += length
+                self.questions.append(fields[0])
+                self.locations.append(fields[2])
+
+    def search(self, query, limit=20, location=None):
+        """Returns [(card_id, score)] best first. location filters by substring.
+
+        With a location but no query terms, every card at that location
+        matches in deck order with a score of 0.
+        """
+        with self.lock:
+            return self._search(query, limit, location)
+
+    def _search(self, query, limit, location):
+        terms = set(tokenize(query or ""))
+        location = location.lower() if location else None
+        if not terms:
+            if not location:
+                return []
+            matches = (c for c, loc in enumerate(self.locations) if location in loc.lower())
+            return [(c, 0.0) for c in itertools.islice(matches, limit)]
+
+        count = len(self.lengths)
+        if count == 0:
+            return []
+        avg_length = self.total_length / count or 1.0
+
+        term_postings = sorted((self.postings[t] for t in terms if t in self.postings), key=len)
+        if not term_postings:
+            return []
+        # Terms in over half the deck barely move BM25 but cost a full scan;
+        # only score them when the query has nothing rarer
+        rare = [p for p in term_postings if len(p) <= count // 2]
+        term_postings = rare or term_postings
+
+        scores = defaultdict(float)
+        for postings in term_postings:
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for card_id, tf in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[card_id] / avg_length)
+                scores[card_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        if location:
+            scores = {c: s for c, s in scores.items() if location in self.locations[c].lower()}
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+# ================= PER-DECK CACHE =================
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _catch_up(index, path, version, stamp):
+    """Indexes the cards of the one append since the index was synced. False if the deck needs a rebuild."""
+    if version != index.version + 1:
+        return False
+    entry = last_change(path)
+    if entry is None or entry["version"] != version or entry["op"] != "append" or entry["start"] != len(index):
+        return False
+    if entry["signature"] != list(_file_signature(path)):
+        return False  # Written again since, by something that skipped the lock
+    index.add_cards(entry["cards"])
+    index.version, index.stamp = version, stamp
+    return True
+
+def get_index(path):
+    """Index for the deck at path, brought up to date with the file."""
+    key = os.path.abspath(path)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        version, stamp = deck_stamp(path)
+        if index is not None and index.stamp == stamp:
+            return index
+
+        # Changed on disk (another process wrote it) or never indexed
+        if index is None or not _catch_up(index, path, version, stamp):
+            index = SearchIndex()
+            index.add_cards(load_deck(path).get("flashcards", []))
+            index.version, index.stamp = version, stamp
+            _indexes[key] = index
+        return index
+
+def _on_deck_saved(path):
+    # Same-process appends are read back from the journal entry they just
+    # wrote; other writes drop the index so the next search rebuilds it
+    key = os.path.abspath(path)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            return
+        version, stamp = deck_stamp(path)
+        if index.stamp != stamp and not _catch_up(index, path, version, stamp):
+            del _indexes[key]
+
+add_save_listener(_on_deck_saved)
+
+def search_deck(path, query, limit=20, location=None):
+    """Ranked card IDs for query in the deck at path."""
+    return get_index(path).search(query, limit=limit, location=location)
+
+# ================= CLI =================
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python search.py <deck> <query> [location filter]")
+        sys.exit(1)
+
+    deck_path, query = sys.argv[1], sys.argv[2]
+    location = sys.argv[3] if len(sys.argv) > 3 else None
+
+    start = time.perf_counter()
+    get_index(deck_path)
+    built = time.perf_counter()
+    results = search_deck(deck_path, query, location=location)
+    done = time.perf_counter()
+
+    index = get_index(deck_path)
+    for card_id, score in results:
+        question, loc = index.questions[card_id], index.locations[card_id]
+        print(f"{score:6.2f}  #{card_id}  {question}" + (f"  [{loc}]" if loc else ""))
+    print(f"\n{len(results)} results; index {1000 * (built - start):.0f} ms, query {1000 * (done - built):.1f} ms")
@@ -0,0 +1,583 @@
+// --- Persistence ---
+const DB_NAME = "QuizAppDB";
+const STORE_NAME = "Settings";
+const CARD_STORE = "CardCache";      // Generated items per deck, for offline study
+const SCORE_STORE = "PendingScores"; // Answers not yet synced to the server
+let CURRENT_USER = "Anonymous";
+// "/t/<tenant>" when the page is served for a tenant; every API call goes under it
+const API_BASE = (location.pathname.match(/^\/t\/[^/]+/) || [''])[0];
+
+const openDB = () => {
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(DB_NAME, 2);
+        request.onupgradeneeded = (e) => {
+            const db = e.target.result;
+            if (!db.objectStoreNames.contains(STORE_NAME)) db.createObjectStore(STORE_NAME);
+            if (!db.objectStoreNames.contains(CARD_STORE)) {
+                const store = db.createObjectStore(CARD_STORE, { keyPath: "id", autoIncrement: true });
+                store.createIndex("deck", "deck");
+            }
+            if (!db.objectStoreNames.contains(SCORE_STORE)) {
+                db.createObjectStore(SCORE_STORE, { keyPath: "id", autoIncrement: true });
+            }
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+};
+
+const getSetting = async (key) => {
+    const db = await openDB();
+    return new Promise(resolve => {
+        const req = db.transaction(STORE_NAME, "readonly").objectStore(STORE_NAME).get(key);
+        req.onsuccess = () => resolve(req.result);
+        req.onerror = () => resolve(null);
+    });
+};
+
+const setSetting = async (key, val) => {
+    const db = await openDB();
+    return new Promise(resolve => {
+        const tx = db.transaction(STORE_NAME, "readwrite");
+        tx.objectStore(STORE_NAME).put(val, key);
+        tx.oncomplete = () => resolve();
+    });
+};
+
+const cacheCard = async (deck, card) => {
+    const db = await openDB();
+    return new Promise(resolve => {
+        const tx = db.transaction(CARD_STORE, "readwrite");
+        tx.objectStore(CARD_STORE).add({ deck: API_BASE + deck, card: card });
+        tx.oncomplete = () => resolve();
+        tx.onerror = () => resolve();
+    });
+};
+
+const getCachedCards = async (deck) => {
+    const db = await openDB();
+    return new Promise(resolve => {
+        const req = db.transaction(CARD_STORE, "readonly").objectStore(CARD_STORE).index("deck").getAll(API_BASE + deck);
+        req.onsuccess = () => resolve(req.result || []);
+        req.onerror = () => resolve([]);
+    });
+};
+
+const trimCachedCards = async (deck, keep) => {
+    const rows = await getCachedCards(deck);
+    if (rows.length <= keep) return;
+    const db = await openDB();
+    return new Promise(resolve => {
+        const tx = db.transaction(CARD_STORE, "readwrite");
+        const store = tx.objectStore(CARD_STORE);
+        // Rows come back in key order, so the oldest are first
+        rows.slice(0, rows.length - keep).forEach(row => store.delete(row.id));
+        tx.oncomplete = () => resolve();
+        tx.onerror = () => resolve();
+    });
+};
+
+const queueScore = async (entry) => {
+    const db = await openDB();
+    return new Promise(resolve => {
+        const tx = db.transaction(SCORE_STORE, "readwrite");
+        tx.objectStore(SCORE_STORE).add(entry);
+        tx.oncomplete = () => resolve();
+        tx.onerror = () => resolve();
+    });
+};
+
+const getQueuedScores = async () => {
+    const db = await openDB();
+    return new Promise(resolve => {
+        const req = db.transaction(SCORE_STORE, "readonly").objectStore(SCORE_STORE).getAll();
+        req.onsuccess = () => resolve(req.result || []);
+        req.onerror = () => resolve([]);
+    });
+};
+
+const removeQueuedScores = async (ids) => {
+    const db = await openDB();
+    return new Promise(resolve => {
+        const tx = db.transaction(SCORE_STORE, "readwrite");
+        const store = tx.objectStore(SCORE_STORE);
+        ids.forEach(id => store.delete(id));
+        tx.oncomplete = () => resolve();
+        tx.onerror = () => resolve();
+    });
+};
+
+// --- Prefetch / Offline State ---
+const PREFETCH_SIZE = 3;        // Cards generated ahead of the one on screen
+const CARD_CACHE_LIMIT = 200;   // Generated items kept per deck for offline study
+const SCORE_FLUSH_MS = 15000;   // How often queued scores are synced
+const EVENT_BATCH_SIZE = 500;   // Matches MAX_EVENT_BATCH on the server
+const LEADERBOARD_POLL_MS = 30000; // Only used when the live stream is unavailable
+
+let CURRENT_DECK = null;
+let cardBuffer = [];
+let prefetching = false;
+let inflightCard = null;
+let flushingScores = false;
+let sessionScore = 0;
+let currentCard = null;
+let cardShownAt = 0;
+let leaderboardSource = null;
+let leaderboardVersion = null;
+let leaderboardEntries = [];
+let leaderboardPoll = null;
+
+// The session (score, used cards) lives in a signed cookie and the last
+// response to set it wins, so requests that change it run one at a time
+let sessionQueue = Promise.resolve();
+function sessionFetch(url, options) {
+    const result = sessionQueue.then(() => fetch(url, options));
+    sessionQueue = result.catch(() => {});
+    return result;
+}
+
+// --- Logic ---
+
+async function init() {
+    watchLeaderboard();
+    const key = await getSetting("gemini_key");
+    const name = await getSetting("username");
+
+    if (name) CURRENT_USER = name;
+    refreshStats();
+
+    // Sync anything answered while offline last time
+    flushScores();
+    setInterval(flushScores, SCORE_FLUSH_MS);
+    window.addEventListener('online', () => { flushScores(); fillBuffer(); });
+
+    if (!key) {
+        document.getElementById('api-modal').style.display = 'flex';
+    } else if (!name) {
+        document.getElementById('name-modal').style.display = 'flex';
+    } else {
+        loadFiles();
+    }
+}
+
+async function saveApiKey() {
+    const input = document.getElementById('api-key-input').value.trim();
+    if (!input) return alert("Enter key.");
+    await setSetting("gemini_key", input);
+    document.getElementById('api-modal').style.display = 'none';
+
+    // Check for name next
+    const name = await getSetting("username");
+    if (!name) document.getElementById('name-modal').style.display = 'flex';
+    else loadFiles();
+}
+
+async function saveUserName() {
+    const input = document.getElementById('username-input').value.trim();
+    if (!input) return alert("Enter name.");
+    await setSetting("username", input);
+    CURRENT_USER = input;
+    document.getElementById('name-modal').style.display = 'none';
+    loadFiles();
+}
+
+function leaderboardQuery() {
+    return CURRENT_DECK ? `?file=${encodeURIComponent(CURRENT_DECK)}` : '';
+}
+
+// Follows the current deck's board over server-sent events; polls if that isn't possible
+function watchLeaderboard() {
+    if (leaderboardSource) leaderboardSource.close();
+    clearInterval(leaderboardPoll);
+    leaderboardSource = null;
+    leaderboardVersion = null;
+
+    if (!window.EventSource) return pollLeaderboard();
+    const source = new EventSource(API_BASE + '/api/leaderboard/stream' + leaderboardQuery());
+    leaderboardSource = source;
+
+    source.addEventListener('snapshot', e => {
+        const msg = JSON.parse(e.data);
+        leaderboardVersion = msg.version;
+        renderLeaderboard(msg.entries);
+    });
+    source.addEventListener('diff', e => {
+        const msg = JSON.parse(e.data);
+        if (leaderboardVersion === null || msg.version <= leaderboardVersion) return;
+        // A missed diff means our copy is stale; reconnecting starts with a snapshot
+        if (msg.base !== leaderboardVersion) return watchLeaderboard();
+        const entries = leaderboardEntries.slice(0, msg.length);
+        msg.changes.forEach(([rank, entry]) => { entries[rank] = entry; });
+        leaderboardVersion = msg.version;
+        renderLeaderboard(entries);
+    });
+    source.onerror = () => {
+        // EventSource retries by itself unless the server refused the stream
+        if (source.readyState === EventSource.CLOSED && leaderboardSource === source) {
+            leaderboardSource = null;
+            pollLeaderboard();
+        }
+    };
+}
+
+function pollLeaderboard() {
+    refreshLeaderboard();
+    leaderboardPoll = setInterval(refreshLeaderboard, LEADERBOARD_POLL_MS);
+}
+
+async function refreshLeaderboard() {
+    try {
+        const res = await fetch(API_BASE + '/api/leaderboard' + leaderboardQuery());
+        renderLeaderboard(await res.json());
+    } catch (e) { console.error("LB Error", e); }
+}
+
+function renderLeaderboard(data) {
+    leaderboardEntries = data;
+    const list = document.getElementById('leaderboard-list');
+    list.innerHTML = "";
+    data.forEach((entry, index) => {
+        const div = document.createElement('div');
+        div.className = 'lb-item';
+        // Note: entry.name is escaped server-side, safe to inject
+        div.innerHTML = `
+            <span class="lb-rank">#${index+1}</span>
+            <span class="lb-name">${entry.name}</span>
+            <span class="lb-score">${entry.score}</span>
+        `;
+        list.appendChild(div);
+    });
+}
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text == null ? '' : String(text);
+    return div.innerHTML;
+}
+
+function statsRow(label, s) {
+    const acc = s.accuracy === null ? '-' : `${Math.round(s.accuracy * 100)}%`;
+    const lat = s.avg_latency_ms === null ? '' : ` · ${(s.avg_latency_ms / 1000).toFixed(1)}s`;
+    return `<div class="stats-row"><span>${label}</span><span>${acc} of ${s.answered}${lat}</span></div>`;
+}
+
+async function refreshStats() {
+    if (!CURRENT_USER) return;
+    try {
+        const params = new URLSearchParams({ name: CURRENT_USER });
+        if (CURRENT_DECK) params.set('file', CURRENT_DECK);
+        const res = await fetch(API_BASE + `/api/stats?${params}`);
+        const stats = await res.json();
+        const panel = document.getElementById('stats-panel');
+        if (!stats.total) {
+            panel.innerHTML = '<div style="text-align:center; color:#555;">No answers yet.</div>';
+            return;
+        }
+
+        let html = statsRow('Overall', stats.total);
+        for (const [mode, s] of Object.entries(stats.modes)) html += statsRow(mode, s);
+        if (stats.weak_locations && stats.weak_locations.length) {
+            html += '<div class="stats-sub">Weakest sections</div>';
+            stats.weak_locations.forEach(s => html += statsRow(escapeHtml(s.location), s));
+        }
+        if (stats.weak_cards && stats.weak_cards.length) {
+            html += '<div class="stats-sub">Weakest cards</div>';
+            stats.weak_cards.forEach(s => {
+                html += `<div class="stats-weak">${escapeHtml(s.question)} <span style="color:var(--neon-orange)">${Math.round(s.accuracy * 100)}%</span></div>`;
+            });
+        }
+        panel.innerHTML = html;
+    } catch (e) { console.error("Stats Error", e); }
+}
+
+function newEventId() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
+async function recordAnswer(correct, score) {
+    // Score locally right away; the server catches up on the next flush
+    sessionScore += score;
+    document.getElementById('live-score-display').innerText = `Score: ${sessionScore}`;
+    await queueScore({
+        event_id: newEventId(),
+        base: API_BASE,
+        card_id: currentCard ? currentCard.card_id : null,
+        card_key: currentCard ? currentCard.card_key : null,
+        mode: currentCard ? currentCard.type : null,
+        correct: correct,
+        latency_ms: Math.round(performance.now() - cardShownAt),
+        points: score
+    });
+}
+
+async function flushScores() {
+    if (flushingScores || !navigator.onLine) return;
+    flushingScores = true;
+    try {
+        // Answers given under another tenant's URL are sent from there
+        const pending = (await getQueuedScores())
+            .filter(entry => (entry.base || '') === API_BASE)
+            .slice(0, EVENT_BATCH_SIZE);
+        if (pending.length === 0) return;
+
+        // One request per batch; the server ignores event IDs it has already applied
+        const res = await sessionFetch(API_BASE + '/api/events', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({
+                name: CURRENT_USER,
+                events: pending.map(entry => ({
+                    id: entry.event_id,
+                    card_id: entry.card_id,
+                    card_key: entry.card_key,
+                    mode: entry.mode,
+                    correct: entry.correct,
+                    latency_ms: entry.latency_ms,
+                    points: entry.points
+                }))
+            })
+        });
+        if (!res.ok) return;
+        await removeQueuedScores(pending.map(entry => entry.id));
+        if (!leaderboardSource) refreshLeaderboard();
+        refreshStats();
+    } catch (e) {
+        console.error("Score sync failed, will retry", e);
+    } finally {
+        flushingScores = false;
+    }
+}
+
+async function loadFiles() {
+    try {
+        const res = await fetch(API_BASE + '/api/files');
+        const data = await res.json();
+        const container = document.getElementById('file-list');
+        const selector = document.getElementById('file-selector');
+
+        selector.style.display = 'block';
+        container.innerHTML = ''; 
+
+        if (data.files.length === 0) {
+            container.innerHTML = "<p>No .json files found.</p>"; return;
+        }
+
+        data.files.forEach(file => {
+            const btn = document.createElement('button');
+            btn.className = 'btn';
+            btn.style.display = "block";
+            btn.style.margin = "10px auto";
+            btn.innerText = file;
+            btn.onclick = () => selectFile(file);
+            container.appendChild(btn);
+        });
+    } catch(e) { console.error(e); }
+}
+
+async function selectFile(filename) {
+    document.getElementById('file-selector').style.display = 'none';
+    showLoader(true, "Loading Session...");
+
+    // Points from the previous session belong to it, not to this one
+    await flushScores();
+
+    const query = document.getElementById('deck-query').value.trim();
+    try {
+        const res = await sessionFetch(API_BASE + '/api/start', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: filename, query: query })
+        });
+        if (res.status === 404 && query) {
+            alert(`No cards match "${query}".`);
+            showLoader(false);
+            document.getElementById('quiz-container').style.display = 'none';
+            document.getElementById('file-selector').style.display = 'block';
+            return;
+        }
+    } catch (e) {
+        console.error("Could not start session, studying from cache", e);
+    }
+
+    CURRENT_DECK = filename;
+    refreshStats();
+    watchLeaderboard();
+    cardBuffer = [];
+    sessionScore = 0;
+    document.getElementById('live-score-display').innerText = "Score: 0";
+    trimCachedCards(filename, CARD_CACHE_LIMIT);
+    fetchNextCard();
+}
+
+function showLoader(show, text="Thinking...") {
+    const loader = document.getElementById('loader');
+    const container = document.getElementById('quiz-container');
+    document.getElementById('loader-text').innerText = text;
+
+    if (show) {
+        loader.style.display = 'flex';
+        container.style.display = 'none';
+    } else {
+        loader.style.display = 'none';
+        container.style.display = 'block';
+    }
+}
+
+async function fetchNextCard() {
+    const cardElement = document.getElementById('quiz-card');
+    if(cardElement.style.opacity === '1') {
+        cardElement.classList.add('fade-out');
+        await new Promise(r => setTimeout(r, 400));
+    }
+
+    let data = cardBuffer.shift();
+    if (!data) {
+        showLoader(true, "Generating Next Card...");
+        // A prefetch already in flight will land in the buffer first
+        if (inflightCard) await inflightCard;
+        data = cardBuffer.shift() || await requestCard(CURRENT_DECK) || await pickCachedCard(CURRENT_DECK);
+    }
+
+    if (!data) {
+        alert("Generation failed.");
+        showLoader(false);
+        return;
+    }
+    renderCard(data);
+    fillBuffer();
+}
+
+async function requestCard(deck) {
+    if (!navigator.onLine) return null;
+
+    try {
+        const key = await getSetting("gemini_key");
+        const res = await sessionFetch(API_BASE + '/api/generate', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'X-Gemini-API-Key': key },
+            // The server picks the mode from this user's history with the card
+            body: JSON.stringify({ name: CURRENT_USER })
+        });
+
+        if(res.status === 401) { alert("Invalid API Key"); return null; }
+        if(!res.ok) throw new Error("API Error");
+
+        const data = await res.json();
+        await cacheCard(deck, data);
+        return data;
+    } catch (e) {
+        console.error(e);
+        return null;
+    }
+}
+
+async function fillBuffer() {
+    // One request at a time, so the session's used-card list stays consistent
+    if (prefetching || !CURRENT_DECK) return;
+    prefetching = true;
+    const deck = CURRENT_DECK;
+    try {
+        while (cardBuffer.length < PREFETCH_SIZE && navigator.onLine && deck === CURRENT_DECK) {
+            inflightCard = requestCard(deck);
+            const data = await inflightCard;
+            if (!data || deck !== CURRENT_DECK) break;
+            cardBuffer.push(data);
+        }
+    } finally {
+        inflightCard = null;
+        prefetching = false;
+    }
+}
+
+async function pickCachedCard(deck) {
+    // Offline: replay something generated earlier for this deck
+    const rows = await getCachedCards(deck);
+    if (rows.length === 0) return null;
+    return rows[Math.floor(Math.random() * rows.length)].card;
+}
+
+function renderCard(data) {
+    showLoader(false);
+    const card = document.getElementById('quiz-card');
+    const area = document.getElementById('interaction-area');
+    const feedback = document.getElementById('feedback');
+    const nextBtn = document.getElementById('next-btn-container');
+
+    card.classList.remove('fade-out');
+    card.classList.add('fade-in');
+
+    feedback.className = 'feedback-area';
+    feedback.innerHTML = '';
+    nextBtn.style.display = 'none';
+
+    document.getElementById('card-source').innerText = `SOURCE: ${data.source}`;
+    document.getElementById('card-question').innerText = data.question;
+    document.getElementById('live-score-display').innerText = `Score: ${sessionScore}`;
+
+    area.innerHTML = ''; 
+    currentCard = data;
+    cardShownAt = performance.now();
+
+    if (data.type === 'MC') {
+        const grid = document.createElement('div');
+        grid.className = 'options-grid';
+        data.options.forEach(opt => {
+            const btn = document.createElement('button');
+            btn.className = 'option-btn';
+            btn.innerText = opt;
+            btn.onclick = (e) => handleMCAnswer(e, opt, data.correct_answer);
+            grid.appendChild(btn);
+        });
+        area.appendChild(grid);
+    } 
+    else if (data.type === 'FITB') {
+        area.innerHTML = `
+            <div style="margin-bottom:20px; color:#ccc; font-size:1.2rem;">${data.masked_text}</div>
+            <input type="text" class="fitb-input" id="fitb-ans" placeholder="Word?" autocomplete="off">
+            <button class="btn submit-btn" id="fitb-submit">Check</button>
+        `;
+        document.getElementById('fitb-submit').onclick = () => {
+            handleFITBAnswer(document.getElementById('fitb-ans').value, data.missing_word, data.full_answer);
+        };
+    }
+    setTimeout(() => card.classList.remove('fade-in'), 400);
+}
+
+function handleMCAnswer(e, selected, correct) {
+    document.querySelectorAll('.option-btn').forEach(b => b.disabled = true);
+    const isCorrect = selected === correct;
+    if (isCorrect) {
+        e.target.classList.add('correct');
+        showFeedback(true, "Correct! +10 Points");
+        recordAnswer(true, 10);
+    } else {
+        recordAnswer(false, 0);
+        e.target.classList.add('incorrect');
+        document.querySelectorAll('.option-btn').forEach(b => { if(b.innerText === correct) b.classList.add('correct'); });
+        showFeedback(false, `Wrong. Answer: <b>${correct}</b>`);
+    }
+    document.getElementById('next-btn-container').style.display = 'block';
+}
+
+function handleFITBAnswer(input, correct, full) {
+    const isCorrect = input.trim().toLowerCase() === correct.trim().toLowerCase();
+    document.getElementById('fitb-submit').disabled = true;
+    if (isCorrect) {
+        showFeedback(true, "Correct! +20 Points");
+        recordAnswer(true, 20);
+    } else {
+        recordAnswer(false, 0);
+        showFeedback(false, `Wrong. Word: <b>${correct}</b><br><small>${full}</small>`);
+    }
+    document.getElementById('next-btn-container').style.display = 'block';
+}
+
+function showFeedback(success, html) {
+    const fb = document.getElementById('feedback');
+    fb.innerHTML = html;
+    fb.classList.add('show');
+    fb.classList.add(success ? 'feedback-success' : 'feedback-fail');
+}
+
+window.onload = init;
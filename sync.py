@@ -0,0 +1,315 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import threading
+
+from deckstore import DeckConflictError, deck_stamp, edit_cards, load_deck
+from quiz_policy import card_key
+
+# ================= CONFIGURATION =================
+
+# Cards are identified by quiz_policy.card_key, the hash of question and
+# answer that the quiz cache already uses, so cached items stay valid on
+# every copy of a synced deck. A second, short hash of the whole card
+# ("rev") catches edits to anything else, such as the textbook location.
+#
+# Each deck keeps <deck>.sync: for every peer it was synced with,
+# the {id: rev} both sides agreed on last time. That is the base of a
+# three-way merge, so a card missing on one side is known to be deleted
+# there rather than new on the other. It also keeps the peer's deck stamp,
+# so a peer that hasn't changed since answers without sending its manifest.
+SYNC_STATE_SUFFIX = ".sync"
+
+# Pushing cards to a server needs this shared secret in the X-Sync-Token
+# header. Without SYNC_TOKEN set on the server, decks can only be pulled.
+SYNC_TOKEN = os.getenv("SYNC_TOKEN", "")
+SYNC_HEADER = "X-Sync-Token"
+
+SYNC_BATCH = 500        # Card bodies per request
+SYNC_TIMEOUT = 30       # Seconds per HTTP request
+
+PREFER_LOCAL = "local"
+PREFER_REMOTE = "remote"
+
+def card_id(card):
+    question, answer = (card, "") if isinstance(card, str) else (card.get("question", ""), card.get("textbook_answer", ""))
+    return card_key(question, answer)
+
+def card_rev(card):
+    return hashlib.sha1(json.dumps(card, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:8]
+
+def valid_card(card):
+    """Cards a peer may send: legacy question strings or dicts with string question and answer."""
+    if isinstance(card, str):
+        return bool(card)
+    return (isinstance(card, dict) and isinstance(card.get("question"), str)
+            and isinstance(card.get("textbook_answer"), str))
+
+# ================= MANIFESTS =================
+
+class Manifest:
+    """A deck's cards by ID at one version. Repeated cards after the first are left out."""
+
+    def __init__(self, version, stamp, cards):
+        self.version = version
+        self.stamp = stamp
+        self.cards = cards
+        self.revs = {}      # id -> rev
+        self.index = {}     # id -> position of its first copy
+        for i, card in enumerate(cards):
+            key = card_id(card)
+            if key not in self.revs:
+                self.revs[key] = card_rev(card)
+                self.index[key] = i
+
+    def bodies(self, ids):
+        """{id: card} for the ids this deck has, in deck order."""
+        return {key: self.cards[self.index[key]] for key in sorted(set(ids) & self.index.keys(), key=self.index.get)}
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+def deck_manifest(path):
+    """Manifest of the deck at path, cached until the file changes."""
+    version, stamp = deck_stamp(path)
+    if not os.path.exists(path):
+        return Manifest(version, stamp, [])
+    key = os.path.abspath(path)
+    with _manifests_lock:
+        cached = _manifests.get(key)
+        if cached is not None and cached.stamp == stamp:
+            return cached
+    manifest = Manifest(version, stamp, list(load_deck(path).get("flashcards", [])))
+    with _manifests_lock:
+        _manifests[key] = manifest
+    return manifest
+
+def apply_changes(path, version, remove_ids, cards):
+    """Removes cards by ID, then writes cards: in place where their ID exists, appended otherwise.
+
+    Raises DeckConflictError if the deck is no longer at version. Returns
+    the new (version, stamp); the stamp is None if another write followed.
+    """
+    remove_ids = set(remove_ids)
+    by_id = {card_id(card): card for card in cards}
+
+    def plan(current):
+        replace, remove = {}, []
+        for i, card in enumerate(current):
+            key = card_id(card)
+            if key in remove_ids:
+                remove.append(i)
+            elif key in by_id:
+                replace[i] = by_id.pop(key)
+        return replace, remove, list(by_id.values())
+
+    version = edit_cards(path, plan, expected_version=version)
+    current, stamp = deck_stamp(path)
+    return version, stamp if current == version else None
+
+# ================= PEERS =================
+
+class LocalPeer:
+    """Another deck file on this machine (a copy on a USB stick, another install)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.key = os.path.abspath(path)
+
+    def manifest(self, since=None):
+        version, stamp = deck_stamp(self.path)
+        if since == stamp:
+            return version, stamp, None
+        manifest = deck_manifest(self.path)
+        return manifest.version, manifest.stamp, manifest.revs
+
+    def fetch(self, ids):
+        return deck_manifest(self.path).bodies(ids)
+
+    def apply(self, version, remove_ids, cards):
+        return apply_changes(self.path, version, remove_ids, cards)
+
+class RemotePeer:
+    """A deck on a FlashcardGPT server, through /api/sync. base_url may include a /t/<tenant> prefix."""
+
+    def __init__(self, base_url, filename, token=SYNC_TOKEN):
+        self.base_url = base_url.rstrip("/")
+        self.filename = filename
+        self.token = token
+        self.key = f"{self.base_url}/{filename}"
+
+    def _request(self, method, route, **kwargs):
+        import requests
+
+        headers = {SYNC_HEADER: self.token} if self.token else {}
+        response = requests.request(method, f"{self.base_url}/api/sync/{route}", headers=headers,
+                                    timeout=SYNC_TIMEOUT, **kwargs)
+        body = response.json() if response.headers.get("Content-Type", "").startswith("application/json") else {}
+        if response.status_code == 409:
+            raise DeckConflictError(self.key, body.get("expected"), body.get("version"))
+        if response.status_code != 200:
+            raise RuntimeError(f"{route}: {response.status_code} {body.get('error', response.text[:200])}")
+        return body
+
+    def manifest(self, since=None):
+        params = {"file": self.filename, "since": since} if since else {"file": self.filename}
+        body = self._request("GET", "manifest", params=params)
+        return body["version"], body["stamp"], None if body.get("unchanged") else dict(body["cards"])
+
+    def fetch(self, ids):
+        bodies = {}
+        ids = list(ids)
+        for start in range(0, len(ids), SYNC_BATCH):
+            body = self._request("POST", "cards", json={"file": self.filename, "ids": ids[start:start + SYNC_BATCH]})
+            bodies.update(body["cards"])
+        return bodies
+
+    def apply(self, version, remove_ids, cards):
+        # Sent in batches; each one moves the server's version on by one
+        remove_ids = list(remove_ids)
+        batches = [cards[i:i + SYNC_BATCH] for i in range(0, len(cards), SYNC_BATCH)] or [[]]
+        for n, batch in enumerate(batches):
+            body = self._request("POST", "apply", json={"file": self.filename, "version": version,
+                                                        "remove": remove_ids if n == 0 else [], "cards": batch})
+            version = body["version"]
+        return version, body["stamp"]
+
+# ================= MERGE =================
+
+def plan_merge(base, local, remote, prefer=None):
+    """Three-way merge of {id: rev} maps.
+
+    Returns (pull, push, conflicts, merged): pull and push are
+    {"fetch": ids to copy over, "remove": ids to delete} for the local
+    and remote side, conflicts lists ids changed differently on both
+    sides, and merged is the new base. prefer ("local" or "remote")
+    settles conflicts; unsettled ones are left alone on both sides and
+    keep their old base, so they come up again on the next sync.
+    """
+    pull = {"fetch": set(), "remove": set()}
+    push = {"fetch": set(), "remove": set()}
+    conflicts = []
+    merged = {}
+    for key in set(base) | set(local) | set(remote):
+        b, l, r = base.get(key), local.get(key), remote.get(key)
+        if l == r:
+            winner = l
+        elif l == b or prefer == PREFER_REMOTE and r != b:
+            winner = r
+            if r is None:
+                pull["remove"].add(key)
+            else:
+                pull["fetch"].add(key)
+        elif r == b or prefer == PREFER_LOCAL:
+            winner = l
+            if l is None:
+                push["remove"].add(key)
+            else:
+                push["fetch"].add(key)
+        else:
+            conflicts.append(key)
+            winner = b
+        if winner is not None:
+            merged[key] = winner
+    return pull, push, conflicts, merged
+
+def _question(card):
+    return card if isinstance(card, str) else card.get("question", "")
+
+def _load_state(path):
+    try:
+        with open(path + SYNC_STATE_SUFFIX, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_state(path, state):
+    tmp_path = f"{path}{SYNC_STATE_SUFFIX}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path + SYNC_STATE_SUFFIX)
+
+def sync_deck(path, peer, prefer=None, dry_run=False):
+    """Brings the deck at path and the peer's copy to the same cards, sending only what changed.
+
+    Raises DeckConflictError if either deck was written to mid-sync; nothing
+    is lost and running the sync again picks up from there. Returns a report.
+    """
+    state = _load_state(path)
+    saved = state.get(peer.key, {})
+    base = saved.get("cards", {})
+    local = deck_manifest(path)
+    remote_version, remote_stamp, remote = peer.manifest(saved.get("stamp"))
+    if remote is None:
+        remote = base  # Unchanged since the last sync left both sides equal to the base
+
+    pull, push, conflicts, merged = plan_merge(base, local.revs, remote, prefer)
+    # In the peer's deck order, so new cards land here in the order they were written there
+    pulled = peer.fetch([key for key in remote if key in pull["fetch"]]) if pull["fetch"] else {}
+    pulled = {key: card for key, card in pulled.items() if valid_card(card) and card_id(card) == key}
+    pushed = local.bodies(push["fetch"])
+
+    # A card edited on both sides gets a new ID on each: one question, two answers
+    new_here = {_question(card): key for key, card in pushed.items() if key not in base}
+    for key, card in list(pulled.items()):
+        other = new_here.get(_question(card))
+        if key in base or other is None:
+            continue
+        if prefer is None:
+            conflicts += [other, key]
+            del pushed[other], pulled[key], merged[other], merged[key]
+        elif prefer == PREFER_LOCAL:
+            del pulled[key], merged[key]
+            push["remove"].add(key)
+        else:
+            del pushed[other], merged[other]
+            pull["remove"].add(other)
+
+    report = {"pulled": len(pulled), "pushed": len(pushed), "removed_here": len(pull["remove"]),
+              "removed_there": len(push["remove"]), "conflicts": conflicts}
+    if dry_run:
+        return report
+
+    if pushed or push["remove"]:
+        remote_version, remote_stamp = peer.apply(remote_version, push["remove"], list(pushed.values()))
+    if pulled or pull["remove"]:
+        apply_changes(path, local.version, pull["remove"], list(pulled.values()))
+
+    # With conflicts left the peer differs from the base, so its manifest is needed next time
+    state[peer.key] = {"cards": merged, "stamp": None if conflicts else remote_stamp}
+    _save_state(path, state)
+    return report
+
+# ================= CLI =================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Syncs a deck with another copy, sending only changed cards.")
+    parser.add_argument("deck", help="Local deck file")
+    parser.add_argument("peer", help="Other deck file, or a server URL such as http://host:5000 or http://host:5000/t/bio")
+    parser.add_argument("--file", help="Deck name on the server (default: the local file name)")
+    parser.add_argument("--prefer", choices=(PREFER_LOCAL, PREFER_REMOTE), help="Settle conflicts in favour of one side")
+    parser.add_argument("--dry-run", action="store_true", help="Only show what would change")
+    args = parser.parse_args()
+
+    if args.peer.startswith(("http://", "https://")):
+        peer = RemotePeer(args.peer, args.file or os.path.basename(args.deck))
+    else:
+        peer = LocalPeer(args.peer)
+
+    try:
+        report = sync_deck(args.deck, peer, args.prefer, args.dry_run)
+    except DeckConflictError:
+        print("A deck changed while syncing; nothing was lost. Run the sync again.")
+        sys.exit(1)
+    except (RuntimeError, OSError) as e:
+        print(f"Sync failed: {e}")
+        sys.exit(1)
+
+    action = "Would pull" if args.dry_run else "Pulled"
+    print(f"{action} {report['pulled']} cards ({report['removed_here']} removed here), "
+          f"pushed {report['pushed']} ({report['removed_there']} removed there).")
+    if report["conflicts"]:
+        print(f"{len(report['conflicts'])} cards changed on both sides were left as they are. "
+              f"Re-run with --prefer {PREFER_LOCAL} or --prefer {PREFER_REMOTE} to settle them.")
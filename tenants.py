@@ -0,0 +1,305 @@
+import os
+import re
+import sys
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+from deckstore import SharedDeck, file_lock, is_deck_file, list_deck_files
+from reviews import ReviewStore, REVIEW_LOG_FILE, REVIEW_STATS_FILE
+from quiz_policy import QuizPolicy, QUIZ_CACHE_FILE, POLICY_STATE_FILE
+from live import LiveBoard
+import profiler
+
+# ================= CONFIGURATION =================
+
+# Each tenant (a class, a course...) lives in TENANTS_DIR/<name>. Requests
+# pick one with a /t/<name>/ URL prefix or the X-Tenant header; requests
+# with neither use the default tenant, which is the working directory.
+TENANTS_DIR = os.getenv("TENANTS_DIR", "tenants")
+TENANT_HEADER = "X-Tenant"
+TENANT_URL_PREFIX = "/t/"
+TENANT_NAME_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,31}$")
+
+TENANT_CONFIG_FILE = "tenant.json"
+LLM_USAGE_FILE = "llm_usage.json"
+LEADERBOARD_FILE = "leaderboard.json"
+LEADERBOARD_SIZE = 10  # Entries shown per board (overall and per deck)
+
+# Defaults for settings a tenant.json doesn't give.
+# 0 daily calls means no limit.
+DEFAULT_LLM_DAILY_CALLS = int(os.getenv("TENANT_LLM_DAILY_CALLS", "0"))
+DEFAULT_MAX_CONCURRENT_LLM = int(os.getenv("TENANT_MAX_CONCURRENT_LLM", "2"))
+
+# How long a request waits for one of its tenant's LLM slots before the
+# quiz policy falls back to a cached or locally built item
+LLM_SLOT_WAIT_SECONDS = float(os.getenv("TENANT_LLM_WAIT_SECONDS", "5"))
+
+def leaderboard_top(entries, deck=""):
+    """Best LEADERBOARD_SIZE entries overall, or for one deck."""
+    if deck:
+        entries = [e for e in entries if e.get("deck") == deck]
+    return sorted(entries, key=lambda x: x['score'], reverse=True)[:LEADERBOARD_SIZE]
+
+# ================= TENANT =================
+
+class Tenant:
+    """One namespace: its deck directory, review log, quiz cache, leaderboard and LLM allowance.
+
+    The LLM allowance is a daily call quota plus a cap on calls in flight,
+    so one tenant's bulk generation queues behind its own slots instead of
+    everyone else's.
+    """
+
+    def __init__(self, name, root):
+        self.name = name
+        self.root = root
+        self.lock = threading.Lock()
+        self.config = self._load_config()
+
+        self.review_store = ReviewStore(self._own(REVIEW_LOG_FILE), self._own(REVIEW_STATS_FILE))
+        self.quiz_policy = QuizPolicy(self._own(QUIZ_CACHE_FILE), self._own(POLICY_STATE_FILE))
+        # Requests save the policy at most every few seconds; catch the rest on the way out
+        atexit.register(self.quiz_policy.save, force=True)
+        self.live_board = LiveBoard(self.leaderboard_entries, leaderboard_top, self.path(LEADERBOARD_FILE))
+
+        # Decks kept in memory across requests, caught up with the file on each use
+        self.decks = {}
+
+        self.llm_slots = threading.BoundedSemaphore(self.config["max_concurrent_llm"])
+        self.llm_usage = self._load_usage()
+
+    def path(self, filename):
+        return os.path.join(self.root, filename)
+
+    def _own(self, filename):
+        # Store paths may come from the environment; named tenants keep their copy at home
+        return filename if not self.name else self.path(os.path.basename(filename))
+
+    def _load_config(self):
+        config = {"llm_daily_calls": DEFAULT_LLM_DAILY_CALLS, "max_concurrent_llm": DEFAULT_MAX_CONCURRENT_LLM}
+        path = self.path(TENANT_CONFIG_FILE)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    config.update(json.load(f))
+            except (OSError, ValueError):
+                print(f"Warning: could not read {path}, using default limits.")
+        config["max_concurrent_llm"] = max(1, int(config["max_concurrent_llm"]))
+        return config
+
+    # ---------------- Decks ----------------
+
+    def deck_files(self):
+        return list_deck_files(self.root or '.')
+
+    def has_deck(self, filename):
+        """Basic path traversal check for deck names sent by the client."""
+        return (bool(filename) and os.sep not in filename and '/' not in filename
+                and is_deck_file(filename) and os.path.exists(self.path(filename)))
+
+    def deck(self, filename):
+        """The in-memory deck for filename, with cards other processes added since the last call."""
+        with self.lock:
+            deck = self.decks.get(filename)
+            if deck is None:
+                deck = self.decks[filename] = SharedDeck(self.path(filename))
+                return deck
+        deck.refresh()
+        return deck
+
+    # ---------------- Leaderboard ----------------
+
+    def leaderboard_entries(self):
+        """Reads leaderboard safely."""
+        path = self.path(LEADERBOARD_FILE)
+        if not os.path.exists(path):
+            return []
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except:
+            return []
+
+    def record_score(self, user_name, score, deck=None):
+        """Updates leaderboard safely using a lock shared with other processes."""
+        path = self.path(LEADERBOARD_FILE)
+        with file_lock(path):
+            data = self.leaderboard_entries()
+
+            # [SECURITY] Logic moved to route handler, but we process data here
+            # Add new entry
+            entry = {"name": user_name, "score": score, "date": time.strftime("%Y-%m-%d")}
+            if deck:
+                entry["deck"] = deck
+            data.append(entry)
+
+            # Sort by score descending and keep whatever is in the top 10 overall or for its deck
+            per_deck = {}
+            kept = []
+            for rank, entry in enumerate(sorted(data, key=lambda x: x['score'], reverse=True)):
+                deck_rank = per_deck[entry.get("deck")] = per_deck.get(entry.get("deck"), 0) + 1
+                if rank < LEADERBOARD_SIZE or (entry.get("deck") and deck_rank <= LEADERBOARD_SIZE):
+                    kept.append(entry)
+
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(kept, f)
+            os.replace(tmp_path, path)
+
+            # Open leaderboard streams get a diff if their board changed. Still
+            # under the lock, so a slower writer can't publish an older board after ours
+            self.live_board.publish(kept)
+        return leaderboard_top(kept)
+
+    # ---------------- LLM allowance ----------------
+
+    def _load_usage(self):
+        path = self.path(LLM_USAGE_FILE)
+        usage = {"date": time.strftime("%Y-%m-%d"), "calls": 0, "throttled": 0}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    saved = json.load(f)
+                if saved.get("date") == usage["date"]:
+                    usage.update(saved)
+            except (OSError, ValueError):
+                pass
+        return usage
+
+    def _save_usage(self):
+        path = self.path(LLM_USAGE_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.llm_usage, f)
+        os.replace(tmp_path, path)
+
+    def _roll_usage(self):
+        today = time.strftime("%Y-%m-%d")
+        if self.llm_usage["date"] != today:
+            self.llm_usage = {"date": today, "calls": 0, "throttled": 0}
+
+    def llm_available(self):
+        """False once today's LLM quota is spent."""
+        limit = self.config["llm_daily_calls"]
+        with self.lock:
+            self._roll_usage()
+            return not limit or self.llm_usage["calls"] < limit
+
+    @contextmanager
+    def llm_call(self):
+        """Holds one of the tenant's LLM slots and counts the call against its quota.
+
+        Yields False instead if no slot frees up within LLM_SLOT_WAIT_SECONDS
+        or the quota ran out meanwhile; the caller should then skip the call.
+        """
+        with profiler.stage("llm_slot"):
+            acquired = self.llm_slots.acquire(timeout=LLM_SLOT_WAIT_SECONDS)
+        if not acquired:
+            with self.lock:
+                self.llm_usage["throttled"] += 1
+            yield False
+            return
+        try:
+            if not self.llm_available():
+                yield False
+                return
+            with self.lock:
+                self.llm_usage["calls"] += 1
+                self._save_usage()
+            yield True
+        finally:
+            self.llm_slots.release()
+
+    def quota_report(self):
+        with self.lock:
+            self._roll_usage()
+            report = dict(self.llm_usage)
+        report.update({"tenant": self.name, "llm_daily_calls": self.config["llm_daily_calls"] or None,
+                       "max_concurrent_llm": self.config["max_concurrent_llm"]})
+        return report
+
+# ================= REGISTRY =================
+
+_tenants = {}
+_tenants_lock = threading.Lock()
+
+def get_tenant(name=""):
+    """The Tenant called name ("" is the default), or None if it doesn't exist.
+
+    Tenants are created with `python tenants.py create`, never by a request.
+    """
+    if name and not TENANT_NAME_RE.match(name):
+        return None
+    with _tenants_lock:
+        tenant = _tenants.get(name)
+        if tenant is None:
+            root = os.path.join(TENANTS_DIR, name) if name else ""
+            if name and not os.path.isdir(root):
+                return None
+            tenant = _tenants[name] = Tenant(name, root)
+        return tenant
+
+def list_tenants():
+    if not os.path.isdir(TENANTS_DIR):
+        return []
+    return sorted(n for n in os.listdir(TENANTS_DIR)
+                  if TENANT_NAME_RE.match(n) and os.path.isdir(os.path.join(TENANTS_DIR, n)))
+
+def create_tenant(name, llm_daily_calls=None, max_concurrent_llm=None):
+    """Makes the tenant's directory and writes its limits to tenant.json."""
+    if not TENANT_NAME_RE.match(name):
+        raise ValueError("Tenant names are 1-32 lowercase letters, digits, '-' or '_'")
+    root = os.path.join(TENANTS_DIR, name)
+    os.makedirs(root, exist_ok=True)
+    config = {"llm_daily_calls": DEFAULT_LLM_DAILY_CALLS if llm_daily_calls is None else llm_daily_calls,
+              "max_concurrent_llm": DEFAULT_MAX_CONCURRENT_LLM if max_concurrent_llm is None else max_concurrent_llm}
+    with open(os.path.join(root, TENANT_CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+    return root
+
+# ================= WSGI =================
+
+class TenantPrefixMiddleware:
+    """Serves /t/<name>/... as /... with the tenant name in the WSGI environ.
+
+    The prefix moves to SCRIPT_NAME, so routes stay the same for every tenant.
+    """
+
+    ENVIRON_KEY = "flashcards.tenant"
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path.startswith(TENANT_URL_PREFIX):
+            name, _, rest = path[len(TENANT_URL_PREFIX):].partition("/")
+            environ[self.ENVIRON_KEY] = name
+            environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + TENANT_URL_PREFIX + name
+            environ["PATH_INFO"] = "/" + rest
+        return self.wsgi_app(environ, start_response)
+
+# ================= CLI =================
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "create":
+        try:
+            limits = [int(n) for n in sys.argv[3:5]]
+            root = create_tenant(sys.argv[2], *limits)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"Created tenant '{sys.argv[2]}' in {root}. Copy its decks there and open /t/{sys.argv[2]}/.")
+    elif len(sys.argv) == 2 and sys.argv[1] == "list":
+        for name in list_tenants():
+            report = get_tenant(name).quota_report()
+            limit = report["llm_daily_calls"] or "unlimited"
+            print(f"{name}: {len(get_tenant(name).deck_files())} decks, {report['calls']}/{limit} LLM calls today, "
+                  f"{report['max_concurrent_llm']} at once, {report['throttled']} throttled")
+    else:
+        print("Usage: python tenants.py create <name> [llm_daily_calls] [max_concurrent_llm]")
+        print("       python tenants.py list")
+        sys.exit(1)